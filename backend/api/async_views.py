@@ -0,0 +1,288 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import URLPattern
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .authentication import CachedJWTAuthentication
+from .conditional import validators_for
+from .models import Course, SocialMediaLink, User, UserCourse
+from .serializers import SocialMediaLinkSerializer, UserCourseSerializer, UserSerializer
+from .utils import profile_cache, session_calendar
+from .utils.friend_candidates import addable_users_queryset, serialize_candidate
+from .views import (
+    HTTP_BAD_REQUEST,
+    FriendshipViewSet,
+    UserViewSet,
+    describe_friendship,
+    latest_friendship,
+    parse_bundle_fields,
+    pending_request_payload,
+    pending_requests_queryset,
+    profile_version,
+    session_payload,
+    session_window,
+    sessions_version,
+)
+
+# URL name -> async GET view, filled in by @async_get
+ASYNC_VIEWS = {}
+
+
+def async_get(url_name, version=None):
+    """
+    Register an async view for GETs of the router URL named `url_name`.
+    `version` is the view's version function for conditional GETs, as in
+    the DRF views' `conditional_versions`.
+    """
+    def register(view):
+        view.version = version
+        ASYNC_VIEWS[url_name] = view
+        return view
+    return register
+
+
+def render(data, status=200):
+    """Encode with the configured JSON renderer, as the DRF views do"""
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    return HttpResponse(renderer.render(data), status=status, content_type='application/json')
+
+
+def run_job(func, *args):
+    """
+    Run an executor job between the connection cleanup Django does around
+    a request, so pool threads that touch the database don't keep stale
+    or over-age connections.
+    """
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def in_executor(func, *args):
+    """Run blocking work, such as resolving S3 storage URLs, in the default executor"""
+    return await asyncio.get_running_loop().run_in_executor(None, run_job, func, *args)
+
+
+async def authenticate(request):
+    """
+    Resolve the JWT bearer token of a request to a user.
+    Raises:
+        NotAuthenticated: If the request carries no bearer token
+        AuthenticationFailed: If the token or its user is not valid
+    """
+    auth = CachedJWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else None
+    if raw_token is None:
+        raise exceptions.NotAuthenticated()
+    token = auth.get_validated_token(raw_token)
+    return await sync_to_async(auth.get_user)(token)
+
+
+def check_access(callback, request, kwargs):
+    """
+    Run the permission and throttle checks of the viewset action the
+    router maps this GET to, as its initial() would.
+    Raises:
+        APIException: NotAuthenticated, PermissionDenied or Throttled
+    """
+    view = callback.cls(**callback.initkwargs)
+    view.action_map = callback.actions
+    view.action = callback.actions.get('get')
+    view.request = request
+    view.args, view.kwargs = (), kwargs
+    view.format_kwarg = None
+    view.check_permissions(request)
+    view.check_throttles(request)
+
+
+def as_async_view(view, fallback):
+    """
+    Serve GETs with the async `view` and every other method, as well as
+    format-suffixed URLs, with the DRF view the router generated.
+    """
+    callback = fallback
+    fallback = sync_to_async(fallback)
+
+    async def dispatch(request, *args, **kwargs):
+        if request.method != 'GET' or kwargs.get('format'):
+            return await fallback(request, *args, **kwargs)
+        kwargs.pop('format', None)
+
+        request = Request(request)
+        try:
+            request.user = await authenticate(request)
+            await sync_to_async(check_access)(callback, request, kwargs)
+            validators = await sync_to_async(validators_for)(request, view.version)
+            if validators is None:
+                return await view(request, **kwargs)
+            response = validators.conditional_response(request._request)
+            if response is None:
+                response = await view(request, **kwargs)
+            if response.status_code in (200, 304):
+                validators.apply(response)
+            return response
+        except exceptions.APIException as exc:
+            data = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+            response = render(data, exc.status_code)
+            if exc.status_code == 401:
+                response['WWW-Authenticate'] = CachedJWTAuthentication().authenticate_header(request)
+            if getattr(exc, 'wait', None):
+                response['Retry-After'] = str(int(exc.wait))
+            return response
+
+    return csrf_exempt(dispatch)
+
+
+def with_async_views(patterns):
+    """Swap in the async view of every router URL pattern that has one"""
+    return [
+        URLPattern(pattern.pattern, as_async_view(ASYNC_VIEWS[pattern.name], pattern.callback),
+                   pattern.default_args, pattern.name)
+        if pattern.name in ASYNC_VIEWS else pattern
+        for pattern in patterns
+    ]
+
+
+def profile_id(pk):
+    if not pk.isdigit():
+        raise exceptions.NotFound('No User matches the given query.')
+    return int(pk)
+
+
+async def ensure_user(user_id):
+    if not await User.objects.filter(pk=user_id).aexists():
+        raise exceptions.NotFound('No User matches the given query.')
+
+
+async def user_payload(user_id):
+    try:
+        user = await User.objects.prefetch_related('social_links').aget(pk=user_id)
+    except User.DoesNotExist:
+        raise exceptions.NotFound('No User matches the given query.')
+    return await in_executor(lambda: dict(UserSerializer(user).data))
+
+
+async def courses_payload(user_id):
+    enrollments = [uc async for uc in UserCourse.objects.filter(user_id=user_id).select_related('course')]
+    if not enrollments:
+        await ensure_user(user_id)
+    return list(UserCourseSerializer(enrollments, many=True).data)
+
+
+async def social_links_payload(user_id):
+    links = [link async for link in SocialMediaLink.objects.filter(user_id=user_id)]
+    if not links:
+        await ensure_user(user_id)
+    return list(SocialMediaLinkSerializer(links, many=True).data)
+
+
+async def cached_profile(kind, user_id, build):
+    return await profile_cache.aget_or_build(kind, user_id, lambda: build(user_id))
+
+
+@async_get('user-detail')
+async def retrieve(request, pk):
+    """Get a user's profile"""
+    return render(await cached_profile(profile_cache.USER, profile_id(pk), user_payload))
+
+
+@async_get('user-courses')
+async def courses(request, pk):
+    """Get courses for a specific user"""
+    return render(await cached_profile(profile_cache.COURSES, profile_id(pk), courses_payload))
+
+
+@async_get('user-social-links')
+async def social_links(request, pk):
+    """Get social media links for a specific user"""
+    return render(await cached_profile(profile_cache.SOCIAL_LINKS, profile_id(pk), social_links_payload))
+
+
+@async_get('user-me', version=profile_version)
+async def me(request):
+    """Get the authenticated user's profile"""
+    return render(await cached_profile(profile_cache.USER, request.user.id, user_payload))
+
+
+@async_get('user-profile-bundle')
+async def profile_bundle(request, pk):
+    """Get a user's profile, courses, social links, friend count and friendship status in one response"""
+    try:
+        fields = parse_bundle_fields(request.query_params.get('fields'))
+    except ValueError as e:
+        return render({'detail': str(e)}, HTTP_BAD_REQUEST)
+
+    user_id = request.user.id if pk == 'me' else profile_id(pk)
+    data = {}
+    if 'user' in fields or 'friendship_count' in fields:
+        user_data = await cached_profile(profile_cache.USER, user_id, user_payload)
+        if 'user' in fields:
+            data['user'] = user_data
+        if 'friendship_count' in fields:
+            data['friendship_count'] = user_data['friendship_count']
+    if 'courses' in fields:
+        data['courses'] = await cached_profile(profile_cache.COURSES, user_id, courses_payload)
+    if 'social_links' in fields:
+        data['social_links'] = await cached_profile(profile_cache.SOCIAL_LINKS, user_id, social_links_payload)
+    if 'friendship_status' in fields:
+        if not data:
+            await ensure_user(user_id)
+        if user_id == request.user.id:
+            data['friendship_status'] = 'self'
+        else:
+            friendship = await latest_friendship(request.user.id, user_id).afirst()
+            data['friendship_status'] = describe_friendship(friendship, request.user.id)
+
+    return render(data)
+
+
+@async_get('user-pending-friend-requests')
+async def pending_friend_requests(request):
+    """Get all pending friend requests for the authenticated user"""
+    view = UserViewSet(action='pending_friend_requests', request=request, format_kwarg=None)
+    paginator = view.paginator
+    # DRF's cursor paginator evaluates the page itself
+    pending = await sync_to_async(paginator.paginate_queryset)(
+        pending_requests_queryset(request.user), request, view
+    )
+    data = await in_executor(pending_request_payload, pending)
+    return render(paginator.get_paginated_response(data).data)
+
+
+@async_get('usercourse-upcoming-sessions', version=sessions_version)
+async def upcoming_sessions(request):
+    """Get upcoming sessions for the authenticated user's courses, soonest first"""
+    try:
+        start, end, limit = session_window(request.query_params)
+    except ValueError as e:
+        return render({'detail': str(e)}, HTTP_BAD_REQUEST)
+
+    ordered = [
+        course async for course in session_calendar.order_by_next_session(
+            Course.objects.filter(usercourse__user=request.user),
+            start
+        )
+    ]
+    sessions = session_calendar.upcoming_sessions(ordered, start, end, limit)
+    return render(session_payload(sessions))
+
+
+@async_get('friendship-addable-users')
+async def addable_users(request):
+    """Get a cursor-paginated list of users that can be added as friends, most shared courses first"""
+    view = FriendshipViewSet(action='addable_users', request=request, format_kwarg=None)
+    paginator = view.paginator
+    candidates = await sync_to_async(paginator.paginate_queryset)(
+        addable_users_queryset(request.user), request, view
+    )
+    data = await in_executor(lambda: [serialize_candidate(user) for user in candidates])
+    return render(paginator.get_paginated_response(data).data)
\ No newline at end of file
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+# The User columns the views and UserBasicSerializer read from request.user;
+# the rest load lazily on access
+CACHED_FIELDS = ('id', 'username', 'first_name', 'last_name', 'is_active', 'bio', 'profile_picture_url')
+# from_db takes values in model field order
+MODEL_ORDER = [field.attname for field in User._meta.concrete_fields if field.attname in CACHED_FIELDS]
+
+
+def _cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def invalidate_user(user_id):
+    """Drop a user's cached columns now and again once the current transaction commits"""
+    cache.delete(_cache_key(user_id))
+    transaction.on_commit(lambda: cache.delete(_cache_key(user_id)))
+
+
+def cached_user(user_id):
+    """
+    Hydrate a user from a short-lived cache of CACHED_FIELDS.
+    Args:
+        user_id: Value of the token's user id claim
+    Returns:
+        User instance with only CACHED_FIELDS loaded, or None if there is no such user
+    """
+    key = _cache_key(user_id)
+    values = cache.get(key)
+    if values is None:
+        values = (
+            User.objects
+            .filter(**{api_settings.USER_ID_FIELD: user_id})
+            .values_list(*MODEL_ORDER)
+            .first()
+        )
+        if values is None:
+            return None
+        cache.set(key, values, settings.AUTH_USER_CACHE_TIMEOUT)
+    # A deferred-field instance: save() writes only the loaded and assigned fields
+    return User.from_db(DEFAULT_DB_ALIAS, MODEL_ORDER, values)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that hydrates request.user from cached columns
+    instead of selecting the whole User row on every request. The cache
+    entry is dropped whenever the user is saved or deleted.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Revocation compares the password hash, which is not cached
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        user = cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -0,0 +1,97 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class Validators:
+    """
+    ETag and Last-Modified of a response, derived from version data.
+    The ETag is weak: it hashes what the payload was built from rather
+    than the payload bytes, keyed by user, URL and response format.
+    """
+
+    def __init__(self, request, parts, last_modified=None, format='json'):
+        key = repr((request.user.pk, request.get_full_path(), format, parts))
+        self.etag = f'W/"{hashlib.md5(key.encode()).hexdigest()}"'
+        self.last_modified = int(last_modified.timestamp()) if last_modified else None
+
+    def conditional_response(self, request):
+        """Return a 304 (or 412) response if the request's preconditions say so, else None"""
+        return get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+
+    def apply(self, response):
+        """Set the validator headers on a response"""
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified)
+        # Per-user data: caches may keep it but must revalidate
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+
+def validators_for(request, version, format='json'):
+    """
+    Run a version function for a GET or HEAD request.
+    Args:
+        request: DRF request, already authenticated
+        version: Callable taking the request and returning (parts, last_modified),
+            or None when the request cannot be answered conditionally
+        format: Format of the rendered response
+    Returns:
+        Validators, or None
+    """
+    if request.method not in SAFE_METHODS or version is None:
+        return None
+    result = version(request)
+    if result is None:
+        return None
+    return Validators(request, *result, format=format)
+
+
+class PreconditionResponse(Exception):
+    """Raised from initial() to short-circuit a view with a 304 or 412"""
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GETs without running the view.
+    Views map actions to version functions in `conditional_versions`.
+    A version function makes one cheap query (updated_at columns, change
+    counters) and returns (parts, last_modified); the ETag is a hash of
+    the parts. When If-None-Match or If-Modified-Since still match, the
+    view and its serializers are skipped and a bodiless 304 is returned.
+    """
+    conditional_versions = {}
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.validators = validators_for(
+            request,
+            self.conditional_versions.get(self.action),
+            request.accepted_renderer.format
+        )
+        if self.validators is None:
+            return
+        response = self.validators.conditional_response(request._request)
+        if response is not None:
+            raise PreconditionResponse(response.status_code)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, PreconditionResponse):
+            return Response(status=exc.status_code)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, 'validators', None)
+        if validators is not None and response.status_code in (200, 304):
+            validators.apply(response)
+        return response
@@ -0,0 +1,147 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+
+from .authentication import CachedJWTAuthentication
+from .utils import events
+
+EVENTS_PATH = '/api/events/'
+
+_last_encoded = (None, b'')
+
+
+def encode_event(event):
+    """Format an event as a server-sent event named after its type"""
+    global _last_encoded
+    # A published event goes to every stream of the user; encode it once
+    if _last_encoded[0] is not event:
+        renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+        data = b'event: %s\ndata: %s\n\n' % (event['type'].encode(), renderer.render(event))
+        _last_encoded = (event, data)
+    return _last_encoded[1]
+
+
+def load_user(auth, token):
+    """get_user with the connection handling Django gives a request"""
+    close_old_connections()
+    try:
+        return auth.get_user(token)
+    finally:
+        close_old_connections()
+
+
+async def authenticate(scope):
+    """
+    Resolve the bearer token of an ASGI request to a user.
+    Raises:
+        NotAuthenticated: If the request carries no bearer token
+        AuthenticationFailed: If the token or its user is not valid
+    """
+    auth = CachedJWTAuthentication()
+    header = dict(scope['headers']).get(b'authorization')
+    raw_token = auth.get_raw_token(header) if header else None
+    if raw_token is None:
+        raise exceptions.NotAuthenticated()
+    token = auth.get_validated_token(raw_token)
+    return await sync_to_async(load_user)(auth, token)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class EventStreamApp:
+    """
+    ASGI app serving GET /api/events/ in front of the Django app.
+    The stream carries the authenticated user's friendship events
+    (requests, accepts, rejections, unfriends) as server-sent events, with
+    a comment line every EVENTS_HEARTBEAT_SECONDS. Streams are handled
+    here rather than by a Django view so an idle one costs little more
+    than its socket. After an `overflow` event the stream ends; reconnect
+    and catch up with GET /api/sync/.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Anything else, including CORS preflights, goes to Django
+        if scope['type'] != 'http' or scope['path'] != EVENTS_PATH or scope['method'] != 'GET':
+            return await self.app(scope, receive, send)
+
+        try:
+            user = await authenticate(scope)
+        except exceptions.APIException as exc:
+            headers = []
+            if exc.status_code == 401:
+                headers.append((b'www-authenticate', b'Bearer realm="api"'))
+            return await self.respond(send, exc.status_code, {'detail': exc.detail}, headers)
+
+        broker = events.get_broker()
+        subscription = broker.subscribe(user.id)
+        if subscription is None:
+            return await self.respond(
+                send, 503, {'detail': 'Too many open event streams, try again later.'}, [(b'retry-after', b'30')]
+            )
+        try:
+            await self.stream(subscription, receive, send)
+        except OSError:
+            # The client went away mid-send
+            pass
+        finally:
+            broker.unsubscribe(subscription)
+
+    def cors_headers(self):
+        return [(b'access-control-allow-origin', b'*')] if settings.CORS_ALLOW_ALL_ORIGINS else []
+
+    async def respond(self, send, status, data, headers):
+        body = api_settings.DEFAULT_RENDERER_CLASSES[0]().render(data)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), *headers, *self.cors_headers()],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def stream(self, subscription, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Stop nginx from buffering the stream
+                (b'x-accel-buffering', b'no'),
+                *self.cors_headers(),
+            ],
+        })
+        # Reconnect after 5 s; also shows the client the stream is open
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            while True:
+                get = asyncio.ensure_future(subscription.queue.get())
+                done, _ = await asyncio.wait(
+                    {get, disconnected}, timeout=settings.EVENTS_HEARTBEAT_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected in done:
+                    get.cancel()
+                    return
+                if get not in done:
+                    get.cancel()
+                    await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                    continue
+                event = get.result()
+                last = event is events.OVERFLOW
+                await send({'type': 'http.response.body', 'body': encode_event(event), 'more_body': not last})
+                if last:
+                    return
+        finally:
+            disconnected.cancel()
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.utils.benchmarks import SCENARIOS, run
+
+
+class Command(BaseCommand):
+    """Run a benchmark scenario against freshly seeded data, then roll the data back"""
+    help = 'Seed synthetic data, run a benchmark scenario and print a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--scale', default='10k', help='Users to seed: 1k, 10k, 100k or a number')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--report', help='Also write the JSON report to this path')
+
+    def handle(self, *args, **options):
+        report = {
+            'scenario': options['scenario'],
+            'scale': options['scale'],
+            'repeat': options['repeat'],
+            'results': run(options['scenario'], options['scale'], options['repeat']),
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
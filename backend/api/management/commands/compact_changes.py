@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.utils.change_feed import compact_changes
+
+
+class Command(BaseCommand):
+    """Compact the sync change feed"""
+    help = 'Drop superseded and expired change records; run periodically, e.g. nightly from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Days of history to keep (default: CHANGE_FEED_RETENTION_DAYS)'
+        )
+
+    def handle(self, *args, **options):
+        dropped = compact_changes(retention_days=options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            'Dropped {superseded} superseded, {orphaned} orphaned and {expired} expired change records.'.format(**dropped)
+        ))
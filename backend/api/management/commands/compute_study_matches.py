@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.utils.study_matching import rebuild_study_matches
+
+
+class Command(BaseCommand):
+    """Recompute every user's study matches"""
+    help = 'Rebuild StudyMatch from UserCourse rows; run periodically, e.g. nightly from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild_study_matches(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} study matches.'))
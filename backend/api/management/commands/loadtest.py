@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import User
+from api.utils.loadtest import DEFAULT_PATHS, run_load
+
+
+class Command(BaseCommand):
+    """Compare the throughput of running servers, e.g. the WSGI and ASGI deployments"""
+    help = 'Load test running API servers with concurrent clients and print a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets', nargs='+', metavar='LABEL=URL',
+            help='Servers to test, e.g. wsgi=http://127.0.0.1:8000 asgi=http://127.0.0.1:8001'
+        )
+        parser.add_argument('--user', required=True, help='Username to authenticate as')
+        parser.add_argument('--concurrency', type=int, default=500)
+        parser.add_argument('--requests', type=int, default=10, help='Requests per client')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request ({user_id} is filled in); repeatable')
+        parser.add_argument('--report', help='Also write the JSON report to this path')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']}")
+        token = str(AccessToken.for_user(user))
+        paths = [path.format(user_id=user.id) for path in options['paths'] or DEFAULT_PATHS]
+
+        results = {}
+        for target in options['targets']:
+            label, _, url = target.rpartition('=')
+            results[label or url] = run_load(url, paths, token, options['concurrency'], options['requests'])
+
+        report = {
+            'concurrency': options['concurrency'],
+            'requests_per_client': options['requests'],
+            'paths': paths,
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
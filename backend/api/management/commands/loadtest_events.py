@@ -0,0 +1,51 @@
+import json
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import User
+from api.utils.loadtest import post, run_streams
+
+
+class Command(BaseCommand):
+    """Load test the friendship event streams of a running ASGI server"""
+    help = (
+        'Open many idle GET /api/events/ streams for one user, then send that user a friend '
+        'request and time its delivery to every stream'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Server root, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--user', required=True, help='Username whose streams are opened')
+        parser.add_argument('--streams', type=int, default=5000)
+        parser.add_argument('--hold', type=float, default=30, help='Seconds the streams stay idle')
+        parser.add_argument('--report', help='Also write the JSON report to this path')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']}")
+        # A throwaway sender, so every run can send a fresh request
+        name = f'loadtest-{uuid.uuid4().hex[:12]}'
+        sender = User.objects.create_user(username=name, email=f'{name}@example.com')
+        sender_token = str(AccessToken.for_user(sender))
+
+        async def trigger(host, port):
+            body = json.dumps({'addressee_id': user.id}).encode()
+            return await post(host, port, '/api/friendships/request_friendship/',
+                              {'Authorization': f'Bearer {sender_token}'}, body)
+
+        try:
+            results = run_streams(
+                options['url'], str(AccessToken.for_user(user)), trigger, options['streams'], options['hold']
+            )
+        finally:
+            sender.delete()
+
+        output = json.dumps({'url': options['url'], 'results': results}, indent=2, sort_keys=True)
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils.friend_graph import rebuild_friend_graph, verify_friend_graph
+
+
+class Command(BaseCommand):
+    """Rebuild or verify the friendship adjacency table and cached friend counts"""
+    help = 'Rebuild FriendAdjacency and User.friend_count from accepted Friendship rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only check the structure against Friendship, without writing'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            written = rebuild_friend_graph(batch_size=options['batch_size'])
+            self.stdout.write(f'Wrote {written} adjacency rows.')
+
+        report = verify_friend_graph()
+        problems = len(report['missing']) + len(report['extra']) + len(report['bad_counts'])
+        if problems:
+            for edge in report['missing'][:20]:
+                self.stderr.write(f'Missing edge {edge[0]} -> {edge[1]}')
+            for edge in report['extra'][:20]:
+                self.stderr.write(f'Extra edge {edge[0]} -> {edge[1]}')
+            for user_id, stored, expected in report['bad_counts'][:20]:
+                self.stderr.write(f'User {user_id}: friend_count {stored}, expected {expected}')
+            raise CommandError(f'Friend graph is inconsistent ({problems} problems).')
+
+        self.stdout.write(self.style.SUCCESS('Friend graph is consistent.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Course
+
+
+class Command(BaseCommand):
+    """Recompute Course.weekly_slot from each course's study schedule"""
+    help = 'Recompute the weekly session slot of every course'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        stale = []
+        for course in Course.objects.only('course_id', 'study_schedules_day', 'study_schedules_time', 'weekly_slot'):
+            slot = course.compute_weekly_slot()
+            if course.weekly_slot != slot:
+                course.weekly_slot = slot
+                stale.append(course)
+
+        Course.objects.bulk_update(stale, ['weekly_slot'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated {len(stale)} courses.'))
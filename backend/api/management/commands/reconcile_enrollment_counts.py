@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils.course_counts import reconcile_enrollment_counts, verify_enrollment_counts
+
+
+class Command(BaseCommand):
+    """Reconcile or verify the enrollment counts stored on courses"""
+    help = 'Recompute Course.enrolled_count from UserCourse rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only check the stored counts against UserCourse, without writing'
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            fixed = reconcile_enrollment_counts()
+            self.stdout.write(f'Fixed {fixed} course counts.')
+
+        stale = verify_enrollment_counts()
+        if stale:
+            for course_id, stored, expected in stale[:20]:
+                self.stderr.write(f'Course {course_id}: enrolled_count {stored}, expected {expected}')
+            raise CommandError(f'Enrollment counts are inconsistent ({len(stale)} courses).')
+
+        self.stdout.write(self.style.SUCCESS('Enrollment counts are consistent.'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.utils.search import search_columns, search_document
+from api.views import CourseViewSet, UserViewSet
+
+
+class Command(BaseCommand):
+    """Create the pg_trgm extension and GIN indexes used by PostgresSearchBackend"""
+    help = 'Create full-text and trigram search indexes for users and courses (Postgres only)'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write('Not a Postgres database, nothing to do.')
+            return
+
+        qn = connection.ops.quote_name
+        statements = ['CREATE EXTENSION IF NOT EXISTS pg_trgm']
+        for view in (UserViewSet, CourseViewSet):
+            model = view.queryset.model
+            table = model._meta.db_table
+            document = search_document(search_columns(model, view.search_fields))
+            statements += [
+                f"CREATE INDEX IF NOT EXISTS {qn(table + '_search_vector_idx')} "
+                f"ON {qn(table)} USING gin (to_tsvector('simple', {document}))",
+                f"CREATE INDEX IF NOT EXISTS {qn(table + '_search_trgm_idx')} "
+                f"ON {qn(table)} USING gin (lower({document}) gin_trgm_ops)",
+            ]
+
+        with connection.cursor() as cursor:
+            for statement in statements:
+                self.stdout.write(statement)
+                cursor.execute(statement)
+        self.stdout.write(self.style.SUCCESS(
+            'Search indexes are in place. Restart running servers to switch them to full-text search.'
+        ))
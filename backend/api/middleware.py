@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .utils import profiling
+
+
+def resolve_action(view_func, request):
+    """
+    Name the DRF action a view function dispatches to.
+    Returns:
+        'ViewSet.action' for viewsets, 'View.method' for other class-based
+        views, or the function name for plain views
+    """
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+class RequestProfilingMiddleware:
+    """
+    Opt-in per-request profiling, enabled with the API_PROFILING setting.
+    Records query count, DB time, serializer time, view time and repeated
+    SQL per request, adds a Server-Timing header, and feeds the aggregate
+    served by ProfilingView.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'API_PROFILING', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        profiling.aggregate.sample_size = getattr(settings, 'API_PROFILING_SAMPLE_SIZE', 1000)
+        profiling.instrument_serializers()
+
+    def __call__(self, request):
+        profile = profiling.RequestProfile()
+        request.profile = profile
+        token = profiling.activate(profile)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            profiling.deactivate(token)
+        finished = time.perf_counter()
+        profile.total_ms = (finished - started) * 1000
+
+        if profile.action is not None:
+            profile.view_ms = (finished - request.profile_view_started) * 1000
+            profiling.aggregate.record(profile)
+        response['Server-Timing'] = profile.server_timing()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.profile.action = resolve_action(view_func, request)
+        request.profile_view_started = time.perf_counter()
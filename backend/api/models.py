@@ -1,14 +1,17 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.utils.dateparse import parse_time
 from django.utils.translation import gettext_lazy as _
 
 def upload_thumbnail(instance, filename):
     """
     Return the S3 path where the user's profile picture will be stored.
-    Format: profile_pictures/username/filename.ext
+    Format: profile_pictures/user_id/profile.ext
     """
     extension = filename.split('.')[-1]
-    return f'profile_pictures/{instance.username}/profile.{extension}'
+    return f'profile_pictures/{instance.id}/profile.{extension}'
 
 
 class User(AbstractUser):
@@ -23,7 +26,10 @@ class User(AbstractUser):
     )
     last_login = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also touched when the user's enrollments or social links change, for conditional GETs
+    updated_at = models.DateTimeField(auto_now=True)
     bio = models.TextField(blank=True, null=True)
+    friend_count = models.PositiveIntegerField(default=0)
 
     groups = models.ManyToManyField(
         Group,
@@ -61,13 +67,39 @@ class Course(models.Model):
     )
 
     course_id = models.AutoField(primary_key=True)
-    course_code = models.CharField(max_length=50)
+    course_code = models.CharField(max_length=50, db_index=True)
     title = models.CharField(max_length=255)
     subject = models.CharField(max_length=100)
     description = models.TextField()
     enrolled_users = models.ManyToManyField(User, through='UserCourse')
     study_schedules_day = models.CharField(max_length=3, choices=days_of_week)
     study_schedules_time = models.TimeField()
+    # Minute of the week (Monday 00:00 = 0) of the study session, kept in sync by save()
+    weekly_slot = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Number of UserCourse rows, maintained by api.utils.course_counts
+    enrolled_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Backs the "most popular" course ordering
+            models.Index(fields=['-enrolled_count', 'course_id'], name='course_popular_idx'),
+        ]
+
+    def compute_weekly_slot(self):
+        """Return the minute of the week the weekly study session starts at"""
+        day = [code for code, _ in self.days_of_week].index(self.study_schedules_day)
+        start = self.study_schedules_time
+        if isinstance(start, str):
+            start = parse_time(start)
+        return day * 24 * 60 + start.hour * 60 + start.minute
+
+    def save(self, *args, **kwargs):
+        self.weekly_slot = self.compute_weekly_slot()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'weekly_slot', 'updated_at'}
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.course_code}: {self.title}"
@@ -81,9 +113,14 @@ class UserCourse(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     enrolled_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ('user', 'course')
+        indexes = [
+            # unique_together already covers lookups by user; this covers by course
+            models.Index(fields=['course', 'user'], name='usercourse_course_user_idx'),
+        ]
         
     def __str__(self):
         return f"{self.user.email} enrolled in {self.course.course_code}"
@@ -108,11 +145,49 @@ class Friendship(models.Model):
     
     class Meta:
         unique_together = ('requester', 'addressee')
+        indexes = [
+            models.Index(fields=['addressee', 'status'], name='friendship_addr_status_idx'),
+            models.Index(fields=['requester', 'status'], name='friendship_req_status_idx'),
+            # Partial indexes for the two statuses the views filter on
+            models.Index(
+                fields=['addressee', 'created_at'],
+                name='friendship_pending_idx',
+                condition=models.Q(status='pending'),
+            ),
+            models.Index(
+                fields=['requester', 'addressee'],
+                name='friendship_accepted_req_idx',
+                condition=models.Q(status='accepted'),
+            ),
+            models.Index(
+                fields=['addressee', 'requester'],
+                name='friendship_accepted_addr_idx',
+                condition=models.Q(status='accepted'),
+            ),
+        ]
         
     def __str__(self):
         return f"{self.requester.email} -> {self.addressee.email}: {self.status}"
 
 
+class FriendAdjacency(models.Model):
+    """
+    Symmetric adjacency list of accepted friendships.
+    Holds one row per direction (user -> friend and friend -> user),
+    maintained alongside User.friend_count by api.utils.friend_graph.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='friend_edges')
+    friend = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    friendship = models.ForeignKey(Friendship, on_delete=models.CASCADE, related_name='edges')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'friend')
+
+    def __str__(self):
+        return f"{self.user_id} <-> {self.friend_id}"
+
+
 class SocialMediaLink(models.Model):
     """
     Social media links associated with a user
@@ -126,9 +201,103 @@ class SocialMediaLink(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='social_links')
     platform = models.CharField(max_length=50, choices=platform_choices)
     name = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ('user', 'platform')
         
     def __str__(self):
-        return f"{self.user.email}'s {self.platform} link"
\ No newline at end of file
+        return f"{self.user.email}'s {self.platform} link"
+
+
+class ProfilePictureJob(models.Model):
+    """
+    A profile picture upload being resized and stored in the background.
+    `variants` maps variant names to their storage paths once the job is done.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('superseded', 'Superseded'),
+    )
+
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='profile_picture_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    variants = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.email}'s profile picture upload: {self.status}"
+
+
+class StudyMatch(models.Model):
+    """
+    Precomputed study partner of a user: someone taking the same courses
+    and studying at the same times. Maintained by api.utils.study_matching.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='study_matches')
+    partner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    score = models.PositiveIntegerField()
+    shared_courses = models.PositiveIntegerField()
+    shared_slots = models.PositiveIntegerField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'partner')
+        indexes = [
+            models.Index(fields=['user', '-score', 'partner'], name='studymatch_user_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} studies with {self.partner_id}: {self.score}"
+
+
+class ChangeRecord(models.Model):
+    """
+    Append-only entry in a user's change feed: an object the user can see
+    was created, updated or deleted. `seq` orders the feed; clients sync
+    with the last `seq` they have seen. Written by api.utils.change_feed.
+    """
+    KIND_CHOICES = (
+        ('user', 'User'),
+        ('friendship', 'Friendship'),
+        ('enrollment', 'Enrollment'),
+        ('social_link', 'Social media link'),
+    )
+
+    seq = models.BigAutoField(primary_key=True)
+    # No database constraint, so tombstones can be written while the user is being deleted
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'seq'], name='changerecord_user_seq_idx'),
+            models.Index(fields=['user', 'kind', 'object_id', 'seq'], name='changerecord_object_idx'),
+            models.Index(fields=['created_at'], name='changerecord_created_idx'),
+        ]
+
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'changed'
+        return f"{self.seq}: {self.kind} {self.object_id} {action} for {self.user_id}"
+
+
+class ChangeCompaction(models.Model):
+    """
+    A compaction of the change feed that dropped records by age.
+    Clients whose last `seq` is below `through_seq` may have missed those
+    changes and get a full sync instead.
+    """
+    through_seq = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Changes through {self.through_seq} compacted at {self.created_at}"
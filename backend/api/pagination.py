@@ -0,0 +1,114 @@
+import json
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+def position_value(value):
+    """JSON for ordering values json can't encode; full precision, unlike DjangoJSONEncoder"""
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Project-wide cursor pagination.
+    Pages are keyset queries on a stable ordering, so their cost does not
+    grow with the table. The ordering is the primary key unless the view
+    sets `cursor_ordering`, or `cursor_orderings` for a specific action;
+    the primary key is appended as a tie-breaker. Ranked search results
+    are paged in relevance order.
+    DRF's cursor filters on the first ordering field only and steps over
+    ties with an offset. Here the cursor position holds every ordering
+    value, so pages over heavily tied keys (shared course counts, ranks)
+    stay keyset queries and offsets are never needed.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = 'pk'
+
+    def get_ordering(self, request, queryset, view):
+        if 'search_rank' in queryset.query.annotations:
+            ordering = ('-search_rank',)
+        else:
+            ordering = getattr(view, 'cursor_orderings', {}).get(getattr(view, 'action', None))
+            ordering = ordering or getattr(view, 'cursor_ordering', self.ordering)
+            ordering = (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        if not {'pk', '-pk'} & set(ordering):
+            ordering += ('pk',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        current_position = self.cursor.position if self.cursor else None
+
+        ordering = reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self.after(ordering, current_position))
+
+        # One extra row tells whether there is a following page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following_position = len(results) > len(self.page)
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering) if has_following_position else None
+        )
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def after(self, ordering, position):
+        """Q for the rows that come after a position in `ordering`"""
+        values = self.decode_position(position, len(ordering))
+        conditions = []
+        for i, field in enumerate(ordering):
+            ties = {earlier.lstrip('-'): value for earlier, value in zip(ordering[:i], values)}
+            lookup = f'{field[1:]}__lt' if field.startswith('-') else f'{field}__gt'
+            conditions.append(Q(**ties, **{lookup: values[i]}))
+        return reduce(or_, conditions)
+
+    def decode_position(self, position, length):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != length:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _get_position_from_instance(self, instance, ordering):
+        names = [field.lstrip('-') for field in ordering]
+        if isinstance(instance, dict):
+            values = [instance[name] for name in names]
+        else:
+            values = [getattr(instance, name) for name in names]
+        return json.dumps(values, default=position_value)
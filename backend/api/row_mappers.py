@@ -0,0 +1,140 @@
+from operator import itemgetter
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .serializers import FriendshipSerializer, UserBasicSerializer, UserCourseSerializer
+from .utils.s3_utils import get_full_s3_url
+
+datetime_field = serializers.DateTimeField()
+
+
+# Serializer fields as (key, values() lookup) or (key, lookup, convert), in
+# serializer field order. A list `convert` nests fields of the related row.
+USER_BASIC_FIELDS = [
+    ('id', 'id'),
+    ('username', 'username'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('profile_picture_url', 'profile_picture_url', get_full_s3_url),
+    ('bio', 'bio'),
+]
+FRIENDSHIP_FIELDS = [
+    ('friendship_id', 'friendship_id'),
+    ('requester', 'requester', USER_BASIC_FIELDS),
+    ('addressee', 'addressee', USER_BASIC_FIELDS),
+    ('status', 'status'),
+    ('created_at', 'created_at', datetime_field.to_representation),
+    ('updated_at', 'updated_at', datetime_field.to_representation),
+]
+USER_COURSE_FIELDS = [
+    ('user_course_id', 'user_course_id'),
+    ('user', 'user'),
+    ('course', 'course', [
+        ('course_id', 'course_id'),
+        ('course_code', 'course_code'),
+        ('title', 'title'),
+        ('subject', 'subject'),
+        ('description', 'description'),
+    ]),
+    ('enrolled_at', 'enrolled_at', datetime_field.to_representation),
+]
+
+
+def converted(convert, get):
+    """Compose a converter with a row getter"""
+    return lambda row: convert(get(row))
+
+
+class RowMapper:
+    """
+    Builds a serializer's output straight from values() rows.
+    The field list is compiled once into nested itemgetters and
+    converters, so a row costs one dict build instead of a pass through
+    every DRF field. Output matches the serializer it stands in for, key
+    order included.
+    """
+
+    def __init__(self, fields):
+        self.lookups = []
+        self.map_row = self._compile(fields, '')
+
+    def _compile(self, fields, prefix):
+        """Return a function building the dict of `fields` from a row"""
+        getters = []
+        for key, lookup, *convert in fields:
+            lookup = prefix + lookup
+            if convert and isinstance(convert[0], list):
+                getters.append((key, self._compile(convert[0], lookup + '__')))
+                continue
+            self.lookups.append(lookup)
+            get = itemgetter(lookup)
+            if convert:
+                get = converted(convert[0], get)
+            getters.append((key, get))
+
+        def map_row(row):
+            return {key: get(row) for key, get in getters}
+        return map_row
+
+    def values(self, queryset, ordering=()):
+        """
+        Narrow a queryset to the rows this mapper reads.
+        Args:
+            queryset: Queryset of the serializer's model
+            ordering: Ordering fields the rows must also carry, e.g. for cursor pagination
+        """
+        extra = [field.lstrip('-') for field in ordering if field.lstrip('-') not in self.lookups]
+        return queryset.values(*self.lookups, *extra)
+
+    def map_rows(self, rows):
+        map_row = self.map_row
+        return [map_row(row) for row in rows]
+
+
+MAPPERS = {
+    UserBasicSerializer: RowMapper(USER_BASIC_FIELDS),
+    FriendshipSerializer: RowMapper(FRIENDSHIP_FIELDS),
+    UserCourseSerializer: RowMapper(USER_COURSE_FIELDS),
+}
+
+
+def mapper_for(serializer_class):
+    """Return the row mapper standing in for a serializer, or None when API_ROW_MAPPERS is off"""
+    if not settings.API_ROW_MAPPERS:
+        return None
+    return MAPPERS.get(serializer_class)
+
+
+def serialize_rows(queryset, serializer_class):
+    """Serialize a queryset like `serializer_class(queryset, many=True).data`"""
+    mapper = mapper_for(serializer_class)
+    if mapper is None:
+        return list(serializer_class(queryset, many=True).data)
+    return mapper.map_rows(mapper.values(queryset))
+
+
+class RowMapperListMixin:
+    """
+    List with the row mapper of the view's serializer, when there is one.
+    """
+
+    def list(self, request, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        if mapper_for(serializer_class) is None:
+            return super().list(request, *args, **kwargs)
+        return self.mapped_list_response(self.filter_queryset(self.get_queryset()), serializer_class)
+
+    def mapped_list_response(self, queryset, serializer_class):
+        """Paginated response for a queryset, serialized by row mapper if possible"""
+        mapper = mapper_for(serializer_class)
+        if mapper is None:
+            page = self.paginate_queryset(queryset)
+            return self.get_paginated_response(serializer_class(page, many=True).data)
+        if self.paginator is None:
+            return Response(mapper.map_rows(mapper.values(queryset)))
+
+        ordering = self.paginator.get_ordering(self.request, queryset, self)
+        page = self.paginate_queryset(mapper.values(queryset, ordering))
+        return self.get_paginated_response(mapper.map_rows(page))
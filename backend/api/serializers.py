@@ -1,10 +1,20 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from django.db.models import Q
 from .models import *
-from django.conf import settings
+from .utils import profile_pictures
+from .utils.course_counts import enrolled_count
 from .utils.s3_utils import get_full_s3_url
 
 
+class S3URLField(serializers.ReadOnlyField):
+    """
+    Read-only public URL of a stored file, resolved by get_full_s3_url.
+    """
+    def to_representation(self, value):
+        return get_full_s3_url(value)
+
+
 class SocialMediaLinkSerializer(serializers.ModelSerializer):
     """
     Serializer for social media links.
@@ -18,7 +28,7 @@ class UserSerializer(serializers.ModelSerializer):
     """
     Serializer for user registration and profile information.
     """
-    profile_picture_url = serializers.SerializerMethodField()
+    profile_picture_url = S3URLField()
     social_links = SocialMediaLinkSerializer(many=True, read_only=True)
     friendship_count = serializers.SerializerMethodField()
 
@@ -38,42 +48,22 @@ class UserSerializer(serializers.ModelSerializer):
         print("Creating user with data:", validated_data)
         return User.objects.create_user(**validated_data)
 
-    def get_profile_picture_url(self, obj):
-        """Get the full URL for the user's profile picture."""
-        return get_full_s3_url(obj.profile_picture_url)
-
     def get_friendship_count(self, obj):
         """Get the number of accepted friendships for the user."""
-        return Friendship.objects.filter(
-            (Q(requester=obj) | Q(addressee=obj)) & Q(status='accepted')
-        ).count()
+        return obj.friend_count
 
 
 class UserBasicSerializer(serializers.ModelSerializer):
     """
     Serializer for basic user information, used in friendship requests.
     """
-    profile_picture_url = serializers.SerializerMethodField()
+    profile_picture_url = S3URLField()
 
     class Meta:
         """Meta class for UserBasicSerializer."""
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'profile_picture_url', 'bio']
 
-    def get_profile_picture_url(self, obj):
-        """Get the full URL for the user's profile picture."""
-        if not obj.profile_picture_url:
-            return None
-            
-        if hasattr(obj.profile_picture_url, 'url'):
-            url = obj.profile_picture_url.url
-        else:
-            url = str(obj.profile_picture_url)
-        
-        if url.startswith('http'):
-            return url
-        return f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{url}"
-
 
 class CourseSerializer(serializers.ModelSerializer):
     """
@@ -99,7 +89,7 @@ class CourseDetailSerializer(serializers.ModelSerializer):
 
     def get_enrolled_user_count(self, obj):
         """Get the number of users enrolled in a course."""
-        return obj.enrolled_users.count()
+        return enrolled_count(obj)
 
 
 class UserCourseSerializer(serializers.ModelSerializer):
@@ -168,24 +158,50 @@ class UserProfilePictureSerializer(serializers.ModelSerializer):
     """
     Serializer for user profile picture upload.
     """
-    profile_picture_url = serializers.SerializerMethodField()
+    profile_picture_url = S3URLField()
 
     class Meta:
         """Meta class for UserProfilePictureSerializer."""
         model = User
         fields = ['profile_picture_url']
 
+
+class ProfilePictureJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the status of a background profile picture upload.
+    """
+    variants = serializers.SerializerMethodField()
+    profile_picture_url = serializers.SerializerMethodField()
+    status_url = serializers.SerializerMethodField()
+
+    class Meta:
+        """Meta class for ProfilePictureJobSerializer."""
+        model = ProfilePictureJob
+        fields = ['job_id', 'status', 'error', 'variants', 'profile_picture_url',
+                  'status_url', 'created_at', 'updated_at']
+
+    def get_variants(self, obj):
+        """Get the full URL of each stored size variant."""
+        return {name: get_full_s3_url(path) for name, path in obj.variants.items()}
+
     def get_profile_picture_url(self, obj):
-        """Get the full URL for the user's profile picture."""
-        if not obj.profile_picture_url:
+        """Get the full URL the profile picture was switched to, once done."""
+        if obj.status != 'done':
             return None
-            
-        if hasattr(obj.profile_picture_url, 'url'):
-            url = obj.profile_picture_url.url
-        else:
-            url = str(obj.profile_picture_url)
-        
-        if url.startswith('http'):
-            return url
-        return f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{url}"
-    
\ No newline at end of file
+        return get_full_s3_url(obj.variants.get(profile_pictures.PROFILE_VARIANT))
+
+    def get_status_url(self, obj):
+        """Get the URL to poll for this upload."""
+        return reverse('profile-picture-jobs-detail', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+
+
+class StudyMatchSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a precomputed study partner.
+    """
+    partner = UserBasicSerializer()
+
+    class Meta:
+        """Meta class for StudyMatchSerializer."""
+        model = StudyMatch
+        fields = ['partner', 'score', 'shared_courses', 'shared_slots', 'computed_at']
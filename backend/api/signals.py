@@ -0,0 +1,162 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .authentication import invalidate_user
+from .models import Course, Friendship, SocialMediaLink, User, UserCourse
+from .utils import change_feed, course_counts, friend_graph, friend_suggestions, profile_cache, search, study_matching
+
+
+_muted = threading.local()
+
+
+@contextmanager
+def enrollment_signals_muted():
+    """
+    Skip the UserCourse receivers for writes made in the block, for bulk
+    views that update the counts, caches and change feed once themselves.
+    """
+    muted = getattr(_muted, 'enrollments', False)
+    _muted.enrollments = True
+    try:
+        yield
+    finally:
+        _muted.enrollments = muted
+
+
+def enrollment_signals_active():
+    return not getattr(_muted, 'enrollments', False)
+
+
+def invalidate_on_commit(user_ids, *kinds):
+    """
+    Invalidate cached profile payloads now and again once the current
+    transaction commits, so a read that re-caches the pre-commit state in
+    between does not survive.
+    """
+    def invalidate():
+        for user_id in user_ids:
+            profile_cache.invalidate(user_id, *kinds)
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def touch_user(user_id):
+    """
+    Bump User.updated_at after a change to the user's enrollments or social
+    links, so their ETags and Last-Modified move even when rows are deleted.
+    """
+    User.objects.filter(pk=user_id).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.pk], profile_cache.USER)
+    invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserCourse)
+def enrollment_changed(sender, instance, **kwargs):
+    if not enrollment_signals_active():
+        return
+    invalidate_on_commit([instance.user_id], profile_cache.COURSES)
+    touch_user(instance.user_id)
+
+
+@receiver(post_save, sender=UserCourse)
+def enrollment_created(sender, instance, created, **kwargs):
+    if not enrollment_signals_active():
+        return
+    if created:
+        course_counts.adjust_enrolled_counts([instance.course_id], 1)
+        friend_suggestions.enrollment_created(instance)
+        study_matching.enrollment_changed(instance.user_id, [instance.course_id])
+
+
+@receiver(post_delete, sender=UserCourse)
+def enrollment_deleted(sender, instance, **kwargs):
+    if not enrollment_signals_active():
+        return
+    course_counts.adjust_enrolled_counts([instance.course_id], -1)
+    friend_suggestions.enrollment_deleted(instance)
+    study_matching.enrollment_changed(instance.user_id, [instance.course_id])
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    friend_graph.user_deleting(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, **kwargs):
+    profile_cache.invalidate_all(profile_cache.COURSES)
+    transaction.on_commit(lambda: profile_cache.invalidate_all(profile_cache.COURSES))
+
+
+@receiver([post_save, post_delete], sender=SocialMediaLink)
+def social_link_changed(sender, instance, **kwargs):
+    # UserSerializer nests the social links, so the user payload goes too
+    invalidate_on_commit([instance.user_id], profile_cache.SOCIAL_LINKS, profile_cache.USER)
+    touch_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Friendship)
+def friendship_changed(sender, instance, **kwargs):
+    # friendship_count lives in the user payload of both sides
+    invalidate_on_commit([instance.requester_id, instance.addressee_id], profile_cache.USER)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Course)
+def reindex_search(sender, instance, **kwargs):
+    search.row_changed(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Course)
+def unindex_search(sender, instance, **kwargs):
+    search.row_deleted(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved_to_feed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not change_feed.USER_FEED_FIELDS.intersection(update_fields):
+        return
+    change_feed.record(change_feed.USER, [instance.pk], change_feed.user_audience(instance.pk))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleted_from_feed(sender, instance, **kwargs):
+    # Before the cascade removes the friendships that say who should hear about it
+    audience = change_feed.user_audience(instance.pk) - {instance.pk}
+    change_feed.record(change_feed.USER, [instance.pk], audience, deleted=True)
+
+
+@receiver([post_save, post_delete], sender=Friendship)
+def friendship_to_feed(sender, instance, **kwargs):
+    change_feed.record(
+        change_feed.FRIENDSHIP,
+        [instance.pk],
+        [instance.requester_id, instance.addressee_id],
+        deleted=kwargs['signal'] is post_delete
+    )
+
+
+@receiver([post_save, post_delete], sender=UserCourse)
+def enrollment_to_feed(sender, instance, **kwargs):
+    if not enrollment_signals_active():
+        return
+    change_feed.record(
+        change_feed.ENROLLMENT, [instance.pk], [instance.user_id], deleted=kwargs['signal'] is post_delete
+    )
+
+
+@receiver([post_save, post_delete], sender=SocialMediaLink)
+def social_link_to_feed(sender, instance, **kwargs):
+    change_feed.record(
+        change_feed.SOCIAL_LINK, [instance.pk], [instance.user_id], deleted=kwargs['signal'] is post_delete
+    )
@@ -1,3 +1,1957 @@
-from django.test import TestCase
+import asyncio
+import base64
+import decimal
+import gc
+import json
+import os
+import time as clock
+import uuid
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, FloatField, Value, When
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from moto import mock_aws
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.permissions import IsAdminUser
+from rest_framework.throttling import UserRateThrottle
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .async_views import in_executor, with_async_views
+from .event_stream import EventStreamApp
+from .renderers import ORJSONRenderer
+from .models import (
+    ChangeCompaction,
+    ChangeRecord,
+    Course,
+    FriendAdjacency,
+    Friendship,
+    ProfilePictureJob,
+    SocialMediaLink,
+    StudyMatch,
+    User,
+    UserCourse,
+)
+from .serializers import UserSerializer
+from .urls import router
+from . import views
+from .views import UserViewSet
+from .utils.change_feed import compact_changes
+from .utils.course_counts import verify_enrollment_counts
+from .utils.factories import seed
+from .utils import events, profile_cache, profile_pictures, search, study_matching
+from .utils.s3_utils import S3UrlResolver, get_full_s3_url, get_s3_client
+from .utils.friend_graph import link_friends, verify_friend_graph
+from .utils.friend_suggestions import snapshot
+from .utils.study_matching import rebuild_study_matches
+from .utils.profiling import aggregate, fingerprint, percentile
+
+
+def make_course(code, day='Mon', hour=9):
+    """Create a course with a weekly study slot"""
+    return Course.objects.create(
+        course_code=code,
+        title=f'{code} title',
+        subject='Computer Science',
+        description='',
+        study_schedules_day=day,
+        study_schedules_time=time(hour, 0),
+    )
+
+
+class AddableUsersTests(TestCase):
+    """Tests for FriendshipViewSet.addable_users"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.courses = [make_course(f'C{i}') for i in range(3)]
+        for course in self.courses:
+            UserCourse.objects.create(user=self.me, course=course)
+
+    def make_user(self, name, shared=0):
+        user = User.objects.create_user(username=name, email=f'{name}@example.com')
+        for course in self.courses[:shared]:
+            UserCourse.objects.create(user=user, course=course)
+        return user
+
+    def test_excludes_related_users_and_ranks_by_shared_courses(self):
+        friend = self.make_user('friend', shared=3)
+        pending = self.make_user('pending', shared=3)
+        rejected = self.make_user('rejected', shared=1)
+        two = self.make_user('two', shared=2)
+        zero = self.make_user('zero')
+        Friendship.objects.create(requester=self.me, addressee=friend, status='accepted')
+        Friendship.objects.create(requester=pending, addressee=self.me, status='pending')
+        Friendship.objects.create(requester=self.me, addressee=rejected, status='rejected')
+
+        response = self.client.get('/api/friendships/addable-users/')
+
+        self.assertEqual(response.status_code, 200)
+        ids = [u['id'] for u in response.data['results']]
+        self.assertEqual(ids, [two.id, rejected.id, zero.id])
+        self.assertEqual(response.data['results'][0]['tags'], ['C0 title', 'C1 title'])
+        self.assertIsNone(response.data['next'])
+
+    def test_cursor_pages_cover_every_candidate_once(self):
+        expected = [self.make_user(f'user{i}', shared=i % 4).id for i in range(12)]
+
+        seen = []
+        url = '/api/friendships/addable-users/?page_size=5'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            # Ties on shared_courses are broken by id, not skipped with an offset
+            self.assertFalse([q for q in queries if 'OFFSET' in q['sql']])
+            seen.extend(u['id'] for u in response.data['results'])
+            previous, url = response.data['previous'], response.data['next']
+
+        self.assertEqual(sorted(seen), sorted(expected))
+        self.assertEqual(len(seen), len(set(seen)))
+
+        # And back again from the last page
+        back = []
+        while previous:
+            response = self.client.get(previous)
+            back = [u['id'] for u in response.data['results']] + back
+            previous = response.data['previous']
+        self.assertEqual(back + seen[-(len(seen) % 5 or 5):], seen)
+
+    def test_page_query_count_is_independent_of_user_count(self):
+        for i in range(3):
+            self.make_user(f'small{i}', shared=1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/friendships/addable-users/')
+
+        for i in range(60):
+            self.make_user(f'large{i}', shared=i % 3)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get('/api/friendships/addable-users/')
+
+        self.assertEqual(len(small), len(large))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/friendships/addable-users/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class FriendGraphTests(TestCase):
+    """Tests for the FriendAdjacency table and cached friend counts"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com')
+        self.client = APIClient()
+
+    def request_and_accept(self):
+        friendship = Friendship.objects.create(requester=self.alice, addressee=self.bob)
+        self.client.force_authenticate(self.bob)
+        response = self.client.post(f'/api/friendships/{friendship.pk}/accept/')
+        self.assertEqual(response.status_code, 200)
+        return friendship
+
+    def test_accept_links_both_directions_and_counts(self):
+        self.request_and_accept()
+
+        self.assertEqual(
+            set(FriendAdjacency.objects.values_list('user_id', 'friend_id')),
+            {(self.alice.id, self.bob.id), (self.bob.id, self.alice.id)}
+        )
+        response = self.client.get(f'/api/users/{self.alice.id}/friendship_count/')
+        self.assertEqual(response.data['friendship_count'], 1)
+
+    def test_unfriend_unlinks_and_decrements(self):
+        self.request_and_accept()
+        self.client.force_authenticate(self.alice)
+        response = self.client.post('/api/friendships/unfriend/', {'friend_id': self.bob.id})
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(FriendAdjacency.objects.exists())
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.friend_count, 0)
+
+    def test_rebuild_command_repairs_drift(self):
+        friendship = self.request_and_accept()
+        FriendAdjacency.objects.filter(friendship=friendship).delete()
+        User.objects.update(friend_count=5)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_friend_graph', '--verify', stdout=StringIO(), stderr=StringIO())
+        call_command('rebuild_friend_graph', stdout=StringIO())
+
+        self.assertEqual(verify_friend_graph(), {'missing': [], 'extra': [], 'bad_counts': []})
+        self.bob.refresh_from_db()
+        self.assertEqual(self.bob.friend_count, 1)
+
+    def test_link_counts_only_inserted_rows(self):
+        friendship = Friendship.objects.create(requester=self.alice, addressee=self.bob, status='accepted')
+        # One direction already written, as by a concurrent accept
+        FriendAdjacency.objects.create(user=self.alice, friend=self.bob, friendship=friendship)
+
+        self.assertTrue(link_friends(friendship))
+        self.assertFalse(link_friends(friendship))
+        self.assertEqual(FriendAdjacency.objects.count(), 2)
+        self.assertEqual(
+            dict(User.objects.values_list('username', 'friend_count')), {'alice': 0, 'bob': 1}
+        )
+
+    def test_deleting_a_user_decrements_their_friends(self):
+        self.request_and_accept()
+        carol = User.objects.create_user(username='carol', email='carol@example.com')
+        link_friends(Friendship.objects.create(requester=carol, addressee=self.bob, status='accepted'))
+
+        self.alice.delete()
+        self.bob.refresh_from_db()
+        self.assertEqual(self.bob.friend_count, 1)
+        self.assertEqual(verify_friend_graph(), {'missing': [], 'extra': [], 'bad_counts': []})
+
+
+@override_settings(STUDY_MATCH_WORKERS=0)
+class FriendSuggestionTests(TestCase):
+    """Tests for FriendshipViewSet.suggestions and the friend graph snapshot"""
+
+    def setUp(self):
+        # Rolled-back tests can leave a snapshot whose signature matches new rows
+        snapshot.signature = None
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.course = make_course('S0')
+        UserCourse.objects.create(user=self.me, course=self.course)
+
+    def make_user(self, name):
+        return User.objects.create_user(username=name, email=f'{name}@example.com')
+
+    def befriend(self, a, b):
+        link_friends(Friendship.objects.create(requester=a, addressee=b, status='accepted'))
+
+    def suggestions(self):
+        response = self.client.get('/api/friendships/suggestions/')
+        self.assertEqual(response.status_code, 200)
+        return [(u['id'], u['mutual_friends'], u['shared_courses']) for u in response.data['results']]
+
+    def test_ranks_by_mutual_friends_then_shared_courses(self):
+        f1, f2, two, one, mate, pending = [self.make_user(n) for n in ('f1', 'f2', 'two', 'one', 'mate', 'pending')]
+        self.befriend(self.me, f1)
+        self.befriend(f2, self.me)
+        for friend in (f1, f2):
+            self.befriend(friend, two)
+            self.befriend(friend, pending)
+        self.befriend(f1, one)
+        UserCourse.objects.create(user=one, course=self.course)
+        UserCourse.objects.create(user=mate, course=self.course)
+        Friendship.objects.create(requester=pending, addressee=self.me)
+
+        self.assertEqual(self.suggestions(), [(two.id, 2, 0), (one.id, 1, 1), (mate.id, 0, 1)])
+
+    def test_applies_committed_changes_without_rebuilding(self):
+        friend, other = self.make_user('friend'), self.make_user('other')
+        self.suggestions()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            friendship = Friendship.objects.create(requester=friend, addressee=self.me)
+            self.client.force_authenticate(self.me)
+            self.client.post(f'/api/friendships/{friendship.pk}/accept/')
+            self.befriend(friend, other)
+            UserCourse.objects.create(user=other, course=self.course)
+
+        with mock.patch.object(snapshot, '_rebuild') as rebuild:
+            self.assertEqual(self.suggestions(), [(other.id, 1, 1)])
+        rebuild.assert_not_called()
+
+    @override_settings(FRIEND_SNAPSHOT_CHECK_SECONDS=0)
+    def test_bulk_enrollments_and_deleted_users_are_applied_without_rebuilding(self):
+        friend, mate = self.make_user('friend'), self.make_user('mate')
+        self.befriend(self.me, friend)
+        self.suggestions()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(mate)
+            self.client.post('/api/enrollments/bulk_enroll/', {'course_codes': ['S0']}, format='json')
+        self.client.force_authenticate(self.me)
+        with mock.patch.object(snapshot, '_rebuild') as rebuild:
+            self.assertEqual(self.suggestions(), [(mate.id, 0, 1)])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.force_authenticate(mate)
+                self.client.post('/api/enrollments/bulk_unenroll/', {'course_codes': ['S0']}, format='json')
+                friend.delete()
+            self.client.force_authenticate(self.me)
+            self.assertEqual(self.suggestions(), [])
+        rebuild.assert_not_called()
+
+    def test_replays_changes_made_while_rebuilding(self):
+        mate = self.make_user('mate')
+        current_signature = snapshot.current_signature
+
+        def signature_then_enroll():
+            signature = current_signature()
+            # Another request commits while the rebuild reads the tables
+            with self.captureOnCommitCallbacks(execute=True):
+                UserCourse.objects.create(user=mate, course=self.course)
+            return signature
+
+        with mock.patch.object(snapshot, 'current_signature', side_effect=signature_then_enroll):
+            snapshot.rebuild()
+
+        with override_settings(FRIEND_SNAPSHOT_CHECK_SECONDS=0), mock.patch.object(snapshot, '_rebuild') as rebuild:
+            self.assertEqual(self.suggestions(), [(mate.id, 0, 1)])
+        rebuild.assert_not_called()
+
+    def test_serves_the_current_snapshot_while_another_thread_rebuilds(self):
+        self.suggestions()
+        snapshot.checked_at = 0.0
+        with snapshot.build_lock, mock.patch.object(snapshot, 'current_signature') as current_signature:
+            self.assertEqual(self.suggestions(), [])
+        current_signature.assert_not_called()
+
+    @override_settings(FRIEND_SNAPSHOT_CHECK_SECONDS=0)
+    def test_rebuilds_after_bulk_writes(self):
+        mate = self.make_user('mate')
+        self.assertEqual(self.suggestions(), [])
+        UserCourse.objects.bulk_create([UserCourse(user=mate, course=self.course)])
+        self.assertEqual(self.suggestions(), [(mate.id, 0, 1)])
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    """Tests for api.authentication.CachedJWTAuthentication"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com', bio='hello')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.me)}')
+
+    def user_selects(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries if 'FROM "api_user"' in q['sql']]
+
+    def test_repeat_requests_skip_the_user_select(self):
+        self.assertEqual(len(self.user_selects('/api/profile-picture-jobs/')), 1)
+        self.assertEqual(self.user_selects('/api/profile-picture-jobs/'), [])
+
+    def test_saving_the_user_drops_the_cached_columns(self):
+        self.client.get('/api/enrollments/')
+        self.me.bio = 'updated'
+        self.me.save()
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['bio'], 'updated')
+
+    def test_patch_me_keeps_uncached_columns(self):
+        self.client.get('/api/enrollments/')
+        response = self.client.patch('/api/users/me/', {'first_name': 'Me'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.me.refresh_from_db()
+        self.assertEqual((self.me.first_name, self.me.email, self.me.bio), ('Me', 'me@example.com', 'hello'))
+
+    def test_rejects_inactive_and_deleted_users(self):
+        self.me.is_active = False
+        self.me.save()
+        self.assertEqual(self.client.get('/api/enrollments/').status_code, 401)
+        self.me.delete()
+        self.assertEqual(self.client.get('/api/enrollments/').status_code, 401)
+
+
+# Small enough for every run; QUERY_PLAN_ROWS=100000 checks the plans at production-like size
+QUERY_PLAN_ROWS = int(os.getenv('QUERY_PLAN_ROWS', '5000'))
+SCANNABLE_TABLES = ('api_user', 'api_course')
+
+
+def explain(sql):
+    """
+    Summarize the plan of a query.
+    Uses EXPLAIN QUERY PLAN on SQLite and EXPLAIN (FORMAT JSON) on Postgres.
+    Returns:
+        Tuple (full_scans, indexes): tables/aliases read with a full scan
+        outside SCANNABLE_TABLES, and the names of the indexes used.
+    """
+    scans, indexes = [], []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            nodes = [cursor.fetchone()[0][0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') not in SCANNABLE_TABLES:
+                    scans.append(node['Relation Name'])
+                if 'Index Name' in node:
+                    indexes.append(node['Index Name'])
+                nodes.extend(node.get('Plans', []))
+            return scans, indexes
+
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        for detail in (row[-1] for row in cursor.fetchall()):
+            words = detail.split()
+            if words[0] == 'SCAN' and words[1] not in SCANNABLE_TABLES:
+                scans.append(words[1])
+            if 'INDEX' in words:
+                indexes.append(words[words.index('INDEX') + 1])
+        return scans, indexes
+
+
+class QueryPlanTests(TestCase):
+    """
+    Query-plan regression tests for the Friendship/UserCourse hot filters.
+    Seeds QUERY_PLAN_ROWS friendships and enrollments, then EXPLAINs every
+    query each endpoint issues and fails on a full scan of those tables.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed(
+            scale=max(QUERY_PLAN_ROWS // 5, 100),
+            courses_per_user=5,
+            friendships_per_user=5,
+            course_count=50
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.user = seeded['users'][0]
+        cls.friend_id = FriendAdjacency.objects.filter(user=cls.user).values_list('friend_id', flat=True).first()
+        cls.stranger = User.objects.create_user(username='stranger', email='stranger@example.com')
+        cls.course = seeded['courses'][0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertIndexedQueries(self, method, url, data=None):
+        """Hit an endpoint and assert none of its SELECTs scans a hot table; return the indexes used"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 500)
+        used = set()
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            scans, indexes = explain(sql)
+            self.assertEqual(scans, [], f'{url} scans a hot table: {sql}')
+            used.update(indexes)
+        return used
+
+    def test_pending_friend_requests(self):
+        used = self.assertIndexedQueries('get', '/api/users/pending_friend_requests/')
+        self.assertTrue(used & {'friendship_pending_idx', 'friendship_addr_status_idx'}, used)
+
+    def test_friendships(self):
+        self.assertIndexedQueries('get', f'/api/users/{self.user.id}/friendships/')
+
+    def test_user_courses(self):
+        self.assertIndexedQueries('get', f'/api/users/{self.user.id}/courses/')
+
+    def test_enrollments(self):
+        self.assertIndexedQueries('get', '/api/enrollments/')
+        self.assertIndexedQueries('get', '/api/enrollments/upcoming_sessions/')
+
+    def test_enrolled_users(self):
+        self.assertIndexedQueries('get', f'/api/courses/{self.course.course_id}/enrolled_users/')
+
+    def test_addable_users(self):
+        self.assertIndexedQueries('get', '/api/friendships/addable-users/')
+
+    def test_request_friendship_existence_check(self):
+        self.assertIndexedQueries('post', '/api/friendships/request_friendship/', {'addressee_id': self.stranger.id})
+
+    def test_unfriend(self):
+        self.assertIndexedQueries('post', '/api/friendships/unfriend/', {'friend_id': self.friend_id})
+
+
+class PendingFriendRequestsTests(TestCase):
+    """Tests for UserViewSet.pending_friend_requests"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.courses = [make_course(f'P{i}') for i in range(3)]
+
+    def add_requests(self, count):
+        start = User.objects.count()
+        senders = User.objects.bulk_create([
+            User(username=f'sender{start + i}', email=f'sender{start + i}@example.com', first_name='Sender')
+            for i in range(count)
+        ])
+        UserCourse.objects.bulk_create([
+            UserCourse(user=sender, course=course) for sender in senders for course in self.courses
+        ])
+        Friendship.objects.bulk_create([
+            Friendship(requester=sender, addressee=self.me, status='pending') for sender in senders
+        ])
+
+    def get_pending(self, url='/api/users/pending_friend_requests/'):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx)
+
+    def test_payload_includes_tags(self):
+        self.add_requests(1)
+        response, _ = self.get_pending()
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Sender')
+        self.assertEqual(response.data['results'][0]['tags'], ['P0 title', 'P1 title', 'P2 title'])
+
+    def test_query_count_is_constant(self):
+        self.add_requests(1)
+        _, one = self.get_pending()
+        self.add_requests(999)
+        response, thousand = self.get_pending()
+
+        self.assertEqual(len(response.data['results']), 50)
+        self.assertEqual(one, thousand)
+
+    def test_pages_cover_every_request_newest_first(self):
+        self.add_requests(120)
+        seen = []
+        url = '/api/users/pending_friend_requests/?page_size=50'
+        while url:
+            response, queries = self.get_pending(url)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+
+        expected = list(
+            Friendship.objects.filter(addressee=self.me).order_by('-created_at').values_list('pk', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+
+BUDGET_SCALE = os.getenv('BUDGET_SCALE', '1k')
+BUDGET_SAMPLES = int(os.getenv('BUDGET_SAMPLES', '20'))
+BUDGET_LATENCY_FACTOR = float(os.getenv('BUDGET_LATENCY_FACTOR', '1'))
+BUDGET_REPORT = os.getenv('BUDGET_REPORT')
+
+# URL name -> (URL kwargs key, max queries, p95 latency budget in ms at BUDGET_SCALE='1k')
+# Views with conditional GETs spend one of their queries on the version
+ENDPOINT_BUDGETS = {
+    'user-list': (None, 2, 100),
+    'user-detail': ('user', 2, 100),
+    'user-courses': ('user', 3, 100),
+    'user-friendships': ('user', 3, 100),
+    'user-social-links': ('user', 3, 100),
+    'user-me': (None, 1, 100),
+    'user-friendship-count': ('user', 2, 100),
+    'user-profile-bundle': ('user', 5, 100),
+    'user-pending-friend-requests': (None, 2, 100),
+    'course-list': (None, 1, 100),
+    'course-detail': ('course', 1, 100),
+    'course-enrolled-users': ('course', 2, 100),
+    'usercourse-list': (None, 2, 100),
+    'usercourse-detail': ('enrollment', 1, 100),
+    'usercourse-study-matches': (None, 1, 100),
+    'usercourse-user-courses': (None, 2, 100),
+    'usercourse-upcoming-sessions': (None, 2, 100),
+    'friendship-list': (None, 1, 100),
+    'friendship-detail': ('friendship', 1, 100),
+    'friendship-addable-users': (None, 2, 300),
+    'friendship-suggestions': (None, 3, 100),
+    'social-links-list': (None, 2, 100),
+    'social-links-detail': ('link', 1, 100),
+    'profile-picture-jobs-list': (None, 1, 100),
+    'profile-picture-jobs-detail': ('picture_job', 1, 100),
+}
+
+
+class EndpointBudgetTests(TestCase):
+    """
+    Query-count and p95 latency budgets for every GET route in api/urls.py.
+    Configure with BUDGET_SCALE (1k/10k/100k), BUDGET_SAMPLES and
+    BUDGET_LATENCY_FACTOR; set BUDGET_REPORT to a path to write a JSON report.
+    """
+    report = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed(scale=BUDGET_SCALE)
+        cls.me = seeded['users'][0]
+        other = seeded['users'][1]
+        link, _ = SocialMediaLink.objects.get_or_create(user=cls.me, platform='Instagram', defaults={'name': 'me'})
+        picture_job = ProfilePictureJob.objects.create(user=cls.me)
+        cls.url_kwargs = {
+            'user': {'pk': other.id},
+            'course': {'pk': seeded['courses'][0].course_id},
+            'enrollment': {'pk': UserCourse.objects.filter(user=cls.me).first().pk},
+            'friendship': {'pk': Friendship.objects.first().pk},
+            'link': {'pk': link.pk},
+            'picture_job': {'pk': picture_job.pk},
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        if BUDGET_REPORT and cls.report:
+            with open(BUDGET_REPORT, 'w') as f:
+                json.dump({
+                    'scale': BUDGET_SCALE,
+                    'samples': BUDGET_SAMPLES,
+                    'vendor': connection.vendor,
+                    'endpoints': cls.report,
+                }, f, indent=2, sort_keys=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def measure(self, name):
+        kwargs_key, max_queries, p95_budget = ENDPOINT_BUDGETS[name]
+        url = reverse(name, kwargs=self.url_kwargs[kwargs_key] if kwargs_key else None)
+
+        # One untimed warm-up request, and a collection so earlier tests' garbage doesn't land in the samples
+        self.client.get(url)
+        gc.collect()
+
+        timings = []
+        queries = 0
+        for _ in range(BUDGET_SAMPLES):
+            with CaptureQueriesContext(connection) as ctx:
+                started = clock.perf_counter()
+                response = self.client.get(url)
+                timings.append((clock.perf_counter() - started) * 1000)
+            self.assertEqual(response.status_code, 200, f'{name}: {response.data}')
+            queries = max(queries, len(ctx))
+
+        p95 = percentile(timings, 95)
+        self.report[name] = {
+            'url': url,
+            'queries': queries,
+            'max_queries': max_queries,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(p95, 2),
+            'p95_budget_ms': p95_budget * BUDGET_LATENCY_FACTOR,
+        }
+        return queries, p95
+
+    def test_every_route_has_a_budget(self):
+        for _, viewset, basename in router.registry:
+            names = [f'{basename}-list', f'{basename}-detail'] + [
+                f'{basename}-{extra.url_name}'
+                for extra in viewset.get_extra_actions()
+                if 'get' in extra.mapping
+            ]
+            for name in names:
+                self.assertIn(name, ENDPOINT_BUDGETS)
+
+    def test_endpoints_within_budget(self):
+        for name, (_, max_queries, p95_budget) in ENDPOINT_BUDGETS.items():
+            with self.subTest(endpoint=name):
+                queries, p95 = self.measure(name)
+                self.assertLessEqual(queries, max_queries, f'{name} ran {queries} queries')
+                self.assertLessEqual(p95, p95_budget * BUDGET_LATENCY_FACTOR, f'{name} p95 {p95:.1f}ms')
+
+
+@override_settings(API_PROFILING=True)
+class RequestProfilingTests(TestCase):
+    """Tests for RequestProfilingMiddleware and ProfilingView"""
+
+    def setUp(self):
+        aggregate.reset()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_fingerprint_groups_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'x' AND k IN (%s, %s)"),
+            'SELECT * FROM t WHERE id = %s AND name = %s AND k IN (...)'
+        )
+
+    def test_server_timing_and_aggregate(self):
+        response = self.client.get('/api/users/pending_friend_requests/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('serializer;dur=', response['Server-Timing'])
+
+        summary = self.client.get('/api/profiling/').data
+        stats = summary['UserViewSet.pending_friend_requests']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(set(stats['total_ms']), {'p50', 'p95', 'p99'})
+
+    def test_aggregate_requires_staff(self):
+        self.client.force_authenticate(User.objects.create_user(username='u', email='u@example.com'))
+        self.assertEqual(self.client.get('/api/profiling/').status_code, 403)
+
+
+class ProfileCacheTests(TestCase):
+    """Tests for the read-through profile cache and its signal invalidation"""
+
+    def setUp(self):
+        profile_cache.reset_stats()
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.other = User.objects.create_user(username='other', email='other@example.com', bio='old')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_second_read_is_a_hit_without_queries(self):
+        first = self.client.get(f'/api/users/{self.other.id}/')
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(f'/api/users/{self.other.id}/')
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(len(ctx), 0)
+        self.assertEqual(profile_cache.stats()['user.hits'], 1)
+        self.assertEqual(profile_cache.stats()['user.misses'], 1)
+
+    def test_user_save_invalidates_profile(self):
+        self.client.get(f'/api/users/{self.other.id}/')
+        self.other.bio = 'new'
+        self.other.save()
+        self.assertEqual(self.client.get(f'/api/users/{self.other.id}/').data['bio'], 'new')
+
+    def test_social_link_change_invalidates_links_and_profile(self):
+        self.client.get(f'/api/users/{self.other.id}/')
+        self.client.get(f'/api/users/{self.other.id}/social_links/')
+        SocialMediaLink.objects.create(user=self.other, platform='Instagram', name='other')
+
+        self.assertEqual(len(self.client.get(f'/api/users/{self.other.id}/social_links/').data), 1)
+        self.assertEqual(len(self.client.get(f'/api/users/{self.other.id}/').data['social_links']), 1)
+
+    def test_enrollment_invalidates_courses(self):
+        self.client.get(f'/api/users/{self.other.id}/courses/')
+        UserCourse.objects.create(user=self.other, course=make_course('CACHE1'))
+        self.assertEqual(len(self.client.get(f'/api/users/{self.other.id}/courses/').data), 1)
+
+    def test_accept_invalidates_friend_count(self):
+        self.client.get(f'/api/users/{self.other.id}/')
+        friendship = Friendship.objects.create(requester=self.other, addressee=self.me)
+        self.client.post(f'/api/friendships/{friendship.pk}/accept/')
+        self.assertEqual(self.client.get(f'/api/users/{self.other.id}/').data['friendship_count'], 1)
+
+
+class ProfileBundleTests(TestCase):
+    """Tests for UserViewSet.profile_bundle"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.other = User.objects.create_user(username='other', email='other@example.com')
+        UserCourse.objects.create(user=self.other, course=make_course('BUNDLE1'))
+        SocialMediaLink.objects.create(user=self.other, platform='Facebook', name='other')
+        Friendship.objects.create(requester=self.me, addressee=self.other, status='pending')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_bundle_has_every_section_in_few_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/users/{self.other.id}/profile_bundle/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['id'], self.other.id)
+        self.assertEqual(response.data['courses'][0]['course']['course_code'], 'BUNDLE1')
+        self.assertEqual(response.data['social_links'][0]['name'], 'other')
+        self.assertEqual(response.data['friendship_count'], 0)
+        self.assertEqual(response.data['friendship_status'], 'pending_sent')
+        self.assertLessEqual(len(ctx), 5)
+
+    def test_sparse_fieldset(self):
+        response = self.client.get(f'/api/users/{self.other.id}/profile_bundle/?fields=friendship_status')
+        self.assertEqual(response.data, {'friendship_status': 'pending_sent'})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(f'/api/users/{self.other.id}/profile_bundle/?fields=user,password')
+        self.assertEqual(response.status_code, 400)
+
+    def test_me_alias(self):
+        response = self.client.get('/api/users/me/profile_bundle/?fields=user,friendship_status')
+        self.assertEqual(response.data['user']['id'], self.me.id)
+        self.assertEqual(response.data['friendship_status'], 'self')
+
+    def test_missing_user_is_404(self):
+        response = self.client.get('/api/users/999999/profile_bundle/?fields=friendship_status')
+        self.assertEqual(response.status_code, 404)
+
+
+class UpcomingSessionsTests(TestCase):
+    """Tests for UserCourseViewSet.upcoming_sessions"""
+
+    # Monday, 10:00 UTC
+    NOW = datetime(2026, 10, 19, 10, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        for code, day, hour in [('MON9', 'Mon', 9), ('MON11', 'Mon', 11), ('WED8', 'Wed', 8), ('SUN20', 'Sun', 20)]:
+            UserCourse.objects.create(user=self.me, course=make_course(code, day, hour))
+        patcher = mock.patch('api.views.now', return_value=self.NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_sessions(self, query=''):
+        response = self.client.get(f'/api/enrollments/upcoming_sessions/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [(s['title'].split()[0], s['starts_at']) for s in response.data]
+
+    def test_default_is_next_three_within_a_week(self):
+        self.assertEqual(self.get_sessions(), [
+            ('MON11', '2026-10-19T11:00:00+00:00'),
+            ('WED8', '2026-10-21T08:00:00+00:00'),
+            ('SUN20', '2026-10-25T20:00:00+00:00'),
+        ])
+
+    def test_limit_and_range_span_weeks(self):
+        sessions = self.get_sessions('?limit=10&end=2026-10-28')
+        self.assertEqual([code for code, _ in sessions], ['MON11', 'WED8', 'SUN20', 'MON9', 'MON11', 'WED8'])
+
+    def test_start_date_in_the_future(self):
+        sessions = self.get_sessions('?start=2026-10-25&limit=2')
+        self.assertEqual(sessions, [
+            ('SUN20', '2026-10-25T20:00:00+00:00'),
+            ('MON9', '2026-10-26T09:00:00+00:00'),
+        ])
+
+    def test_user_time_zone(self):
+        # 17:00 in Bangkok, so Monday 11:00 has already passed there
+        sessions = self.get_sessions('?tz=Asia/Bangkok')
+        self.assertEqual(sessions[0], ('WED8', '2026-10-21T08:00:00+07:00'))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/enrollments/upcoming_sessions/?tz=Mars/Base').status_code, 400)
+        self.assertEqual(self.client.get('/api/enrollments/upcoming_sessions/?limit=x').status_code, 400)
+
+
+class SearchTests(TestCase):
+    """Tests for RankedSearchFilter with the in-process inverted index backend"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.ann = User.objects.create_user(username='ann', email='ann@example.com', first_name='Ann', last_name='Lee')
+        self.anna = User.objects.create_user(username='anna', email='anna@example.com', first_name='Anna', last_name='Smith')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', first_name='Bob', last_name='Annex')
+
+    def search_users(self, text):
+        response = self.client.get('/api/users/', {'search': text})
+        self.assertEqual(response.status_code, 200)
+        return [u['username'] for u in response.data['results']]
+
+    def test_prefix_matches_ranked_exact_first(self):
+        self.assertEqual(self.search_users('ann'), ['ann', 'anna', 'bob'])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search_users('ann smi'), ['anna'])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.search_users('ann')
+        self.bob.last_name = 'Brown'
+        self.bob.save()
+        self.anna.delete()
+        self.assertEqual(self.search_users('ann'), ['ann'])
+
+    def test_saves_update_the_index_without_rereading_the_table(self):
+        self.search_users('ann')
+        index = search.BACKENDS['inverted_index'].get_index(User, UserViewSet.search_fields)
+        with CaptureQueriesContext(connection) as queries:
+            carl = User.objects.create_user(username='carl', email='carl@example.com', last_name='Annan')
+            carl.delete()
+            self.bob.last_name = 'Brown'
+            self.bob.save()
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+        self.assertEqual(index.sorted_tokens, sorted(index.postings))
+
+        with mock.patch.object(index, 'rebuild', wraps=index.rebuild) as rebuild:
+            self.assertEqual(self.search_users('ann'), ['ann', 'anna'])
+            rebuild.assert_not_called()
+            # Rows written without signals are caught on the next search
+            User.objects.bulk_create([User(username='annie', email='annie@example.com')])
+            self.assertEqual(self.search_users('ann'), ['ann', 'anna', 'annie'])
+            rebuild.assert_called_once()
+
+    def test_pages_keep_relevance_order(self):
+        usernames = []
+        url = '/api/users/?search=ann&page_size=1'
+        while url:
+            response = self.client.get(url)
+            usernames += [u['username'] for u in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(usernames, ['ann', 'anna', 'bob'])
+
+    def test_pages_through_tied_float_ranks(self):
+        # Postgres ranks are floats and rows often tie; every row must show up once, in order
+        names = [f'annex{i}' for i in range(6)]
+        users = [User.objects.create_user(username=name, email=f'{name}@example.com') for name in names]
+        high = [user.pk for user in users[::3]]
+
+        class TiedRanks:
+            def search(self, queryset, fields, terms):
+                rank = Case(When(pk__in=high, then=Value(0.3)), default=Value(0.1), output_field=FloatField())
+                return queryset.filter(username__startswith='annex').annotate(search_rank=rank)
+
+        with mock.patch.object(search, 'get_backend', return_value=TiedRanks()):
+            pages, url = [], '/api/users/?search=annex&page_size=2'
+            while url:
+                response = self.client.get(url)
+                pages.append([u['username'] for u in response.data['results']])
+                url = response.data['next']
+            expected = ['annex0', 'annex3', 'annex1', 'annex2', 'annex4', 'annex5']
+            self.assertEqual([name for page in pages for name in page], expected)
+
+            previous = []
+            url = response.data['previous']
+            while url:
+                response = self.client.get(url)
+                previous = [u['username'] for u in response.data['results']] + previous
+                url = response.data['previous']
+            self.assertEqual(previous + pages[-1], expected)
+
+    def test_auto_backend_needs_pg_trgm_on_postgres(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            with mock.patch.object(search, 'trigram_installed', return_value=False):
+                self.assertIs(search.get_backend(), search.BACKENDS['icontains'])
+            with mock.patch.object(search, 'trigram_installed', return_value=True):
+                self.assertIs(search.get_backend(), search.BACKENDS['postgres'])
+        self.assertIs(search.get_backend(), search.BACKENDS['inverted_index'])
+
+    def test_course_search(self):
+        make_course('CS101')
+        calculus = make_course('MATH201')
+        calculus.title = 'Calculus I'
+        calculus.save()
+        response = self.client.get('/api/courses/', {'search': 'calc'})
+        self.assertEqual([c['course_code'] for c in response.data['results']], ['MATH201'])
+
+
+class AsyncURLConf:
+    """URLconf with API_ASYNC_VIEWS turned on"""
+    urlpatterns = [path('api/', include(with_async_views(router.urls)))]
+
+
+class AsyncViewTests(TestCase):
+    """Tests for the async GET views in api/async_views.py"""
+
+    # Monday, 10:00 UTC
+    NOW = datetime(2026, 10, 19, 10, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com', first_name='Me')
+        self.friend = User.objects.create_user(username='friend', email='friend@example.com')
+        self.sender = User.objects.create_user(username='sender', email='sender@example.com')
+        self.stranger = User.objects.create_user(username='stranger', email='stranger@example.com')
+        course = make_course('ASYNC1', 'Wed', 8)
+        for user in (self.me, self.friend, self.sender, self.stranger):
+            UserCourse.objects.create(user=user, course=course)
+        SocialMediaLink.objects.create(user=self.friend, platform='Instagram', name='@friend')
+        friendship = Friendship.objects.create(requester=self.me, addressee=self.friend, status='accepted')
+        link_friends(friendship)
+        Friendship.objects.create(requester=self.sender, addressee=self.me, status='pending')
+
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.me)}'}
+        patcher = mock.patch('api.views.now', return_value=self.NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sync_get(self, url):
+        profile_cache.invalidate_all()
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.me.pk))
+        return client.get(url).json()
+
+    async def async_get(self, url, **headers):
+        await sync_to_async(profile_cache.invalidate_all)()
+        with self.settings(ROOT_URLCONF=AsyncURLConf):
+            return await self.async_client.get(url, headers=headers or self.headers)
+
+    async def test_responses_match_the_drf_views(self):
+        urls = [
+            f'/api/users/{self.friend.id}/',
+            f'/api/users/{self.friend.id}/courses/',
+            f'/api/users/{self.friend.id}/social_links/',
+            f'/api/users/{self.friend.id}/profile_bundle/',
+            f'/api/users/{self.sender.id}/profile_bundle/?fields=friendship_status',
+            '/api/users/me/',
+            '/api/users/me/profile_bundle/',
+            '/api/users/pending_friend_requests/',
+            '/api/enrollments/upcoming_sessions/?limit=5',
+            '/api/friendships/addable-users/?page_size=1',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                expected = await sync_to_async(self.sync_get)(url)
+                response = await self.async_get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected)
+
+    async def test_requires_a_bearer_token(self):
+        response = await self.async_get('/api/users/me/', Authorization='Token nope')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+    async def test_errors_match_the_drf_views(self):
+        response = await self.async_get('/api/users/999999/')
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_get('/api/enrollments/upcoming_sessions/?tz=Nowhere/City')
+        self.assertEqual(response.json(), {'detail': 'Unknown time zone: Nowhere/City.'})
+        response = await self.async_get('/api/friendships/addable-users/?cursor=bad')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_other_methods_use_the_drf_view(self):
+        with self.settings(ROOT_URLCONF=AsyncURLConf):
+            response = await self.async_client.patch(
+                '/api/users/me/', {'bio': 'async'}, content_type='application/json', headers=self.headers
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await User.objects.aget(pk=self.me.pk)).bio, 'async')
+
+    async def test_conditional_gets(self):
+        for url in ('/api/users/me/', '/api/enrollments/upcoming_sessions/'):
+            with self.subTest(url=url):
+                etag = (await self.async_get(url))['ETag']
+                response = await self.async_get(url, **self.headers, If_None_Match=etag)
+                self.assertEqual((response.status_code, response.content, response['ETag']), (304, b'', etag))
+
+    async def test_executor_jobs_clean_up_connections(self):
+        with mock.patch('api.async_views.close_old_connections') as close:
+            self.assertEqual(await in_executor(lambda: 'done'), 'done')
+        self.assertEqual(close.call_count, 2)
+
+    async def test_checks_the_viewset_permissions_and_throttles(self):
+        with mock.patch.object(UserViewSet, 'get_permissions', return_value=[IsAdminUser()]):
+            response = await self.async_get('/api/users/me/')
+        self.assertEqual(response.status_code, 403)
+
+        class OnePerMinute(UserRateThrottle):
+            rate = '1/min'
+
+        await sync_to_async(cache.clear)()
+        with mock.patch.object(UserViewSet, 'throttle_classes', [OnePerMinute]):
+            self.assertEqual((await self.async_get('/api/users/me/')).status_code, 200)
+            response = await self.async_get('/api/users/me/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+
+
+def make_image(size=(800, 600), image_format='PNG', name='photo.png'):
+    """Build an uploadable image file"""
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+@override_settings(
+    PROFILE_PICTURE_WORKERS=0,
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+)
+class ProfilePictureUploadTests(TestCase):
+    """Tests for the background profile picture pipeline"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def upload(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                '/api/users/me/upload_profile_picture/', {'profile_picture': image}, format='multipart'
+            )
+
+    def test_upload_is_accepted_then_resized_and_swapped_in(self):
+        response = self.upload(make_image())
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'pending')
+
+        job = ProfilePictureJob.objects.get(pk=response.data['job_id'])
+        self.assertEqual(job.status, 'done')
+        self.me.refresh_from_db()
+        self.assertEqual(self.me.profile_picture_url.name, job.variants['medium'])
+        for name, (size, image_format, _) in profile_pictures.VARIANTS.items():
+            with default_storage.open(job.variants[name]) as f, Image.open(f) as image:
+                self.assertEqual((image.size, image.format), ((size, size), image_format))
+
+        status = self.client.get(response.data['status_url'])
+        self.assertEqual(status.data['status'], 'done')
+        self.assertTrue(status.data['profile_picture_url'].endswith(job.variants['medium']))
+
+    def test_rejects_files_that_are_not_images(self):
+        response = self.upload(SimpleUploadedFile('notes.png', b'not an image'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ProfilePictureJob.objects.exists())
+
+    def test_newer_upload_wins_and_older_files_are_deleted(self):
+        first = ProfilePictureJob.objects.get(pk=self.upload(make_image()).data['job_id'])
+        second = ProfilePictureJob.objects.get(pk=self.upload(make_image((300, 300))).data['job_id'])
+
+        first.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('superseded', 'done'))
+        self.assertFalse(any(default_storage.exists(path) for path in first.variants.values()))
+        self.me.refresh_from_db()
+        self.assertEqual(self.me.profile_picture_url.name, second.variants['medium'])
+
+    def test_older_upload_finishing_late_is_superseded(self):
+        older = ProfilePictureJob.objects.create(user=self.me)
+        newer = ProfilePictureJob.objects.create(user=self.me)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile_pictures.process_job(newer.pk, profile_pictures.spool(make_image()))
+            profile_pictures.process_job(older.pk, profile_pictures.spool(make_image()))
+
+        older.refresh_from_db()
+        self.assertEqual(older.status, 'superseded')
+        self.me.refresh_from_db()
+        self.assertEqual(self.me.profile_picture_url.name, ProfilePictureJob.objects.get(pk=newer.pk).variants['medium'])
+
+    def test_failed_swap_marks_the_job_failed(self):
+        job = ProfilePictureJob.objects.create(user=self.me)
+        stored = []
+        store = profile_pictures.store_variants
+
+        def store_variants(*args):
+            result = store(*args)
+            stored.extend(result.values())
+            return result
+
+        with mock.patch.object(profile_pictures, 'store_variants', store_variants), \
+                mock.patch.object(profile_pictures, 'swap_profile_picture', side_effect=RuntimeError('db gone')):
+            profile_pictures.process_job(job.pk, profile_pictures.spool(make_image()))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error, job.variants), ('failed', 'db gone', {}))
+        self.assertTrue(stored)
+        self.assertFalse(any(default_storage.exists(path) for path in stored))
+
+    def test_spooled_file_is_removed_when_the_job_is_gone(self):
+        job = ProfilePictureJob.objects.create(user=self.me)
+        path = profile_pictures.spool(make_image())
+        self.me.delete()
+        self.assertIsNone(profile_pictures.process_job(job.pk, path))
+        self.assertFalse(os.path.exists(path))
+
+        path = profile_pictures.spool(make_image())
+        with mock.patch.object(ProfilePictureJob.objects, 'filter', side_effect=DatabaseError('db gone')):
+            with self.assertRaises(DatabaseError):
+                profile_pictures.process_job(job.pk, path)
+        self.assertFalse(os.path.exists(path))
+
+    def test_jobs_are_private(self):
+        job = ProfilePictureJob.objects.create(user=User.objects.create_user(username='other', email='o@example.com'))
+        response = self.client.get(f'/api/profile-picture-jobs/{job.pk}/')
+        self.assertEqual(response.status_code, 404)
+
+
+@mock_aws
+@override_settings(
+    AWS_STORAGE_BUCKET_NAME='studybuddy-test',
+    AWS_S3_REGION_NAME='us-east-1',
+    AWS_S3_ENDPOINT_URL=None,
+    AWS_ACCESS_KEY_ID='testing',
+    AWS_SECRET_ACCESS_KEY='testing',
+    PROFILE_PICTURE_MAX_BYTES=1024,
+)
+class DirectProfilePictureUploadTests(TestCase):
+    """Tests for presign_profile_picture and confirm_profile_picture against moto's S3"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.s3 = get_s3_client()
+        self.s3.create_bucket(Bucket='studybuddy-test')
+
+    def presign(self, content_type='image/png'):
+        return self.client.post('/api/users/me/profile_picture/presign/', {'content_type': content_type})
+
+    def confirm(self, key):
+        return self.client.post('/api/users/me/profile_picture/confirm/', {'key': key})
+
+    def test_presigned_post_uploads_then_confirm_records_it(self):
+        presigned = self.presign().data
+        self.assertTrue(presigned['key'].startswith(f'profile_pictures/{self.me.id}/'))
+        self.assertEqual(presigned['fields']['Content-Type'], 'image/png')
+        policy = json.loads(base64.b64decode(presigned['fields']['policy']))
+        self.assertIn(['content-length-range', 1, 1024], policy['conditions'])
+
+        upload = requests.post(presigned['url'], data=presigned['fields'], files={'file': b'png bytes'})
+        self.assertLess(upload.status_code, 300)
+
+        response = self.confirm(presigned['key'])
+        self.assertEqual(response.status_code, 200)
+        self.me.refresh_from_db()
+        self.assertEqual(self.me.profile_picture_url.name, presigned['key'])
+        self.assertTrue(response.data['profile_picture_url'].endswith(presigned['key']))
+
+    def test_rejects_unsupported_content_types(self):
+        self.assertEqual(self.presign('application/pdf').status_code, 400)
+
+    def test_confirm_checks_the_object(self):
+        prefix = f'profile_pictures/{self.me.id}/'
+        self.assertEqual(self.confirm(f'{prefix}missing.png').data['detail'], 'Upload not found.')
+        self.assertEqual(self.confirm('profile_pictures/me/x.png').data['detail'], 'Invalid key.')
+
+        self.s3.put_object(Bucket='studybuddy-test', Key=f'{prefix}big.png',
+                           Body=b'x' * 2048, ContentType='image/png')
+        self.s3.put_object(Bucket='studybuddy-test', Key=f'{prefix}doc.png',
+                           Body=b'x', ContentType='application/pdf')
+        for key in (f'{prefix}big.png', f'{prefix}doc.png'):
+            self.assertEqual(self.confirm(key).status_code, 400)
+        self.me.refresh_from_db()
+        self.assertFalse(self.me.profile_picture_url)
+
+
+class S3UrlResolverTests(TestCase):
+    """Tests for S3UrlResolver and get_full_s3_url"""
+
+    def test_resolves_keys_urls_and_field_files(self):
+        resolve = S3UrlResolver('bucket.s3.amazonaws.com', cache_size=10)
+        self.assertEqual(resolve('profile_pictures/a.jpg'), 'https://bucket.s3.amazonaws.com/profile_pictures/a.jpg')
+        self.assertEqual(resolve('/profile_pictures/a.jpg'), 'https://bucket.s3.amazonaws.com/profile_pictures/a.jpg')
+        self.assertEqual(
+            resolve('https://bucket.s3.amazonaws.com/profile_pictures/a.jpg'),
+            'https://bucket.s3.amazonaws.com/profile_pictures/a.jpg'
+        )
+        self.assertEqual(resolve('https://cdn.example.com/a.jpg'), 'https://cdn.example.com/a.jpg')
+
+        self.assertEqual(
+            resolve(User(profile_picture_url='profile_pictures/b.jpg').profile_picture_url),
+            'https://bucket.s3.amazonaws.com/profile_pictures/b.jpg'
+        )
+        self.assertIsNone(resolve(User().profile_picture_url))
+        self.assertIsNone(resolve(None))
+
+    def test_quotes_keys(self):
+        resolve = S3UrlResolver('bucket.s3.amazonaws.com', cache_size=10)
+        self.assertEqual(
+            resolve('profile_pictures/ann+lee@uni/my photo.jpg'),
+            'https://bucket.s3.amazonaws.com/profile_pictures/ann%2Blee%40uni/my%20photo.jpg'
+        )
+        # URLs are already encoded
+        self.assertEqual(
+            resolve('https://bucket.s3.amazonaws.com/profile_pictures/my%20photo.jpg'),
+            'https://bucket.s3.amazonaws.com/profile_pictures/my%20photo.jpg'
+        )
+
+    def test_cache_is_bounded(self):
+        resolve = S3UrlResolver('bucket.s3.amazonaws.com', cache_size=2)
+        for key in ('a', 'b', 'c', 'a'):
+            resolve(key)
+        info = resolve.resolve_key.cache_info()
+        self.assertEqual((info.currsize, info.hits, info.misses), (2, 0, 4))
+
+    def test_follows_the_domain_setting(self):
+        with self.settings(AWS_S3_CUSTOM_DOMAIN='other.example.com'):
+            self.assertEqual(get_full_s3_url('x.jpg'), 'https://other.example.com/x.jpg')
+
+
+class BulkEnrollmentTests(TestCase):
+    """Tests for UserCourseViewSet.bulk_enroll and bulk_unenroll"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.courses = [make_course(f'B{i}') for i in range(8)]
+        UserCourse.objects.create(user=self.me, course=self.courses[0])
+
+    def post(self, action, codes):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(f'/api/enrollments/{action}/', {'course_codes': codes}, format='json')
+        return response, len(ctx)
+
+    def statuses(self, response):
+        return [(r['course_code'], r['status']) for r in response.data['results']]
+
+    def enrolled_codes(self):
+        return set(UserCourse.objects.filter(user=self.me).values_list('course__course_code', flat=True))
+
+    def test_enroll_reports_each_code(self):
+        response, _ = self.post('bulk_enroll', ['B0', 'B1', 'NOPE', 'B1', 'B2'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(response), [
+            ('B0', 'already_enrolled'), ('B1', 'enrolled'), ('NOPE', 'not_found'), ('B2', 'enrolled'),
+        ])
+        self.assertEqual(self.enrolled_codes(), {'B0', 'B1', 'B2'})
+
+    def test_concurrent_enrollment_is_not_counted_twice(self):
+        insert_enrollments = views.insert_enrollments
+
+        def racing_insert(user, course_ids):
+            # Another request enrolls in B2 after bulk_enroll read the enrollments
+            UserCourse.objects.create(user=user, course=self.courses[2])
+            return insert_enrollments(user, course_ids)
+
+        with mock.patch.object(views, 'insert_enrollments', side_effect=racing_insert):
+            response, _ = self.post('bulk_enroll', ['B1', 'B2'])
+
+        self.assertEqual(self.statuses(response), [('B1', 'enrolled'), ('B2', 'already_enrolled')])
+        self.assertEqual(
+            dict(Course.objects.filter(course_code__in=['B1', 'B2']).values_list('course_code', 'enrolled_count')),
+            {'B1': 1, 'B2': 1}
+        )
+        self.assertEqual(verify_enrollment_counts(), [])
+
+    def test_query_count_does_not_grow_with_codes(self):
+        _, one = self.post('bulk_enroll', ['B1'])
+        _, six = self.post('bulk_enroll', ['B2', 'B3', 'B4', 'B5', 'B6', 'B7'])
+        self.assertEqual(one, six)
+
+    def test_invalidates_cached_course_list(self):
+        self.client.get(f'/api/users/{self.me.id}/courses/')
+        self.post('bulk_enroll', ['B1'])
+        response = self.client.get(f'/api/users/{self.me.id}/courses/')
+        self.assertEqual({c['course']['course_code'] for c in response.data}, {'B0', 'B1'})
+
+    def test_unenroll_reports_each_code(self):
+        self.post('bulk_enroll', ['B1'])
+        response, _ = self.post('bulk_unenroll', ['B0', 'B2', 'NOPE'])
+        self.assertEqual(self.statuses(response), [
+            ('B0', 'unenrolled'), ('B2', 'not_enrolled'), ('NOPE', 'not_found'),
+        ])
+        self.assertEqual(self.enrolled_codes(), {'B1'})
+
+    def test_unenroll_updates_counts_and_feed_once_per_row(self):
+        self.post('bulk_enroll', ['B1', 'B2'])
+        pks = list(UserCourse.objects.filter(user=self.me).values_list('pk', flat=True))
+        self.post('bulk_unenroll', ['B0', 'B1', 'B2'])
+        self.assertEqual(verify_enrollment_counts(), [])
+        tombstones = ChangeRecord.objects.filter(user=self.me, kind='enrollment', deleted=True)
+        self.assertEqual(sorted(tombstones.values_list('object_id', flat=True)), sorted(pks))
+
+    def test_rejects_bad_payloads(self):
+        for codes in ([], 'B1', [1], ['B1'] + [f'X{i}' for i in range(50)]):
+            with self.subTest(codes=codes):
+                response, _ = self.post('bulk_enroll', codes)
+                self.assertEqual(response.status_code, 400)
+
+
+class EnrollmentCountTests(TestCase):
+    """Tests for the stored Course.enrolled_count"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.other = User.objects.create_user(username='other', email='other@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.small = make_course('SMALL')
+        self.big = make_course('BIG')
+        UserCourse.objects.create(user=self.other, course=self.big)
+
+    def counts(self):
+        return dict(Course.objects.values_list('course_code', 'enrolled_count'))
+
+    def test_enroll_and_unenroll_keep_counts(self):
+        self.client.post('/api/enrollments/enroll/', {'course_code': 'SMALL'})
+        self.client.post('/api/enrollments/bulk_enroll/', {'course_codes': ['BIG', 'SMALL']}, format='json')
+        self.assertEqual(self.counts(), {'SMALL': 1, 'BIG': 2})
+
+        self.client.post('/api/enrollments/bulk_unenroll/', {'course_codes': ['BIG']}, format='json')
+        self.client.post('/api/enrollments/unenroll/', {'course_code': 'SMALL'})
+        self.assertEqual(self.counts(), {'SMALL': 0, 'BIG': 1})
+
+        self.other.delete()
+        self.assertEqual(verify_enrollment_counts(), [])
+
+    def test_detail_reads_stored_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/courses/{self.big.course_id}/')
+        self.assertEqual(response.data['enrolled_user_count'], 1)
+        self.assertEqual(len(ctx), 1)
+
+    def test_popular_ordering(self):
+        response = self.client.get('/api/courses/', {'ordering': 'popular'})
+        self.assertEqual([c['course_code'] for c in response.data['results']], ['BIG', 'SMALL'])
+
+    @override_settings(COURSE_ENROLLED_COUNTS='live')
+    def test_live_counts_ignore_stored_column(self):
+        Course.objects.update(enrolled_count=0)
+        response = self.client.get(f'/api/courses/{self.big.course_id}/')
+        self.assertEqual(response.data['enrolled_user_count'], 1)
+        response = self.client.get('/api/courses/', {'ordering': 'popular'})
+        self.assertEqual([c['course_code'] for c in response.data['results']], ['BIG', 'SMALL'])
+
+    def test_reconcile_command_repairs_drift(self):
+        Course.objects.update(enrolled_count=7)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_enrollment_counts', '--verify', stdout=StringIO(), stderr=StringIO())
+        call_command('reconcile_enrollment_counts', stdout=StringIO())
+        self.assertEqual(self.counts(), {'SMALL': 0, 'BIG': 1})
+
+
+@override_settings(STUDY_MATCH_WORKERS=0)
+class StudyMatchTests(TestCase):
+    """Tests for UserCourseViewSet.study_matches and its incremental updates"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.a, self.b = make_course('A', 'Mon', 9), make_course('B', 'Mon', 9)
+        self.c = make_course('C', 'Tue', 10)
+        self.me = self.make_user('me', self.a, self.c)
+        self.both = self.make_user('both', self.a, self.c)
+        self.one = self.make_user('one', self.a)
+        self.slot_only = self.make_user('slot_only', self.b)
+        self.one_and_slot = self.make_user('one_and_slot', self.a, self.b)
+        rebuild_study_matches()
+
+    def make_user(self, name, *courses):
+        user = User.objects.create_user(username=name, email=f'{name}@example.com')
+        for course in courses:
+            UserCourse.objects.create(user=user, course=course)
+        return user
+
+    def matches(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/enrollments/study_matches/')
+        self.assertEqual(response.status_code, 200)
+        return [
+            (m['partner']['username'], m['score'], m['shared_courses'], m['shared_slots'])
+            for m in response.data['results']
+        ]
+
+    def test_ranks_partners_by_shared_courses_and_hours(self):
+        self.assertEqual(self.matches(self.me), [
+            ('both', 8, 2, 2), ('one', 4, 1, 1), ('one_and_slot', 4, 1, 1),
+        ])
+        # Studying at the same hour alone is not a match
+        self.assertNotIn('slot_only', [m[0] for m in self.matches(self.one)])
+
+    def test_enroll_and_unenroll_update_both_sides(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(self.slot_only)
+            self.client.post('/api/enrollments/enroll/', {'course_code': 'C'})
+        self.assertIn(('slot_only', 5, 1, 2), self.matches(self.me))
+        self.assertEqual(self.matches(self.slot_only)[:2], [('me', 5, 1, 2), ('both', 5, 1, 2)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(self.one)
+            self.client.post('/api/enrollments/unenroll/', {'course_code': 'A'})
+        self.assertNotIn('one', [m[0] for m in self.matches(self.me)])
+        self.assertEqual(self.matches(self.one), [])
+
+    def test_bulk_enroll_updates_matches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(self.one)
+            self.client.post('/api/enrollments/bulk_enroll/', {'course_codes': ['C']}, format='json')
+        self.assertEqual(self.matches(self.one)[:2], [('me', 8, 2, 2), ('both', 8, 2, 2)])
+        self.assertEqual(StudyMatch.objects.get(user=self.me, partner=self.one).score, 8)
+
+    def test_bulk_unenroll_refreshes_matches_once(self):
+        refresh_study_matches = study_matching.refresh_study_matches
+        with mock.patch.object(study_matching, 'refresh_study_matches', wraps=refresh_study_matches) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.force_authenticate(self.both)
+                self.client.post('/api/enrollments/bulk_unenroll/', {'course_codes': ['A', 'C']}, format='json')
+        refresh.assert_called_once_with(self.both.id, [self.a.course_id, self.c.course_id])
+        self.assertEqual(self.matches(self.both), [])
+        self.assertNotIn('both', [m[0] for m in self.matches(self.me)])
+
+    def test_course_bits_are_dense(self):
+        profiles = study_matching.Profiles([(1, 10 ** 9, 540), (1, 10 ** 6, 600), (2, 10 ** 6, 600)])
+        self.assertEqual(profiles.courses[1].bit_length(), 2)
+        self.assertEqual(profiles.score(1, 2), (4, 1, 1))
+
+    @override_settings(STUDY_MATCH_WORKERS=1)
+    def test_queued_refreshes_of_a_user_are_merged(self):
+        executor = mock.Mock()
+        with mock.patch.object(study_matching, 'get_executor', return_value=executor), \
+                mock.patch.object(study_matching, 'refresh_study_matches') as refresh:
+            study_matching.queue_refresh(self.me.id, [self.a.course_id])
+            study_matching.queue_refresh(self.me.id, [self.b.course_id])
+            study_matching.queue_refresh(self.one.id, [self.a.course_id])
+            executor.submit.assert_called_once_with(study_matching.run_in_worker)
+            study_matching.run_in_worker()
+        self.assertEqual(refresh.call_args_list, [
+            mock.call(self.me.id, {self.a.course_id, self.b.course_id}),
+            mock.call(self.one.id, {self.a.course_id}),
+        ])
+
+
+class RowMapperTests(TestCase):
+    """Tests for api.row_mappers and api.renderers"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(
+            username='me', email='me@example.com', first_name='Zoë', bio='line\u2028break',
+            profile_picture_url='profile_pictures/me/pic.jpg'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.course = make_course('ROW1')
+        others = [User.objects.create_user(username=f'row{i}', email=f'row{i}@example.com') for i in range(3)]
+        for user in [self.me, *others]:
+            UserCourse.objects.create(user=user, course=self.course)
+        for i, other in enumerate(others):
+            pair = (self.me, other) if i % 2 else (other, self.me)
+            link_friends(Friendship.objects.create(requester=pair[0], addressee=pair[1], status='accepted'))
+
+    def test_lists_are_byte_identical_to_the_serializers(self):
+        urls = [
+            '/api/friendships/',
+            '/api/enrollments/',
+            '/api/enrollments/user_courses/',
+            f'/api/courses/{self.course.course_id}/enrolled_users/?page_size=2',
+            f'/api/users/{self.me.id}/friendships/',
+            f'/api/users/{self.me.id}/courses/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                profile_cache.invalidate_all()
+                mapped = self.client.get(url)
+                profile_cache.invalidate_all()
+                with self.settings(API_ROW_MAPPERS=False):
+                    serialized = self.client.get(url)
+                self.assertEqual(mapped.status_code, 200)
+                self.assertEqual(mapped.content, serialized.content)
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        data = {
+            'text': 'Zoë \u2028 \u2029 "quoted"',
+            'when': datetime(2025, 1, 6, 9, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'time': time(9, 30),
+            'amount': decimal.Decimal('1.50'),
+            'id': uuid.UUID(int=1),
+            'error': ErrorDetail('Invalid.', code='invalid'),
+            'numbers': (1, 2.5, None, True),
+            1: 'integer key',
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2')
+        )
+
+    def test_orjson_renderer_writes_non_finite_floats_as_null(self):
+        data = {'values': [float('nan'), float('inf'), -float('inf'), 1.5]}
+        self.assertEqual(ORJSONRenderer().render(data), b'{"values":[null,null,null,1.5]}')
+        # Where DRF's strict encoder refuses them
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(data)
+
+
+class SocialLinkSyncTests(TestCase):
+    """Tests for SocialMediaLinkViewSet.sync"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.instagram = SocialMediaLink.objects.create(user=self.me, platform='Instagram', name='@old')
+        SocialMediaLink.objects.create(user=self.me, platform='Facebook', name='old')
+
+    def sync(self, links):
+        return self.client.put('/api/social-links/sync/', {'links': links}, format='json')
+
+    def test_upserts_and_deletes_in_one_request(self):
+        response = self.sync([{'platform': 'instagram', 'name': '@new'}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(l['platform'], l['name']) for l in response.data], [('Instagram', '@new')])
+        # Updated in place, not recreated
+        self.assertEqual(response.data[0]['link_id'], self.instagram.link_id)
+        self.assertFalse(SocialMediaLink.objects.filter(user=self.me, platform='Facebook').exists())
+
+    def test_creates_missing_platforms_and_clears_with_empty_set(self):
+        SocialMediaLink.objects.filter(user=self.me).delete()
+        response = self.sync([{'platform': 'Facebook', 'name': 'fb'}, {'platform': 'Instagram', 'name': '@ig'}])
+        self.assertEqual([l['platform'] for l in response.data], ['Facebook', 'Instagram'])
+        self.assertEqual(self.sync([]).data, [])
+
+    def test_invalidates_cached_profile(self):
+        self.client.get(f'/api/users/{self.me.id}/social_links/')
+        self.sync([{'platform': 'Instagram', 'name': '@fresh'}])
+        response = self.client.get(f'/api/users/{self.me.id}/social_links/')
+        self.assertEqual([l['name'] for l in response.data], ['@fresh'])
+
+    def test_rejects_invalid_sets(self):
+        for links in (None, [{'platform': 'Myspace', 'name': 'x'}],
+                      [{'platform': 'Instagram', 'name': 'a'}, {'platform': 'instagram', 'name': 'b'}]):
+            with self.subTest(links=links):
+                self.assertEqual(self.sync(links).status_code, 400)
+        self.assertEqual(SocialMediaLink.objects.filter(user=self.me).count(), 2)
+
+
+class ConditionalGetTests(TestCase):
+    """Tests for api.conditional.ConditionalGetMixin"""
+
+    URLS = [
+        '/api/users/me/',
+        '/api/enrollments/',
+        '/api/enrollments/user_courses/',
+        '/api/enrollments/upcoming_sessions/',
+        '/api/social-links/',
+    ]
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.course = make_course('ETAG1')
+        UserCourse.objects.create(user=self.me, course=self.course)
+        SocialMediaLink.objects.create(user=self.me, platform='Instagram', name='@me')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def etags(self):
+        return {url: self.etag(url) for url in self.URLS}
+
+    def test_unchanged_resources_return_304_without_serializing(self):
+        for url in self.URLS:
+            with self.subTest(url=url):
+                etag = self.etag(url)
+                with mock.patch('api.row_mappers.RowMapper.map_rows') as map_rows, \
+                        mock.patch.object(UserSerializer, 'to_representation') as to_representation, \
+                        CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual((response.status_code, response.content), (304, b''))
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(len(ctx.captured_queries), 1)
+                map_rows.assert_not_called()
+                to_representation.assert_not_called()
+
+    def test_if_modified_since(self):
+        response = self.client.get('/api/social-links/')
+        response = self.client.get('/api/social-links/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        # The session list moves with the clock, so it only has an ETag
+        self.assertFalse(self.client.get('/api/enrollments/upcoming_sessions/').has_header('Last-Modified'))
+
+    def test_etags_are_per_user(self):
+        before = self.etag('/api/users/me/')
+        self.client.force_authenticate(User.objects.create_user(username='other', email='other@example.com'))
+        self.assertNotEqual(self.etag('/api/users/me/'), before)
+
+    def test_changes_move_the_etags(self):
+        make_course('ETAG2')
+        make_course('ETAG3')
+        friend = User.objects.create_user(username='friend', email='friend@example.com')
+        changes = {
+            'enroll': lambda: self.client.post('/api/enrollments/enroll/', {'course_code': 'ETAG2'}),
+            'bulk enroll': lambda: self.client.post(
+                '/api/enrollments/bulk_enroll/', {'course_codes': ['ETAG3']}, format='json'
+            ),
+            'unenroll': lambda: self.client.post('/api/enrollments/unenroll/', {'course_code': 'ETAG2'}),
+            'profile edit': lambda: self.client.patch('/api/users/me/', {'bio': 'new'}, format='json'),
+            'link sync': lambda: self.client.put('/api/social-links/sync/', {'links': []}, format='json'),
+            'new friend': lambda: link_friends(
+                Friendship.objects.create(requester=self.me, addressee=friend, status='accepted')
+            ),
+            'course edit': lambda: Course.objects.get(pk=self.course.pk).save(),
+        }
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                before = self.etags()
+                change()
+                after = self.etags()
+                moved = [url for url in self.URLS if before[url] != after[url]]
+                # Course edits only show up in the enrollment payloads
+                self.assertEqual(moved, self.URLS[1:4] if name == 'course edit' else self.URLS)
+
+
+@override_settings(CHANGE_FEED_GRACE_SECONDS=0)
+class ChangeFeedTests(TestCase):
+    """Tests for api.utils.change_feed and the sync endpoint"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.friend = User.objects.create_user(username='friend', email='friend@example.com')
+        self.courses = [make_course(f'SYNC{i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def sync(self, since=None, user=None, **params):
+        client = self.client
+        if user is not None:
+            client = APIClient()
+            client.force_authenticate(user)
+        if since is not None:
+            params['since'] = since
+        response = client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, section, pk):
+        return [row[pk] for row in section['upserts']], section['deleted']
+
+    def befriend(self):
+        friendship = Friendship.objects.create(requester=self.friend, addressee=self.me, status='accepted')
+        link_friends(friendship)
+        return friendship
+
+    def test_full_sync_returns_current_state(self):
+        enrollment = UserCourse.objects.create(user=self.me, course=self.courses[0])
+        link = SocialMediaLink.objects.create(user=self.me, platform='Instagram', name='@me')
+        friendship = self.befriend()
+
+        data = self.sync()
+        self.assertFalse(data['reset'])
+        self.assertEqual(data['next'], ChangeRecord.objects.filter(user=self.me).latest('seq').seq)
+        self.assertEqual(self.ids(data['users'], 'id'), ([self.me.id, self.friend.id], []))
+        self.assertEqual(self.ids(data['friendships'], 'friendship_id'), ([friendship.pk], []))
+        self.assertEqual(self.ids(data['enrollments'], 'user_course_id'), ([enrollment.pk], []))
+        self.assertEqual(self.ids(data['social_links'], 'link_id'), ([link.pk], []))
+
+    def test_changes_are_compacted_into_upserts_and_tombstones(self):
+        since = self.sync()['next']
+        self.client.post('/api/enrollments/enroll/', {'course_code': 'SYNC0'})
+        self.client.post('/api/enrollments/enroll/', {'course_code': 'SYNC1'})
+        dropped = UserCourse.objects.get(user=self.me, course=self.courses[0]).pk
+        self.client.post('/api/enrollments/unenroll/', {'course_code': 'SYNC0'})
+        self.client.patch('/api/users/me/', {'bio': 'one'}, format='json')
+        self.client.patch('/api/users/me/', {'bio': 'two'}, format='json')
+
+        data = self.sync(since)
+        kept = UserCourse.objects.get(user=self.me).pk
+        self.assertEqual(self.ids(data['enrollments'], 'user_course_id'), ([kept], [dropped]))
+        self.assertEqual([user['bio'] for user in data['users']['upserts']], ['two'])
+        self.assertEqual(self.sync(data['next'])['enrollments'], {'upserts': [], 'deleted': []})
+
+    def test_unfriend_reaches_both_sides(self):
+        friendship = self.befriend()
+        mine, theirs = self.sync()['next'], self.sync(user=self.friend)['next']
+        response = self.client.post('/api/friendships/unfriend/', {'friend_id': self.friend.id})
+        self.assertEqual(response.status_code, 204)
+        for user, since in ((self.me, mine), (self.friend, theirs)):
+            with self.subTest(user=user.username):
+                self.assertEqual(self.ids(self.sync(since, user=user)['friendships'], 'friendship_id'),
+                                 ([], [friendship.pk]))
+
+    def test_profile_changes_reach_friends_but_not_logins(self):
+        self.befriend()
+        since = self.sync()['next']
+        self.friend.last_login = datetime.now(dt_timezone.utc)
+        self.friend.save(update_fields=['last_login'])
+        self.assertEqual(self.sync(since)['users']['upserts'], [])
+        self.friend.first_name = 'Fred'
+        self.friend.save()
+        self.assertEqual([user['first_name'] for user in self.sync(since)['users']['upserts']], ['Fred'])
+
+        friend_id = self.friend.id
+        self.friend.delete()
+        self.assertEqual(self.ids(self.sync(since)['users'], 'id'), ([], [friend_id]))
+
+    def test_bulk_paths_are_recorded(self):
+        SocialMediaLink.objects.create(user=self.me, platform='Facebook', name='fb')
+        since = self.sync()['next']
+        self.client.post('/api/enrollments/bulk_enroll/', {'course_codes': ['SYNC1', 'SYNC2']}, format='json')
+        self.client.put('/api/social-links/sync/', {'links': [{'platform': 'Instagram', 'name': '@me'}]},
+                        format='json')
+
+        data = self.sync(since)
+        self.assertEqual(len(data['enrollments']['upserts']), 2)
+        self.assertEqual([link['platform'] for link in data['social_links']['upserts']], ['Instagram'])
+        self.assertEqual(len(data['social_links']['deleted']), 1)
+
+    def test_limit_pages_through_the_feed(self):
+        since = self.sync()['next']
+        for course in self.courses:
+            UserCourse.objects.create(user=self.me, course=course)
+        seen = []
+        while True:
+            data = self.sync(since, limit=2)
+            seen += [row['course']['course_code'] for row in data['enrollments']['upserts']]
+            since = data['next']
+            if not data['has_more']:
+                break
+        self.assertEqual(seen, ['SYNC0', 'SYNC1', 'SYNC2'])
+
+    def test_compaction(self):
+        since = self.sync()['next']
+        enrollment = UserCourse.objects.create(user=self.me, course=self.courses[0])
+        enrollment.save()
+        enrollment.delete()
+        before = self.sync(since)
+
+        dropped = compact_changes(retention_days=30)
+        self.assertEqual(dropped, {'superseded': 2, 'orphaned': 0, 'expired': 0})
+        self.assertEqual(self.sync(since), before)
+
+        remaining = ChangeRecord.objects.update(created_at=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(compact_changes(retention_days=30)['expired'], remaining)
+        self.assertFalse(ChangeRecord.objects.exists())
+        # Cursors from before the compaction get a full sync
+        data = self.sync(since)
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['next'], ChangeCompaction.objects.get().through_seq)
+        self.assertFalse(self.sync(data['next'])['reset'])
+
+    def test_rejects_invalid_parameters(self):
+        for params in ({'since': 'yesterday'}, {'since': -1}, {'since': 0, 'limit': 'all'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/sync/', params).status_code, 400)
+
+    @override_settings(CHANGE_FEED_GRACE_SECONDS=60)
+    def test_cursor_waits_for_interleaved_transactions(self):
+        # Transaction A takes a seq, then B takes a higher one and commits first
+        first = UserCourse.objects.create(user=self.me, course=self.courses[0])
+        second = UserCourse.objects.create(user=self.me, course=self.courses[1])
+        record_a = ChangeRecord.objects.get(user=self.me, kind='enrollment', object_id=first.pk)
+        seq_a = record_a.seq
+        record_a.delete()
+
+        # A sync between B's commit and A's sees B only
+        data = self.sync(0)
+        self.assertEqual(self.ids(data['enrollments'], 'user_course_id'), ([second.pk], []))
+        self.assertLess(data['next'], seq_a)
+        self.assertLess(self.sync()['next'], seq_a)
+
+        # A commits; a sync from that cursor still gets A's record
+        record_a.seq = seq_a
+        record_a.save()
+        data = self.sync(data['next'])
+        self.assertEqual(self.ids(data['enrollments'], 'user_course_id'), ([first.pk, second.pk], []))
+
+        # Once the grace period has passed the cursor moves past both
+        ChangeRecord.objects.update(created_at=datetime.now(dt_timezone.utc) - timedelta(minutes=2))
+        data = self.sync(data['next'])
+        self.assertEqual(data['next'], ChangeRecord.objects.filter(user=self.me).latest('seq').seq)
+        self.assertEqual(self.sync(data['next'])['enrollments'], {'upserts': [], 'deleted': []})
+
+
+class FriendshipEventTests(TestCase):
+    """Tests for the friendship events and the stream in api/event_stream.py"""
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', email='me@example.com')
+        self.friend = User.objects.create_user(username='friend', email='friend@example.com')
+        self.token = str(AccessToken.for_user(self.me))
+        self.broker = events.InProcessBroker()
+        for patcher in (
+            mock.patch.object(events, '_broker', self.broker),
+            # The test transaction must survive the stream's user lookup
+            mock.patch('api.event_stream.close_old_connections'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def published(self, client, url, data):
+        with mock.patch.object(self.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post(url, data, format='json')
+        self.assertLess(response.status_code, 300)
+        return [(user_id, event['type']) for (user_id, event), _ in publish.call_args_list]
+
+    def test_views_publish_to_both_sides(self):
+        me, friend = APIClient(), APIClient()
+        me.force_authenticate(self.me)
+        friend.force_authenticate(self.friend)
+
+        sent = self.published(me, '/api/friendships/request_friendship/', {'addressee_id': self.friend.id})
+        self.assertEqual(sent, [(self.me.id, 'friendship_requested'), (self.friend.id, 'friendship_requested')])
+        friendship = Friendship.objects.get()
+        sent = self.published(friend, f'/api/friendships/{friendship.pk}/accept/', {})
+        self.assertEqual(sent, [(self.me.id, 'friendship_accepted'), (self.friend.id, 'friendship_accepted')])
+        sent = self.published(friend, '/api/friendships/unfriend/', {'friend_id': self.me.id})
+        self.assertEqual(sent, [(self.me.id, 'friendship_removed'), (self.friend.id, 'friendship_removed')])
+
+        friendship = Friendship.objects.create(requester=self.friend, addressee=self.me, status='pending')
+        sent = self.published(me, f'/api/friendships/{friendship.pk}/reject/', {})
+        self.assertEqual(sent, [(self.friend.id, 'friendship_rejected'), (self.me.id, 'friendship_rejected')])
+
+    def test_nothing_is_published_on_rollback(self):
+        friendship = Friendship.objects.create(requester=self.me, addressee=self.friend, status='pending')
+        with mock.patch.object(self.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        events.publish_friendship(events.FRIENDSHIP_ACCEPTED, friendship, self.friend)
+                        raise ValueError
+                except ValueError:
+                    pass
+        publish.assert_not_called()
+
+    async def open_stream(self, token=None):
+        """Run the stream app on a fake connection; returns (task, sent messages, client messages)"""
+        async def django_app(scope, receive, send):
+            self.fail('The stream request reached Django')
+
+        headers = [(b'authorization', f'Bearer {token or self.token}'.encode())] if token != '' else []
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/events/', 'headers': headers}
+        sent, received = asyncio.Queue(), asyncio.Queue()
+        task = asyncio.ensure_future(EventStreamApp(django_app)(scope, received.get, sent.put))
+        return task, sent, received
+
+    async def next_body(self, sent):
+        message = await asyncio.wait_for(sent.get(), 5)
+        self.assertEqual(message['type'], 'http.response.body')
+        return message
+
+    async def test_streams_events(self):
+        task, sent, received = await self.open_stream()
+        start = await asyncio.wait_for(sent.get(), 5)
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        self.assertEqual((await self.next_body(sent))['body'], b'retry: 5000\n\n')
+        self.assertEqual(self.broker.count, 1)
+
+        friendship = await sync_to_async(Friendship.objects.create)(
+            requester=self.friend, addressee=self.me, status='pending'
+        )
+        await sync_to_async(self.publish_on_commit)(friendship)
+        body = (await self.next_body(sent))['body'].decode()
+        event, data = body.strip().split('\n')
+        self.assertEqual(event, 'event: friendship_requested')
+        data = json.loads(data.removeprefix('data: '))
+        self.assertEqual(data['friendship_id'], friendship.pk)
+        self.assertEqual(data['requester_id'], self.friend.id)
+        self.assertEqual(data['user']['username'], 'friend')
+
+        await received.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(task, 5)
+        self.assertEqual(self.broker.count, 0)
+        self.assertEqual(self.broker.subscribers, {})
+
+    def publish_on_commit(self, friendship):
+        with self.captureOnCommitCallbacks(execute=True):
+            events.publish_friendship(events.FRIENDSHIP_REQUESTED, friendship, self.friend)
+
+    async def test_heartbeats(self):
+        with self.settings(EVENTS_HEARTBEAT_SECONDS=0.01):
+            task, sent, received = await self.open_stream()
+            await sent.get()
+            await self.next_body(sent)
+            for _ in range(3):
+                self.assertEqual((await self.next_body(sent))['body'], b': ping\n\n')
+            await received.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(task, 5)
+
+    async def test_slow_readers_get_an_overflow_and_are_closed(self):
+        with self.settings(EVENTS_QUEUE_SIZE=2):
+            task, sent, received = await self.open_stream()
+            await sent.get()
+            await self.next_body(sent)
+            # Nothing is read from the queue until the loop runs again
+            subscription, = self.broker.subscribers[self.me.id]
+            for i in range(3):
+                subscription.put({'type': 'friendship_requested', 'friendship_id': i})
+            body = await self.next_body(sent)
+            self.assertEqual(body['body'], b'event: overflow\ndata: {"type":"overflow"}\n\n')
+            self.assertFalse(body['more_body'])
+            await asyncio.wait_for(task, 5)
+        self.assertEqual(self.broker.count, 0)
+
+    async def test_requires_a_valid_token(self):
+        for token in ('', 'not-a-token'):
+            with self.subTest(token=token):
+                task, sent, _ = await self.open_stream(token)
+                await asyncio.wait_for(task, 5)
+                self.assertEqual((await sent.get())['status'], 401)
+                self.assertIn('detail', json.loads((await sent.get())['body']))
+        self.assertEqual(self.broker.count, 0)
+
+    async def test_limits_open_streams(self):
+        with self.settings(EVENTS_MAX_STREAMS=1):
+            first, sent, received = await self.open_stream()
+            await sent.get()
+            second, rejected, _ = await self.open_stream()
+            await asyncio.wait_for(second, 5)
+            start = await rejected.get()
+            self.assertEqual(start['status'], 503)
+            self.assertIn((b'retry-after', b'30'), start['headers'])
+            await received.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(first, 5)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import (
@@ -5,6 +6,7 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 from .views import *
+from .async_views import with_async_views
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -12,13 +14,23 @@ router.register(r'courses', CourseViewSet)
 router.register(r'enrollments', UserCourseViewSet)
 router.register(r'friendships', FriendshipViewSet)
 router.register(r'social-links', SocialMediaLinkViewSet, basename='social-links')
+router.register(r'profile-picture-jobs', ProfilePictureJobViewSet, basename='profile-picture-jobs')
+
+router_urls = router.urls
+if settings.API_ASYNC_VIEWS:
+    router_urls = with_async_views(router_urls)
 
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('register/', CreateUserView.as_view(), name='user-register'),
     path('api-auth/', include('rest_framework.urls')),
     path('users/me/upload_profile_picture/', UserViewSet.as_view({'post': 'upload_profile_picture'}), name='user-profile-picture'),
+    path('users/me/profile_picture/presign/', UserViewSet.as_view({'post': 'presign_profile_picture'}), name='user-profile-picture-presign'),
+    path('users/me/profile_picture/confirm/', UserViewSet.as_view({'post': 'confirm_profile_picture'}), name='user-profile-picture-confirm'),
     path('friendships/unfriend/', FriendshipViewSet.as_view({'post': 'unfriend'}), name='friendship-unfriend'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('profiling/', ProfilingView.as_view(), name='profiling'),
+    path('profiling/cache/', ProfileCacheStatsView.as_view(), name='profiling-cache'),
 ]
\ No newline at end of file
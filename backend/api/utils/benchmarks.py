@@ -0,0 +1,331 @@
+import time
+
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .factories import parse_scale, seed
+from .profiling import percentile
+
+SCENARIOS = {}
+
+
+class Rollback(Exception):
+    """Raised to roll back the data a benchmark seeded"""
+
+
+def scenario(name, seed_data=True):
+    """
+    Register a benchmark scenario under `name`.
+    Scenarios with `seed_data=False` are microbenchmarks that build their
+    own in-memory objects and get {'user_count': n} instead of seeded rows.
+    """
+    def register(func):
+        func.seed_data = seed_data
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def measure(func, repeat):
+    """
+    Call `func` `repeat` times.
+    Returns:
+        Dict with p50/p95/max latency in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def run(name, scale, repeat):
+    """
+    Seed synthetic data at `scale`, run a scenario and roll everything back.
+    Returns:
+        The scenario's report dict
+    """
+    if not SCENARIOS[name].seed_data:
+        return SCENARIOS[name]({'user_count': parse_scale(scale)}, repeat)
+
+    report = None
+    try:
+        with transaction.atomic():
+            seeded = seed(scale=scale)
+            report = SCENARIOS[name](seeded, repeat)
+            raise Rollback()
+    except Rollback:
+        pass
+    return report
+
+
+def drf_request(path, **params):
+    """Build a DRF request for calling filter backends directly"""
+    return Request(APIRequestFactory().get(path, params))
+
+
+@scenario('search')
+def search_scenario(seeded, repeat):
+    """Compare DRF's icontains SearchFilter with the configured ranked search backend"""
+    from rest_framework import filters
+
+    from ..models import User
+    from ..views import UserViewSet
+    from .search import RankedSearchFilter, get_backend
+
+    view = UserViewSet()
+    queries = ['synth', 'user12', 'synthetic user99', 'example']
+    report = {'backend': type(get_backend()).__name__, 'queries': {}}
+    for query in queries:
+        request = drf_request('/api/users/', search=query)
+        report['queries'][query] = {}
+        for label, backend in [('icontains', filters.SearchFilter()), ('ranked', RankedSearchFilter())]:
+            report['queries'][query][label] = measure(
+                lambda: list(backend.filter_queryset(request, User.objects.all(), view)[:20]),
+                repeat
+            )
+    return report
+
+
+def legacy_s3_url(path_or_url):
+    """get_full_s3_url as it was before S3UrlResolver, for comparison"""
+    from django.conf import settings
+
+    if not path_or_url:
+        return None
+    if hasattr(path_or_url, 'url'):
+        path_or_url = path_or_url.url
+    path_or_url = str(path_or_url)
+    if settings.AWS_S3_CUSTOM_DOMAIN in path_or_url:
+        path_or_url = path_or_url.split(settings.AWS_S3_CUSTOM_DOMAIN)[-1].lstrip('/')
+    if path_or_url.startswith('http'):
+        return path_or_url
+    return f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{path_or_url.lstrip('/')}"
+
+
+@scenario('s3_urls', seed_data=False)
+def s3_urls_scenario(seeded, repeat):
+    """Resolve and serialize the profile pictures of `scale` in-memory users"""
+    from ..models import User
+    from ..serializers import UserBasicSerializer
+    from .s3_utils import get_full_s3_url, get_resolver
+
+    users = [
+        User(id=i, username=f'user{i}', profile_picture_url=f'profile_pictures/user{i}/profile.jpg')
+        for i in range(seeded['user_count'])
+    ]
+    pictures = [user.profile_picture_url for user in users]
+
+    get_resolver().resolve_key.cache_clear()
+    started = time.perf_counter()
+    for picture in pictures:
+        get_full_s3_url(picture)
+    cold_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        'users': len(users),
+        'legacy_resolve': measure(lambda: [legacy_s3_url(p) for p in pictures], repeat),
+        'resolver_cold_ms': round(cold_ms, 3),
+        'resolver_warm': measure(lambda: [get_full_s3_url(p) for p in pictures], repeat),
+        'serialize_user_basic': measure(lambda: UserBasicSerializer(users, many=True).data, repeat),
+        'cache': get_resolver().resolve_key.cache_info()._asdict(),
+    }
+
+
+def sql_suggestions(user, limit):
+    """Friend suggestions as a single SQL query, for comparison with the snapshot"""
+    from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Value
+    from django.db.models.functions import Coalesce
+
+    from ..models import FriendAdjacency, Friendship, User, UserCourse
+    from .friend_suggestions import MUTUAL_FRIEND_WEIGHT
+
+    def count_of(queryset, field):
+        return Coalesce(
+            Subquery(queryset.order_by().values(field).annotate(c=Count('*')).values('c'),
+                     output_field=IntegerField()),
+            Value(0)
+        )
+
+    related = Friendship.objects.filter(
+        Q(requester=user, addressee=OuterRef('pk')) | Q(addressee=user, requester=OuterRef('pk'))
+    ).exclude(status='rejected')
+    mutual = FriendAdjacency.objects.filter(
+        friend=OuterRef('pk'),
+        user_id__in=FriendAdjacency.objects.filter(user=user).values('friend_id')
+    )
+    shared = UserCourse.objects.filter(
+        user=OuterRef('pk'),
+        course_id__in=UserCourse.objects.filter(user=user).values('course_id')
+    )
+    return list(
+        User.objects
+        .exclude(pk=user.pk)
+        .filter(~Exists(related))
+        .annotate(mutual_friends=count_of(mutual, 'friend'), shared_courses=count_of(shared, 'user'))
+        .annotate(score=F('mutual_friends') * MUTUAL_FRIEND_WEIGHT + F('shared_courses'))
+        .filter(score__gt=0)
+        .order_by('-score', 'id')
+        .values_list('id', 'mutual_friends', 'shared_courses')[:limit]
+    )
+
+
+@scenario('friend_suggestions')
+def friend_suggestions_scenario(seeded, repeat):
+    """Compare snapshot friend suggestions with the same ranking in SQL"""
+    from .friend_suggestions import DEFAULT_LIMIT, snapshot, suggest_friends
+
+    started = time.perf_counter()
+    snapshot.rebuild()
+    rebuild_ms = (time.perf_counter() - started) * 1000
+
+    users = seeded['users'][:10]
+    checked = all(
+        suggest_friends(user, DEFAULT_LIMIT) == sql_suggestions(user, DEFAULT_LIMIT)
+        for user in users
+    )
+    return {
+        'users': len(seeded['users']),
+        'snapshot_rebuild_ms': round(rebuild_ms, 3),
+        'results_match': checked,
+        'snapshot': measure(lambda: [suggest_friends(user, DEFAULT_LIMIT) for user in users], repeat),
+        'sql': measure(lambda: [sql_suggestions(user, DEFAULT_LIMIT) for user in users], repeat),
+    }
+
+
+@scenario('auth')
+def auth_scenario(seeded, repeat):
+    """Time JWT authentication per request, with and without the cached user columns"""
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from ..authentication import CachedJWTAuthentication
+
+    batch = 200
+    users = seeded['users'][:batch]
+    requests = [
+        Request(APIRequestFactory().get('/api/users/me/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(u)}'))
+        for u in users
+    ]
+
+    def per_request(report):
+        """Turn batch milliseconds into microseconds per request"""
+        return {key.replace('_ms', '_us'): round(value / len(requests) * 1000, 2) for key, value in report.items()}
+
+    report = {'requests_per_sample': len(requests)}
+    for label, backend in [('jwt', JWTAuthentication()), ('cached_jwt', CachedJWTAuthentication())]:
+        for r in requests:
+            backend.authenticate(r)
+        report[f'{label}_per_request'] = per_request(
+            measure(lambda: [backend.authenticate(r) for r in requests], repeat)
+        )
+    return report
+
+
+@scenario('serializers')
+def serializers_scenario(seeded, repeat):
+    """Compare DRF serializers with row mappers and JSONRenderer with orjson on 10k-row lists"""
+    from rest_framework.renderers import JSONRenderer
+
+    from ..models import Friendship, UserCourse
+    from ..renderers import ORJSONRenderer
+    from ..row_mappers import MAPPERS
+    from ..serializers import FriendshipSerializer, UserCourseSerializer
+
+    rows = 10000
+    querysets = {
+        'friendships': (Friendship.objects.select_related('requester', 'addressee'), FriendshipSerializer),
+        'enrollments': (UserCourse.objects.select_related('course'), UserCourseSerializer),
+    }
+    report = {'rows': rows}
+    for name, (queryset, serializer_class) in querysets.items():
+        queryset = queryset.order_by('pk')[:rows]
+        mapper = MAPPERS[serializer_class]
+        serializer = measure(lambda: serializer_class(queryset.all(), many=True).data, repeat)
+        mapped = measure(lambda: mapper.map_rows(mapper.values(queryset.all())), repeat)
+        data = mapper.map_rows(mapper.values(queryset))
+        report[name] = {
+            'serializer': serializer,
+            'row_mapper': mapped,
+            'serializer_rows_per_s': round(rows / serializer['p50_ms'] * 1000),
+            'row_mapper_rows_per_s': round(rows / mapped['p50_ms'] * 1000),
+            'json_renderer': measure(lambda: JSONRenderer().render(data), repeat),
+            'orjson_renderer': measure(lambda: ORJSONRenderer().render(data), repeat),
+        }
+    return report
+
+
+@scenario('conditional_get')
+def conditional_get_scenario(seeded, repeat):
+    """Compare full GETs of the conditional endpoints with revalidations answered by 304"""
+    from rest_framework.test import force_authenticate
+
+    from ..models import UserCourse
+    from ..views import SocialMediaLinkViewSet, UserCourseViewSet, UserViewSet
+
+    # The user with the most enrollments, so the payloads are not trivially small
+    user = max(seeded['users'][:200], key=lambda u: UserCourse.objects.filter(user=u).count())
+    endpoints = {
+        '/api/users/me/': UserViewSet.as_view({'get': 'me'}),
+        '/api/enrollments/': UserCourseViewSet.as_view({'get': 'list'}),
+        '/api/enrollments/user_courses/': UserCourseViewSet.as_view({'get': 'user_courses'}),
+        '/api/enrollments/upcoming_sessions/?limit=50': UserCourseViewSet.as_view({'get': 'upcoming_sessions'}),
+        '/api/social-links/': SocialMediaLinkViewSet.as_view({'get': 'list'}),
+    }
+
+    def get(view, path, **headers):
+        request = APIRequestFactory(SERVER_NAME='localhost').get(path, **headers)
+        force_authenticate(request, user)
+        return view(request).render()
+
+    report = {}
+    for path, view in endpoints.items():
+        full = get(view, path)
+        etag = full['ETag']
+        revalidated = get(view, path, HTTP_IF_NONE_MATCH=etag)
+        report[path] = {
+            'status': [full.status_code, revalidated.status_code],
+            'bytes_200': len(full.content),
+            'bytes_304': len(revalidated.content),
+            'get_200': measure(lambda: get(view, path), repeat),
+            'get_304': measure(lambda: get(view, path, HTTP_IF_NONE_MATCH=etag), repeat),
+        }
+    return report
+
+
+@scenario('sync')
+def sync_scenario(seeded, repeat):
+    """Compare a full sync with a delta sync after a handful of changes"""
+    import json
+
+    from ..models import UserCourse
+    from .change_feed import changes_since, compact_changes, full_sync
+
+    user = max(seeded['users'][:200], key=lambda u: UserCourse.objects.filter(user=u).count())
+    since = full_sync(user)['next']
+    enrolled = set(UserCourse.objects.filter(user=user).values_list('course_id', flat=True))
+    new_course = next(course for course in seeded['courses'] if course.course_id not in enrolled)
+    # A few changes: two enrollment edits, a profile edit and a social link edited twice
+    UserCourse.objects.create(user=user, course=new_course)
+    UserCourse.objects.filter(user=user).exclude(course=new_course).first().delete()
+    user.bio = 'benchmarked'
+    user.save()
+    for name in ('@bench', '@bench2'):
+        user.social_links.update_or_create(platform='Instagram', defaults={'name': name})
+
+    def size(payload):
+        return len(json.dumps(payload, default=str))
+
+    return {
+        'full_sync_bytes': size(full_sync(user)),
+        'delta_sync_bytes': size(changes_since(user, since)),
+        'full_sync': measure(lambda: full_sync(user), repeat),
+        'delta_sync': measure(lambda: changes_since(user, since), repeat),
+        'compaction': compact_changes(),
+    }
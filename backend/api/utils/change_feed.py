@@ -0,0 +1,199 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Q
+from django.utils import timezone
+
+from ..models import ChangeCompaction, ChangeRecord, Friendship, SocialMediaLink, User, UserCourse
+from ..row_mappers import serialize_rows
+from ..serializers import (
+    FriendshipSerializer,
+    SocialMediaLinkSerializer,
+    UserBasicSerializer,
+    UserCourseSerializer,
+)
+from .friend_suggestions import related_user_ids
+
+USER = 'user'
+FRIENDSHIP = 'friendship'
+ENROLLMENT = 'enrollment'
+SOCIAL_LINK = 'social_link'
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+# The User fields the feed carries (UserBasicSerializer); saves touching
+# none of them, such as logins, are not recorded
+USER_FEED_FIELDS = {'username', 'first_name', 'last_name', 'profile_picture_url', 'bio'}
+
+
+def feeds(user):
+    """
+    What each kind of record syncs, for `user`.
+    Returns:
+        Dict kind -> (response key, primary key of the payload, queryset, serializer class)
+    """
+    return {
+        USER: ('users', 'id', User.objects.all(), UserBasicSerializer),
+        FRIENDSHIP: (
+            'friendships',
+            'friendship_id',
+            Friendship.objects.filter(Q(requester=user) | Q(addressee=user)).select_related('requester', 'addressee'),
+            FriendshipSerializer,
+        ),
+        ENROLLMENT: (
+            'enrollments',
+            'user_course_id',
+            UserCourse.objects.filter(user=user).select_related('course'),
+            UserCourseSerializer,
+        ),
+        SOCIAL_LINK: ('social_links', 'link_id', SocialMediaLink.objects.filter(user=user), SocialMediaLinkSerializer),
+    }
+
+
+def record(kind, object_ids, user_ids, deleted=False):
+    """
+    Append change records to the feeds of `user_ids`.
+    Args:
+        kind: USER, FRIENDSHIP, ENROLLMENT or SOCIAL_LINK
+        object_ids: Primary keys of the changed objects
+        user_ids: Users who can see the objects
+        deleted: Whether the records are tombstones
+    """
+    ChangeRecord.objects.bulk_create([
+        ChangeRecord(user_id=user_id, kind=kind, object_id=object_id, deleted=deleted)
+        for user_id in set(user_ids)
+        for object_id in object_ids
+    ])
+
+
+def user_audience(user_id):
+    """The user and everyone with a pending or accepted friendship with them"""
+    return related_user_ids(user_id) | {user_id}
+
+
+def compaction_horizon():
+    """The highest seq compact_changes has dropped records through, or 0"""
+    return ChangeCompaction.objects.aggregate(seq=Max('through_seq'))['seq'] or 0
+
+
+def settled_since():
+    """
+    Records created before this time are settled: every lower seq belongs
+    to a transaction that has committed or rolled back by now. seq is
+    taken at insert, so a newer record can be visible while an older
+    transaction still holds a lower seq; cursors never pass such a record.
+    """
+    return timezone.now() - timedelta(seconds=settings.CHANGE_FEED_GRACE_SECONDS)
+
+
+def full_sync(user, reset=False):
+    """
+    Everything the feed covers for a user, as upserts.
+    Returns:
+        Sync payload whose `next` is the user's latest settled seq
+    """
+    # Read the cursor first: a change landing while the rows are read is sent again next time
+    latest = (
+        ChangeRecord.objects
+        .filter(user=user, created_at__lte=settled_since())
+        .aggregate(seq=Max('seq'))['seq']
+    )
+    payload = {'next': max(latest or 0, compaction_horizon()), 'has_more': False, 'reset': reset}
+    for kind, (key, _, queryset, serializer_class) in feeds(user).items():
+        if kind == USER:
+            queryset = queryset.filter(pk__in=user_audience(user.id))
+        payload[key] = {
+            'upserts': serialize_rows(queryset.order_by('pk'), serializer_class),
+            'deleted': [],
+        }
+    return payload
+
+
+def changes_since(user, since, limit=DEFAULT_LIMIT):
+    """
+    Compact a user's changes after `since` into upserts and tombstones.
+    An object changed several times is sent once, in its current state.
+    `next` stops before the first record that is not settled yet (see
+    settled_since), so records from the last CHANGE_FEED_GRACE_SECONDS
+    are sent again by the next sync.
+    Args:
+        user: The syncing user
+        since: Last seq the client has seen
+        limit: Maximum number of records to read; `has_more` is set when
+            there may be more and the cursor moved
+    Returns:
+        Sync payload, or a full sync with `reset` set if records after
+        `since` have been compacted away
+    """
+    if since < compaction_horizon():
+        return full_sync(user, reset=True)
+
+    records = list(
+        ChangeRecord.objects
+        .filter(user=user, seq__gt=since)
+        .order_by('seq')
+        .values_list('seq', 'kind', 'object_id', 'deleted', 'created_at')[:limit]
+    )
+    settled = settled_since()
+    cursor, settling = since, True
+    latest = {}
+    for seq, kind, object_id, deleted, created_at in records:
+        latest[kind, object_id] = deleted
+        settling = settling and created_at <= settled
+        if settling:
+            cursor = seq
+    changed = defaultdict(list)
+    deleted = defaultdict(list)
+    for (kind, object_id), is_deleted in latest.items():
+        (deleted if is_deleted else changed)[kind].append(object_id)
+
+    payload = {
+        'next': cursor,
+        # A full page of unsettled records cannot move the cursor; the client retries later
+        'has_more': len(records) == limit and cursor > since,
+        'reset': False,
+    }
+    for kind, (key, pk, queryset, serializer_class) in feeds(user).items():
+        upserts = []
+        if changed[kind]:
+            upserts = serialize_rows(queryset.filter(pk__in=changed[kind]).order_by('pk'), serializer_class)
+        # Objects recorded as changed that are gone (or out of view) by now are deletes too
+        found = {row[pk] for row in upserts}
+        gone = [object_id for object_id in changed[kind] if object_id not in found]
+        payload[key] = {'upserts': upserts, 'deleted': sorted(deleted[kind] + gone)}
+    return payload
+
+
+def compact_changes(retention_days=None):
+    """
+    Shrink the change feed.
+    Drops records superseded by a newer record for the same object and
+    records of deleted users, which no sync can tell apart from the newest
+    record, then every record older than `retention_days`. The last step
+    is logged as a ChangeCompaction so clients with older cursors get a
+    full sync.
+    Args:
+        retention_days: Days of history to keep, CHANGE_FEED_RETENTION_DAYS by default
+    Returns:
+        Dict with the number of superseded, orphaned and expired records dropped
+    """
+    if retention_days is None:
+        retention_days = settings.CHANGE_FEED_RETENTION_DAYS
+
+    newer = ChangeRecord.objects.filter(
+        user=OuterRef('user'), kind=OuterRef('kind'), object_id=OuterRef('object_id'), seq__gt=OuterRef('seq')
+    )
+    superseded, _ = ChangeRecord.objects.filter(Exists(newer)).delete()
+    orphaned, _ = ChangeRecord.objects.filter(~Exists(User.objects.filter(pk=OuterRef('user')))).delete()
+
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    through = ChangeRecord.objects.filter(created_at__lt=cutoff).aggregate(seq=Max('seq'))['seq']
+    expired = 0
+    if through is not None:
+        with transaction.atomic():
+            ChangeCompaction.objects.create(through_seq=through)
+            expired, _ = ChangeRecord.objects.filter(seq__lte=through).delete()
+    return {'superseded': superseded, 'orphaned': orphaned, 'expired': expired}
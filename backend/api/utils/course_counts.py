@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ..models import Course, UserCourse
+
+# Annotation the live fallback puts on course querysets
+LIVE_COUNT = 'live_enrolled_count'
+
+
+def adjust_enrolled_counts(course_ids, delta):
+    """
+    Add `delta` to Course.enrolled_count of each course in one UPDATE.
+    Args:
+        course_ids: Ids of the courses gaining or losing an enrollment
+        delta: +1 per enrollment, -1 per unenrollment
+    """
+    if not course_ids or not delta:
+        return
+    courses = Course.objects.filter(course_id__in=course_ids)
+    if delta < 0:
+        courses = courses.filter(enrolled_count__gte=-delta)
+    courses.update(enrolled_count=F('enrolled_count') + delta)
+
+
+def live_counts():
+    """Subquery counting the UserCourse rows of the outer course"""
+    return (
+        UserCourse.objects
+        .filter(course=OuterRef('pk'))
+        .order_by()
+        .values('course')
+        .annotate(c=Count('*'))
+        .values('c')
+    )
+
+
+def uses_live_counts():
+    return settings.COURSE_ENROLLED_COUNTS == 'live'
+
+
+def with_enrolled_counts(queryset):
+    """
+    Annotate courses with a live enrollment count when the
+    COURSE_ENROLLED_COUNTS setting is 'live', e.g. until the stored
+    counts have been reconciled after a deploy.
+    """
+    if not uses_live_counts():
+        return queryset
+    return queryset.annotate(**{LIVE_COUNT: Coalesce(Subquery(live_counts()), Value(0))})
+
+
+def enrolled_count(course):
+    """Return a course's enrollment count, live if the queryset annotated one"""
+    return getattr(course, LIVE_COUNT, course.enrolled_count)
+
+
+def popular_ordering():
+    """Cursor ordering for the most popular courses first"""
+    return (f'-{LIVE_COUNT}' if uses_live_counts() else '-enrolled_count', 'pk')
+
+
+def reconcile_enrollment_counts():
+    """
+    Recompute every Course.enrolled_count from UserCourse.
+    Returns:
+        Number of courses whose count changed
+    """
+    with transaction.atomic():
+        stale = len(verify_enrollment_counts())
+        Course.objects.update(enrolled_count=Coalesce(Subquery(live_counts()), Value(0)))
+    return stale
+
+
+def verify_enrollment_counts():
+    """
+    Compare stored enrollment counts with UserCourse.
+    Returns:
+        List of (course_id, stored, expected) tuples, empty when consistent
+    """
+    counted = Course.objects.annotate(expected=Coalesce(Subquery(live_counts()), Value(0)))
+    return [
+        (course_id, stored, expected)
+        for course_id, stored, expected in counted.values_list('course_id', 'enrolled_count', 'expected')
+        if stored != expected
+    ]
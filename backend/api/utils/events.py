@@ -0,0 +1,137 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from ..serializers import UserBasicSerializer
+
+FRIENDSHIP_REQUESTED = 'friendship_requested'
+FRIENDSHIP_ACCEPTED = 'friendship_accepted'
+FRIENDSHIP_REJECTED = 'friendship_rejected'
+FRIENDSHIP_REMOVED = 'friendship_removed'
+
+# Queued in place of the events a subscriber was too slow to take
+OVERFLOW = {'type': 'overflow'}
+
+
+class Subscription:
+    """
+    One open event stream: a bounded queue on the event loop that opened it.
+    When the reader falls EVENTS_QUEUE_SIZE events behind, the queue is
+    replaced by a single OVERFLOW marker and the stream ends, so a slow
+    client costs a resync instead of unbounded memory.
+    """
+
+    def __init__(self, user_id, queue_size):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def put(self, event):
+        """Queue an event; must run on the subscription's loop"""
+        if self.overflowed:
+            return
+        if self.queue.full():
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = OVERFLOW
+        self.queue.put_nowait(event)
+
+
+def put_all(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.put(event)
+
+
+class InProcessBroker:
+    """
+    Pub/sub between the views and the event streams of one process.
+    A broker for several workers (Redis pub/sub and the like) only needs
+    the same subscribe/unsubscribe/publish methods; pick it with
+    API_EVENT_BROKER.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+        self.count = 0
+
+    def subscribe(self, user_id):
+        """
+        Open a subscription to a user's events. Call from the event loop
+        that will read it.
+        Returns:
+            Subscription, or None if the process already has EVENTS_MAX_STREAMS
+        """
+        with self.lock:
+            if self.count >= settings.EVENTS_MAX_STREAMS:
+                return None
+            subscription = Subscription(user_id, settings.EVENTS_QUEUE_SIZE)
+            self.subscribers[user_id].add(subscription)
+            self.count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.user_id, set())
+            if subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self.count -= 1
+            if not subscriptions:
+                self.subscribers.pop(subscription.user_id, None)
+
+    def publish(self, user_id, event):
+        """Send an event to every open stream of a user; callable from any thread"""
+        by_loop = defaultdict(list)
+        with self.lock:
+            for subscription in self.subscribers.get(user_id, ()):
+                by_loop[subscription.loop].append(subscription)
+        # One hop per event loop rather than per stream
+        for loop, subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(put_all, subscriptions, event)
+            except RuntimeError:
+                # The loop has shut down; its streams are unsubscribing
+                pass
+
+
+_broker = None
+
+
+def get_broker():
+    """Return the broker named by the API_EVENT_BROKER setting, created on first use"""
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.API_EVENT_BROKER)()
+    return _broker
+
+
+def publish_friendship(event_type, friendship, actor):
+    """
+    Tell both sides of a friendship about a change once the transaction commits.
+    Args:
+        event_type: FRIENDSHIP_REQUESTED, FRIENDSHIP_ACCEPTED, FRIENDSHIP_REJECTED or FRIENDSHIP_REMOVED
+        friendship: The friendship that changed
+        actor: The user who changed it
+    """
+    # The views may have set the ids straight from request data
+    requester_id, addressee_id = int(friendship.requester_id), int(friendship.addressee_id)
+    event = {
+        'type': event_type,
+        'friendship_id': friendship.pk,
+        'requester_id': requester_id,
+        'addressee_id': addressee_id,
+        'status': friendship.status,
+        'user': dict(UserBasicSerializer(actor).data),
+    }
+
+    def publish():
+        broker = get_broker()
+        for user_id in (requester_id, addressee_id):
+            broker.publish(user_id, event)
+    transaction.on_commit(publish)
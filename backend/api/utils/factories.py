@@ -0,0 +1,132 @@
+import random
+from datetime import time
+
+from ..models import Course, Friendship, SocialMediaLink, User, UserCourse
+from . import profile_cache
+from .course_counts import reconcile_enrollment_counts
+from .friend_graph import rebuild_friend_graph
+from .study_matching import rebuild_study_matches
+
+SCALES = {
+    '1k': 1_000,
+    '10k': 10_000,
+    '100k': 100_000,
+}
+
+SUBJECTS = ['Computer Science', 'Mathematics', 'Physics', 'Chemistry', 'Biology', 'Economics']
+FRIENDSHIP_STATUSES = ['pending', 'accepted', 'rejected']
+BATCH_SIZE = 5000
+
+
+def parse_scale(scale):
+    """
+    Resolve a scale name ('1k', '10k', '100k') or plain number to a user count.
+    """
+    if isinstance(scale, int):
+        return scale
+    return SCALES.get(scale) or int(scale)
+
+
+def make_courses(count, rng):
+    """Create `count` courses spread over the week's study slots"""
+    days = [code for code, _ in Course.days_of_week]
+    courses = [
+        Course(
+            course_code=f'SYN{i:04d}',
+            title=f'Synthetic Course {i}',
+            subject=rng.choice(SUBJECTS),
+            description='',
+            study_schedules_day=rng.choice(days),
+            study_schedules_time=time(rng.randrange(8, 20), rng.choice([0, 30])),
+        )
+        for i in range(count)
+    ]
+    # bulk_create skips Course.save(), which normally fills weekly_slot
+    for course in courses:
+        course.weekly_slot = course.compute_weekly_slot()
+    return Course.objects.bulk_create(courses, batch_size=BATCH_SIZE)
+
+
+def make_users(count, prefix='user'):
+    """Create `count` users with unusable passwords (hashing would dominate seeding time)"""
+    start = User.objects.count()
+    users = [
+        User(
+            username=f'{prefix}{start + i}',
+            email=f'{prefix}{start + i}@example.com',
+            first_name='Synthetic',
+            last_name=f'User{start + i}',
+            bio='Seeded by api.utils.factories',
+            password='!',
+        )
+        for i in range(count)
+    ]
+    return User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+
+
+def seed(scale='1k', courses_per_user=4, friendships_per_user=5, course_count=None, seed_value=42):
+    """
+    Seed synthetic users, courses, enrollments, friendships and social links.
+    Args:
+        scale: Number of users, or one of SCALES
+        courses_per_user: Enrollments per user
+        friendships_per_user: Friendship rows per user (mixed statuses)
+        course_count: Number of courses, defaults to one per 20 users (at least 10)
+        seed_value: Random seed, so runs are comparable across commits
+    Returns:
+        Dict with the created `users` and `courses` and row counts
+    """
+    rng = random.Random(seed_value)
+    user_count = parse_scale(scale)
+    course_count = course_count or max(user_count // 20, 10)
+
+    courses = make_courses(course_count, rng)
+    users = make_users(user_count)
+    user_ids = [u.id for u in users]
+    course_ids = [c.course_id for c in courses]
+
+    enrollments = set()
+    for user_id in user_ids:
+        for course_id in rng.sample(course_ids, min(courses_per_user, len(course_ids))):
+            enrollments.add((user_id, course_id))
+    UserCourse.objects.bulk_create(
+        [UserCourse(user_id=u, course_id=c) for u, c in enrollments],
+        batch_size=BATCH_SIZE
+    )
+
+    pairs = set()
+    target = min(user_count * friendships_per_user, user_count * (user_count - 1) // 2)
+    while len(pairs) < target:
+        a, b = rng.sample(user_ids, 2)
+        if (b, a) not in pairs:
+            pairs.add((a, b))
+    Friendship.objects.bulk_create(
+        [
+            Friendship(requester_id=a, addressee_id=b, status=rng.choice(FRIENDSHIP_STATUSES))
+            for a, b in pairs
+        ],
+        batch_size=BATCH_SIZE
+    )
+
+    SocialMediaLink.objects.bulk_create(
+        [
+            SocialMediaLink(user_id=user_id, platform=platform, name=f'synthetic{user_id}')
+            for user_id in user_ids
+            for platform, _ in SocialMediaLink.platform_choices
+            if rng.random() < 0.5
+        ],
+        batch_size=BATCH_SIZE
+    )
+
+    rebuild_friend_graph(batch_size=BATCH_SIZE)
+    reconcile_enrollment_counts()
+    rebuild_study_matches(batch_size=BATCH_SIZE)
+    # bulk_create skips the signals that invalidate cached profiles
+    profile_cache.invalidate_all()
+
+    return {
+        'users': users,
+        'courses': courses,
+        'enrollments': len(enrollments),
+        'friendships': len(pairs),
+    }
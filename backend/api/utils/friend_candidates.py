@@ -0,0 +1,74 @@
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q
+
+from ..models import Friendship, User, UserCourse
+from .s3_utils import get_full_s3_url
+
+
+def addable_users_queryset(user):
+    """
+    Build the candidate queryset for users that can be added as friends.
+    Args:
+        user: The user looking for new friends
+    Returns:
+        Queryset of users with no pending/accepted friendship with `user`,
+        annotated with `shared_courses` and ordered by it (most shared first),
+        with enrollments and their courses prefetched for tags.
+    """
+    related = Friendship.objects.filter(
+        Q(requester=user, addressee=OuterRef('pk')) |
+        Q(addressee=user, requester=OuterRef('pk'))
+    ).exclude(status='rejected')
+
+    my_course_ids = UserCourse.objects.filter(user=user).values('course_id')
+
+    return (
+        User.objects
+        .exclude(pk=user.pk)
+        .filter(~Exists(related))
+        .annotate(shared_courses=Count(
+            'usercourse',
+            filter=Q(usercourse__course_id__in=my_course_ids)
+        ))
+        .order_by('-shared_courses', 'id')
+        .prefetch_related(course_tags_prefetch())
+    )
+
+
+def course_tags_prefetch():
+    """Prefetch the enrollments and course titles serialize_candidate lists as tags"""
+    return Prefetch(
+        'usercourse_set',
+        queryset=UserCourse.objects.select_related('course').only('user_id', 'course__title')
+    )
+
+
+def serialize_candidate(user):
+    """Build the addable-user payload consumed by the add friends screen"""
+    return {
+        'id': user.id,
+        'name': user.get_full_name(),
+        'bio': user.bio,
+        'profile_picture_url': get_full_s3_url(user.profile_picture_url),
+        'tags': [uc.course.title for uc in user.usercourse_set.all()],
+        'shared_courses': user.shared_courses,
+    }
+
+
+def suggested_users(suggestions):
+    """
+    Load the users behind friend_suggestions.suggest_friends results.
+    Returns:
+        Users in suggestion order, annotated with `shared_courses` and
+        `mutual_friends` and with their course tags prefetched
+    """
+    users = User.objects.filter(id__in=[user_id for user_id, _, _ in suggestions]).prefetch_related(
+        course_tags_prefetch()
+    ).in_bulk()
+    rows = []
+    for user_id, mutual_friends, shared_courses in suggestions:
+        user = users.get(user_id)
+        if user is not None:
+            user.mutual_friends = mutual_friends
+            user.shared_courses = shared_courses
+            rows.append(user)
+    return rows
@@ -0,0 +1,154 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..models import FriendAdjacency, Friendship, User
+from . import friend_suggestions, profile_cache
+
+
+def link_friends(friendship):
+    """
+    Add both adjacency rows for an accepted friendship and bump friend counts.
+    Args:
+        friendship: Friendship that has just been accepted
+    Returns:
+        True if the pair was linked, False if it was already linked
+    """
+    a, b = friendship.requester_id, friendship.addressee_id
+    pair = FriendAdjacency.objects.filter(user_id__in=[a, b], friend_id__in=[a, b])
+    with transaction.atomic():
+        # Concurrent accepts of the pair wait here (SQLite serializes writes anyway)
+        list(User.objects.select_for_update().filter(id__in=[a, b]).order_by('id').values_list('id', flat=True))
+        existing = set(pair.values_list('pk', flat=True))
+        FriendAdjacency.objects.bulk_create([
+            FriendAdjacency(user_id=a, friend_id=b, friendship=friendship),
+            FriendAdjacency(user_id=b, friend_id=a, friendship=friendship),
+        ], ignore_conflicts=True)
+        # Count only the rows this call inserted
+        edges = [edge for edge in pair if edge.pk not in existing]
+        if not edges:
+            return False
+        User.objects.filter(id__in=[edge.user_id for edge in edges]).update(
+            friend_count=F('friend_count') + 1, updated_at=timezone.now()
+        )
+        friend_suggestions.friends_linked(a, b, edges)
+    return True
+
+
+def unlink_friends(friendship):
+    """
+    Remove the adjacency rows backed by a friendship and decrement friend counts.
+    If another accepted friendship still joins the pair, the edges are moved to it.
+    Args:
+        friendship: Friendship being rejected or removed
+    Returns:
+        True if the pair was unlinked, False if it was not linked
+    """
+    a, b = friendship.requester_id, friendship.addressee_id
+    with transaction.atomic():
+        deleted, _ = FriendAdjacency.objects.filter(friendship=friendship).delete()
+        if not deleted:
+            return False
+        friend_suggestions.friends_unlinked(a, b, deleted)
+        User.objects.filter(id__in=[a, b], friend_count__gt=0).update(
+            friend_count=F('friend_count') - 1, updated_at=timezone.now()
+        )
+        other = Friendship.objects.filter(
+            Q(requester_id=a, addressee_id=b) | Q(requester_id=b, addressee_id=a),
+            status='accepted'
+        ).exclude(pk=friendship.pk).first()
+        if other:
+            link_friends(other)
+    return True
+
+
+def user_deleting(user_id):
+    """
+    Decrement the friend counts of a user's friends before the user is
+    deleted; the cascade removes the adjacency rows without touching them.
+    """
+    friends = list(FriendAdjacency.objects.filter(user_id=user_id).values_list('friend_id', flat=True))
+    User.objects.filter(id__in=friends, friend_count__gt=0).update(
+        friend_count=F('friend_count') - 1, updated_at=timezone.now()
+    )
+    friend_suggestions.user_deleting(user_id, friends)
+
+
+def friend_ids(user):
+    """Return the ids of the user's accepted friends with a single indexed read"""
+    return list(FriendAdjacency.objects.filter(user=user).values_list('friend_id', flat=True))
+
+
+def expected_edges():
+    """
+    Derive the adjacency rows implied by accepted Friendship rows.
+    Returns:
+        Dict mapping (user_id, friend_id) to the friendship_id backing it
+    """
+    edges = {}
+    accepted = Friendship.objects.filter(status='accepted').order_by('friendship_id')
+    for friendship_id, a, b in accepted.values_list('friendship_id', 'requester_id', 'addressee_id'):
+        if a == b:
+            continue
+        edges.setdefault((a, b), friendship_id)
+        edges.setdefault((b, a), friendship_id)
+    return edges
+
+
+def rebuild_friend_graph(batch_size=1000):
+    """
+    Rebuild FriendAdjacency and User.friend_count from Friendship.
+    Args:
+        batch_size: Rows per bulk insert
+    Returns:
+        Number of adjacency rows written
+    """
+    edges = expected_edges()
+    with transaction.atomic():
+        FriendAdjacency.objects.all().delete()
+        FriendAdjacency.objects.bulk_create(
+            [
+                FriendAdjacency(user_id=a, friend_id=b, friendship_id=friendship_id)
+                for (a, b), friendship_id in edges.items()
+            ],
+            batch_size=batch_size
+        )
+        counts = (
+            FriendAdjacency.objects
+            .filter(user=OuterRef('pk'))
+            .order_by()
+            .values('user')
+            .annotate(c=Count('*'))
+            .values('c')
+        )
+        User.objects.update(friend_count=Coalesce(Subquery(counts), Value(0)), updated_at=timezone.now())
+    # Bulk updates skip the signals that keep cached profiles fresh
+    profile_cache.invalidate_all(profile_cache.USER)
+    return len(edges)
+
+
+def verify_friend_graph():
+    """
+    Compare the adjacency structure with Friendship.
+    Returns:
+        Dict with `missing` and `extra` edge lists and `bad_counts`,
+        a list of (user_id, stored, expected) tuples. All empty when consistent.
+    """
+    expected = set(expected_edges())
+    actual = set(FriendAdjacency.objects.values_list('user_id', 'friend_id'))
+
+    expected_counts = {}
+    for user_id, _ in expected:
+        expected_counts[user_id] = expected_counts.get(user_id, 0) + 1
+
+    bad_counts = [
+        (user_id, stored, expected_counts.get(user_id, 0))
+        for user_id, stored in User.objects.values_list('id', 'friend_count')
+        if stored != expected_counts.get(user_id, 0)
+    ]
+    return {
+        'missing': sorted(expected - actual),
+        'extra': sorted(actual - expected),
+        'bad_counts': bad_counts,
+    }
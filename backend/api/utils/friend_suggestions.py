@@ -0,0 +1,286 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from ..models import FriendAdjacency, Friendship, UserCourse
+
+# A mutual friend counts for this many shared courses
+MUTUAL_FRIEND_WEIGHT = 2
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def insert_sorted(ids, value):
+    """Insert `value` into a sorted id array unless it is already there"""
+    position = bisect_left(ids, value)
+    if position == len(ids) or ids[position] != value:
+        ids.insert(position, value)
+
+
+def remove_sorted(ids, value):
+    position = bisect_left(ids, value)
+    if position < len(ids) and ids[position] == value:
+        del ids[position]
+
+
+class FriendGraphSnapshot:
+    """
+    In-process snapshot of accepted friendships and enrollments.
+    Holds sorted integer id arrays: each user's friends, each user's
+    courses and each course's members. Changes made in this process are
+    applied in place after commit; a signature over FriendAdjacency and
+    UserCourse catches everything else (other processes, raw SQL) and
+    triggers a rebuild. The signature costs two table counts, so it is
+    checked at most every FRIEND_SNAPSHOT_CHECK_SECONDS.
+    A rebuild reads the tables without holding the lock, so suggestions
+    keep being served from the old arrays meanwhile. Changes applied
+    during the read are logged and replayed onto the new arrays before
+    they are swapped in.
+    """
+
+    def __init__(self):
+        # Guards the arrays; only held for in-memory work
+        self.lock = threading.Lock()
+        # One rebuild at a time
+        self.build_lock = threading.Lock()
+        self.friends = {}
+        self.courses = {}
+        self.members = {}
+        self.signature = None
+        self.checked_at = 0.0
+        # Changes applied while a rebuild reads the tables, or None
+        self.changes = None
+
+    def current_signature(self):
+        """Row counts and max ids of the two source tables"""
+        edges = FriendAdjacency.objects.aggregate(count=Count('pk'), last=Max('pk'))
+        enrollments = UserCourse.objects.aggregate(count=Count('pk'), last=Max('pk'))
+        return (edges['count'], edges['last'] or 0, enrollments['count'], enrollments['last'] or 0)
+
+    def is_fresh(self):
+        checked_recently = time.monotonic() - self.checked_at < settings.FRIEND_SNAPSHOT_CHECK_SECONDS
+        return self.signature is not None and checked_recently
+
+    def rebuild(self, signature=None):
+        with self.build_lock:
+            self._rebuild(signature)
+
+    def _rebuild(self, signature=None):
+        with self.lock:
+            self.changes = []
+        try:
+            # Taken before the read: a change landing during it makes the next check rebuild again
+            signature = signature or self.current_signature()
+            friends = defaultdict(list)
+            for user_id, friend_id in FriendAdjacency.objects.values_list('user_id', 'friend_id').iterator():
+                friends[user_id].append(friend_id)
+            courses = defaultdict(list)
+            members = defaultdict(list)
+            for user_id, course_id in UserCourse.objects.values_list('user_id', 'course_id').iterator():
+                courses[user_id].append(course_id)
+                members[course_id].append(user_id)
+
+            def pack(lists):
+                return {key: array('l', sorted(ids)) for key, ids in lists.items()}
+
+            friends, courses, members = pack(friends), pack(courses), pack(members)
+        except BaseException:
+            with self.lock:
+                self.changes = None
+            raise
+
+        with self.lock:
+            self.friends, self.courses, self.members = friends, courses, members
+            self.signature = signature
+            for change in self.changes:
+                change()
+            self.changes = None
+            self.checked_at = time.monotonic()
+
+    def ensure_current(self):
+        """Rebuild if the source tables changed behind the snapshot's back"""
+        if self.is_fresh():
+            return
+        # While another thread rebuilds, keep serving the current arrays; wait only if there are none
+        if not self.build_lock.acquire(blocking=self.signature is None):
+            return
+        try:
+            if self.is_fresh():
+                return
+            signature = self.current_signature()
+            with self.lock:
+                current = self.matches(signature)
+                if current:
+                    self.signature = signature
+                    self.checked_at = time.monotonic()
+            if not current:
+                self._rebuild(signature)
+        finally:
+            self.build_lock.release()
+
+    def apply(self, change):
+        """Run `change` on the arrays, and again on the arrays a running rebuild is reading"""
+        with self.lock:
+            if self.changes is not None:
+                self.changes.append(change)
+            if self.signature is not None:
+                change()
+
+    def _shift_signature(self, edges=0, last_edge=0, enrollments=0, last_enrollment=0):
+        """
+        Account for rows written in this process. A delete may have taken
+        the max id, so that is left unknown (None) for the next check to read.
+        """
+        def shift_max(current, removed, last):
+            return None if removed or current is None else max(current, last)
+
+        edge_count, edge_max, enrollment_count, enrollment_max = self.signature
+        self.signature = (
+            edge_count + edges,
+            shift_max(edge_max, edges < 0, last_edge),
+            enrollment_count + enrollments,
+            shift_max(enrollment_max, enrollments < 0, last_enrollment),
+        )
+
+    def matches(self, signature):
+        """Whether the tables' signature agrees with the snapshot's, ignoring unknown max ids"""
+        return self.signature is not None and all(
+            mine is None or mine == theirs for mine, theirs in zip(self.signature, signature)
+        )
+
+    def link(self, a, b, edge_ids):
+        """Apply a pair of adjacency rows added by friend_graph.link_friends"""
+        def change():
+            insert_sorted(self.friends.setdefault(a, array('l')), b)
+            insert_sorted(self.friends.setdefault(b, array('l')), a)
+            self._shift_signature(edges=len(edge_ids), last_edge=max(edge_ids, default=0))
+        self.apply(change)
+
+    def unlink(self, a, b, removed):
+        """Apply the removal of `removed` adjacency rows between a and b"""
+        def change():
+            remove_sorted(self.friends.get(a, array('l')), b)
+            remove_sorted(self.friends.get(b, array('l')), a)
+            self._shift_signature(edges=-removed)
+        self.apply(change)
+
+    def remove_user(self, user_id, friend_ids):
+        """Apply the cascade deleting a user's adjacency rows, both directions"""
+        def change():
+            self.friends.pop(user_id, None)
+            for friend_id in friend_ids:
+                remove_sorted(self.friends.get(friend_id, array('l')), user_id)
+            self._shift_signature(edges=-2 * len(friend_ids))
+        self.apply(change)
+
+    def enroll(self, enrollments):
+        def change():
+            for enrollment in enrollments:
+                insert_sorted(self.courses.setdefault(enrollment.user_id, array('l')), enrollment.course_id)
+                insert_sorted(self.members.setdefault(enrollment.course_id, array('l')), enrollment.user_id)
+            self._shift_signature(
+                enrollments=len(enrollments), last_enrollment=max(enrollment.pk for enrollment in enrollments)
+            )
+        self.apply(change)
+
+    def unenroll(self, enrollments):
+        def change():
+            for enrollment in enrollments:
+                remove_sorted(self.courses.get(enrollment.user_id, array('l')), enrollment.course_id)
+                remove_sorted(self.members.get(enrollment.course_id, array('l')), enrollment.user_id)
+            self._shift_signature(enrollments=-len(enrollments))
+        self.apply(change)
+
+    def suggest(self, user_id, limit, exclude=()):
+        """
+        Score friends of friends and course mates of a user.
+        Args:
+            user_id: The user looking for friends
+            limit: Number of suggestions to return
+            exclude: Further user ids to leave out, such as pending requests
+        Returns:
+            Up to `limit` (user_id, mutual_friends, shared_courses) tuples,
+            highest score first, ties broken by id
+        """
+        self.ensure_current()
+        with self.lock:
+            my_friends = self.friends.get(user_id, ())
+            mutual = Counter()
+            for friend_id in my_friends:
+                mutual.update(self.friends.get(friend_id, ()))
+            shared = Counter()
+            for course_id in self.courses.get(user_id, ()):
+                shared.update(self.members.get(course_id, ()))
+
+        skip = set(my_friends).union(exclude, (user_id,))
+        candidates = (mutual.keys() | shared.keys()) - skip
+        top = heapq.nsmallest(
+            limit,
+            candidates,
+            key=lambda c: (-(MUTUAL_FRIEND_WEIGHT * mutual[c] + shared[c]), c)
+        )
+        return [(c, mutual[c], shared[c]) for c in top]
+
+
+snapshot = FriendGraphSnapshot()
+
+
+def related_user_ids(user):
+    """Ids of users with a pending or accepted friendship with `user`, in either direction"""
+    rows = (
+        Friendship.objects
+        .filter(Q(requester=user) | Q(addressee=user))
+        .exclude(status='rejected')
+        .values_list('requester_id', 'addressee_id')
+    )
+    return {other for pair in rows for other in pair}
+
+
+def suggest_friends(user, limit=DEFAULT_LIMIT):
+    """
+    Suggest new friends for a user, ranked by mutual friends and shared courses.
+    Returns:
+        List of (user_id, mutual_friends, shared_courses) tuples, best first
+    """
+    return snapshot.suggest(user.id, limit, exclude=related_user_ids(user))
+
+
+def friends_linked(a, b, edges):
+    """Record new adjacency rows in the snapshot once the transaction commits"""
+    edge_ids = [edge.pk for edge in edges]
+    transaction.on_commit(lambda: snapshot.link(a, b, edge_ids))
+
+
+def friends_unlinked(a, b, removed):
+    transaction.on_commit(lambda: snapshot.unlink(a, b, removed))
+
+
+def user_deleting(user_id, friend_ids):
+    """Drop a user's adjacency rows, which the cascade deletes, once the transaction commits"""
+    transaction.on_commit(lambda: snapshot.remove_user(user_id, friend_ids))
+
+
+def enrollment_created(enrollment):
+    enrollments_created([enrollment])
+
+
+def enrollment_deleted(enrollment):
+    enrollments_deleted([enrollment])
+
+
+def enrollments_created(enrollments):
+    """Record UserCourse rows, with their pks, in the snapshot once the transaction commits"""
+    if enrollments:
+        transaction.on_commit(lambda: snapshot.enroll(enrollments))
+
+
+def enrollments_deleted(enrollments):
+    if enrollments:
+        transaction.on_commit(lambda: snapshot.unenroll(enrollments))
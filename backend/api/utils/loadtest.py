@@ -0,0 +1,195 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from .profiling import percentile
+
+DEFAULT_PATHS = [
+    '/api/users/me/',
+    '/api/users/{user_id}/profile_bundle/',
+    '/api/users/pending_friend_requests/',
+    '/api/enrollments/upcoming_sessions/',
+    '/api/friendships/addable-users/',
+]
+
+
+async def fetch(host, port, path, headers):
+    """
+    Send one HTTP/1.1 GET over a fresh connection.
+    Returns:
+        The response status code
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    lines = [f'GET {path} HTTP/1.1', f'Host: {host}:{port}', 'Connection: close']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(status_line.split()[1])
+
+
+async def client(host, port, paths, headers, requests, timings, errors):
+    """One simulated client: `requests` sequential GETs cycling through `paths`"""
+    for i in range(requests):
+        started = time.perf_counter()
+        try:
+            status = await fetch(host, port, paths[i % len(paths)], headers)
+        except (OSError, IndexError, ValueError):
+            status = None
+        timings.append((time.perf_counter() - started) * 1000)
+        if status != 200:
+            errors.append(status)
+
+
+async def _run_load(base_url, paths, token, concurrency, requests_per_client):
+    url = urlsplit(base_url)
+    headers = {'Authorization': f'Bearer {token}'}
+    timings, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(url.hostname, url.port or 80, paths, headers, requests_per_client, timings, errors)
+        for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(timings),
+        'errors': len(errors),
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+    }
+
+
+def run_load(base_url, paths, token, concurrency=500, requests_per_client=10):
+    """
+    Hit a running server with `concurrency` clients issuing GETs at once.
+    Args:
+        base_url: Server root, e.g. http://127.0.0.1:8000
+        paths: Paths every client cycles through
+        token: JWT access token sent as a bearer token
+        concurrency: Number of concurrent clients
+        requests_per_client: Sequential requests per client
+    Returns:
+        Dict with request/error counts, throughput and p50/p95/p99 latency
+    """
+    return asyncio.run(_run_load(base_url, paths, token, concurrency, requests_per_client))
+
+
+async def open_stream(host, port, path, headers):
+    """
+    Open a server-sent event stream and wait for its first line.
+    Returns:
+        Tuple (reader, writer)
+    Raises:
+        OSError: If the connection fails or the server does not answer 200
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    lines = [f'GET {path} HTTP/1.1', f'Host: {host}:{port}', 'Accept: text/event-stream']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if status_line.split()[1:2] != [b'200']:
+        writer.close()
+        raise OSError(f'Unexpected response: {status_line!r}')
+    while (await reader.readline()).strip():
+        pass
+    # The stream's opening `retry:` line
+    while not (await reader.readline()).startswith(b'retry:'):
+        pass
+    return reader, writer
+
+
+async def watch_stream(reader, stats, triggered):
+    """Count heartbeats and record how long after `triggered` each event arrives"""
+    while line := await reader.readline():
+        if line.startswith(b': ping'):
+            stats['heartbeats'] += 1
+        elif line.startswith(b'event:') and triggered:
+            stats['delivery_ms'].append((time.perf_counter() - triggered[0]) * 1000)
+
+
+async def post(host, port, path, headers, body):
+    """Send one HTTP/1.1 POST with a JSON body and return the status code"""
+    reader, writer = await asyncio.open_connection(host, port)
+    lines = [f'POST {path} HTTP/1.1', f'Host: {host}:{port}', 'Connection: close',
+             'Content-Type: application/json', f'Content-Length: {len(body)}']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(status_line.split()[1])
+
+
+async def _run_streams(base_url, token, connections, hold, trigger, batch):
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    headers = {'Authorization': f'Bearer {token}'}
+    streams, connect_ms, failures = [], [], 0
+
+    async def connect():
+        started = time.perf_counter()
+        try:
+            streams.append(await open_stream(host, port, '/api/events/', headers))
+            connect_ms.append((time.perf_counter() - started) * 1000)
+        except (OSError, IndexError, asyncio.IncompleteReadError):
+            return False
+        return True
+
+    for offset in range(0, connections, batch):
+        results = await asyncio.gather(*(connect() for _ in range(min(batch, connections - offset))))
+        failures += results.count(False)
+
+    stats = [{'heartbeats': 0, 'delivery_ms': []} for _ in streams]
+    triggered = []
+    watchers = [asyncio.create_task(watch_stream(reader, s, triggered)) for (reader, _), s in zip(streams, stats)]
+    await asyncio.sleep(hold)
+
+    triggered.append(time.perf_counter())
+    trigger_status = await trigger(host, port)
+    await asyncio.sleep(min(hold, 5))
+
+    for watcher in watchers:
+        watcher.cancel()
+    for _, writer in streams:
+        writer.close()
+    delivery = [ms for s in stats for ms in s['delivery_ms'][:1]]
+    heartbeats = [s['heartbeats'] for s in stats]
+    return {
+        'connections': len(streams),
+        'failed_connections': failures,
+        'connect_p50_ms': round(percentile(connect_ms, 50), 3) if connect_ms else None,
+        'connect_p95_ms': round(percentile(connect_ms, 95), 3) if connect_ms else None,
+        'hold_s': hold,
+        'min_heartbeats': min(heartbeats, default=0),
+        'trigger_status': trigger_status,
+        'delivered': len(delivery),
+        'delivery_p50_ms': round(percentile(delivery, 50), 3) if delivery else None,
+        'delivery_p95_ms': round(percentile(delivery, 95), 3) if delivery else None,
+        'delivery_p99_ms': round(percentile(delivery, 99), 3) if delivery else None,
+    }
+
+
+def run_streams(base_url, token, trigger, connections=5000, hold=30, batch=250):
+    """
+    Hold `connections` idle event streams open against a running ASGI
+    server, then fire one event at all of them.
+    Args:
+        base_url: Server root, e.g. http://127.0.0.1:8001
+        token: JWT access token of the user the streams belong to
+        trigger: Coroutine function (host, port) -> status, making the server publish an event
+        connections: Number of streams to open
+        hold: Seconds to keep the streams idle before the event
+        batch: Streams opened at once while ramping up
+    Returns:
+        Dict with connection counts and timings, heartbeats seen and event delivery latency
+    """
+    return asyncio.run(_run_streams(base_url, token, connections, hold, trigger, batch))
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+USER = 'user'
+COURSES = 'courses'
+SOCIAL_LINKS = 'social_links'
+KINDS = (USER, COURSES, SOCIAL_LINKS)
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(event, kind):
+    with _stats_lock:
+        _stats[f'{kind}.{event}'] += 1
+        _stats[event] += 1
+
+
+def stats():
+    """
+    Return hit/miss counters for this process.
+    Returns:
+        Dict with total `hits`/`misses` and per-kind `<kind>.hits`/`<kind>.misses`
+    """
+    with _stats_lock:
+        report = {'hits': 0, 'misses': 0}
+        report.update(_stats)
+        return report
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _epoch_key(kind):
+    return f'profile:{kind}:epoch'
+
+
+def _version_key(kind, user_id):
+    return f'profile:{kind}:{user_id}:version'
+
+
+def _new_version():
+    # Nanosecond clock values, so a version key that was evicted and
+    # recreated never collides with an older payload key.
+    return time.time_ns()
+
+
+def _missing_versions(kind, user_id, versions):
+    keys = (_epoch_key(kind), _version_key(kind, user_id))
+    return {key: _new_version() for key in keys if key not in versions}
+
+
+def _format_payload_key(kind, user_id, versions):
+    epoch = versions[_epoch_key(kind)]
+    version = versions[_version_key(kind, user_id)]
+    return f'profile:{kind}:{user_id}:{epoch}:{version}'
+
+
+def _payload_key(kind, user_id):
+    """Build the payload key from the global epoch and the per-user version"""
+    versions = cache.get_many([_epoch_key(kind), _version_key(kind, user_id)])
+    missing = _missing_versions(kind, user_id, versions)
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return _format_payload_key(kind, user_id, versions)
+
+
+async def _apayload_key(kind, user_id):
+    versions = await cache.aget_many([_epoch_key(kind), _version_key(kind, user_id)])
+    missing = _missing_versions(kind, user_id, versions)
+    if missing:
+        await cache.aset_many(missing, None)
+        versions.update(missing)
+    return _format_payload_key(kind, user_id, versions)
+
+
+def get_or_build(kind, user_id, build):
+    """
+    Read-through cache for a profile payload.
+    Args:
+        kind: One of USER, COURSES or SOCIAL_LINKS
+        user_id: Id of the user the payload describes
+        build: Callable returning the serialized payload on a miss
+    Returns:
+        The cached or freshly built payload
+    """
+    key = _payload_key(kind, user_id)
+    data = cache.get(key)
+    if data is not None:
+        _count('hits', kind)
+        return data
+
+    _count('misses', kind)
+    data = build()
+    cache.set(key, data, getattr(settings, 'PROFILE_CACHE_TIMEOUT', 300))
+    return data
+
+
+async def aget_or_build(kind, user_id, build):
+    """
+    Async `get_or_build`, for the async views.
+    Args:
+        kind: One of USER, COURSES or SOCIAL_LINKS
+        user_id: Id of the user the payload describes
+        build: Coroutine function returning the serialized payload on a miss
+    Returns:
+        The cached or freshly built payload
+    """
+    key = await _apayload_key(kind, user_id)
+    data = await cache.aget(key)
+    if data is not None:
+        _count('hits', kind)
+        return data
+
+    _count('misses', kind)
+    data = await build()
+    await cache.aset(key, data, getattr(settings, 'PROFILE_CACHE_TIMEOUT', 300))
+    return data
+
+
+def invalidate(user_id, *kinds):
+    """Invalidate the given payload kinds (all by default) for one user"""
+    for kind in kinds or KINDS:
+        key = _version_key(kind, user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def invalidate_all(*kinds):
+    """Invalidate the given payload kinds (all by default) for every user"""
+    for kind in kinds or KINDS:
+        cache.set(_epoch_key(kind), _new_version(), None)
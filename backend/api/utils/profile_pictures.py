@@ -0,0 +1,194 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from ..models import ProfilePictureJob, User
+
+# Variant name -> (square size in pixels, Pillow format, file extension)
+VARIANTS = {
+    'thumbnail': (128, 'JPEG', 'jpg'),
+    'medium': (512, 'JPEG', 'jpg'),
+    'webp': (512, 'WEBP', 'webp'),
+}
+# The variant User.profile_picture_url points at
+PROFILE_VARIANT = 'medium'
+QUALITY = 85
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide worker pool, sized by PROFILE_PICTURE_WORKERS"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PROFILE_PICTURE_WORKERS,
+                thread_name_prefix='profile-pictures'
+            )
+        return _executor
+
+
+def spool(upload):
+    """
+    Copy an upload to a temp file that outlives the request.
+    Args:
+        upload: Django UploadedFile
+    Returns:
+        Path of the temp file
+    Raises:
+        ValueError: If the upload is not an image Pillow can read
+    """
+    fd, path = tempfile.mkstemp(prefix='profile-picture-')
+    with os.fdopen(fd, 'wb') as f:
+        for chunk in upload.chunks():
+            f.write(chunk)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError):
+        os.remove(path)
+        raise ValueError('Upload is not a supported image.')
+    return path
+
+
+def start_job(user, upload):
+    """
+    Spool an upload and queue its processing for when the current transaction commits.
+    Returns:
+        The pending ProfilePictureJob
+    Raises:
+        ValueError: If the upload is not an image
+    """
+    path = spool(upload)
+    job = ProfilePictureJob.objects.create(user=user)
+    transaction.on_commit(lambda: submit(job.job_id, path))
+    return job
+
+
+def submit(job_id, path):
+    """Hand a job to the worker pool, or run it inline if PROFILE_PICTURE_WORKERS is 0"""
+    if settings.PROFILE_PICTURE_WORKERS <= 0:
+        process_job(job_id, path)
+    else:
+        get_executor().submit(run_in_worker, job_id, path)
+
+
+def run_in_worker(job_id, path):
+    try:
+        process_job(job_id, path)
+    finally:
+        close_old_connections()
+
+
+def render_variant(image, size, image_format):
+    """Crop and scale an image to a `size` square and encode it"""
+    variant = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    if variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    buffer = BytesIO()
+    variant.save(buffer, image_format, quality=QUALITY)
+    return buffer.getvalue()
+
+
+def variant_path(job, name):
+    _, _, extension = VARIANTS[name]
+    return f'profile_pictures/{job.user_id}/{job.job_id}/{name}.{extension}'
+
+
+def store_variants(job, rendered):
+    """
+    Save rendered variants to the default storage in parallel.
+    Returns:
+        Dict of variant name -> storage path
+    """
+    def save(name):
+        return default_storage.save(variant_path(job, name), ContentFile(rendered[name]))
+
+    with ThreadPoolExecutor(max_workers=len(rendered)) as uploads:
+        return dict(zip(rendered, uploads.map(save, rendered)))
+
+
+def delete_variants(paths):
+    for path in paths:
+        default_storage.delete(path)
+
+
+def process_job(job_id, path):
+    """
+    Render, store and swap in the variants of a spooled upload.
+    The spooled file is removed whatever the outcome.
+    Returns:
+        The finished ProfilePictureJob, or None if the job was deleted
+        (with its user) before it ran
+    """
+    try:
+        job = ProfilePictureJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return None
+        job.status = 'processing'
+        job.save(update_fields=['status', 'updated_at'])
+
+        try:
+            with Image.open(path) as image:
+                image = ImageOps.exif_transpose(image)
+                rendered = {
+                    name: render_variant(image, size, image_format)
+                    for name, (size, image_format, _) in VARIANTS.items()
+                }
+            stored = store_variants(job, rendered)
+        except Exception as e:
+            return fail_job(job, e)
+    finally:
+        os.remove(path)
+
+    try:
+        swap_profile_picture(job, stored)
+    except Exception as e:
+        # The swap rolled back, so nothing points at the stored files
+        delete_variants(stored.values())
+        return fail_job(job, e)
+    return job
+
+
+def fail_job(job, error):
+    job.status = 'failed'
+    job.error = str(error)
+    job.variants = {}
+    job.save(update_fields=['status', 'error', 'variants', 'updated_at'])
+    return job
+
+
+def swap_profile_picture(job, stored):
+    """
+    Point the user's profile picture at a finished job's variants in one
+    transaction. A job that finishes after a newer upload is superseded,
+    and the files of whichever upload lost are deleted after commit.
+    """
+    with transaction.atomic():
+        user = User.objects.select_for_update().get(pk=job.user_id)
+        job.variants = stored
+        newer = ProfilePictureJob.objects.filter(
+            user_id=job.user_id, status='done', created_at__gt=job.created_at
+        ).exists()
+        if newer:
+            job.status = 'superseded'
+            discarded = list(stored.values())
+        else:
+            older = list(ProfilePictureJob.objects.select_for_update().filter(user_id=job.user_id, status='done'))
+            discarded = [path for old in older for path in old.variants.values()]
+            ProfilePictureJob.objects.filter(pk__in=[old.pk for old in older]).update(status='superseded')
+            user.profile_picture_url = stored[PROFILE_VARIANT]
+            user.save(update_fields=['profile_picture_url', 'updated_at'])
+            job.status = 'done'
+        job.save(update_fields=['variants', 'status', 'updated_at'])
+        transaction.on_commit(lambda: delete_variants(discarded))
@@ -0,0 +1,168 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+from rest_framework.serializers import BaseSerializer
+
+TOP_FINGERPRINTS = 5
+
+_current = ContextVar('api_request_profile', default=None)
+
+_NUMBER = re.compile(r'\b\d+(\.\d+)?\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST = re.compile(r'\bIN \((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    Normalize SQL so queries differing only in literals group together.
+    Args:
+        sql: SQL text, with or without %s placeholders
+    Returns:
+        SQL with numbers and strings replaced by %s and IN lists collapsed
+    """
+    sql = _STRING.sub('%s', sql)
+    sql = _NUMBER.sub('%s', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class RequestProfile:
+    """
+    Timings and SQL collected for a single request.
+    """
+
+    def __init__(self):
+        self.action = None
+        self.query_count = 0
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.view_ms = 0.0
+        self.total_ms = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook that times each query"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - started) * 1000
+            self.query_count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated_queries(self):
+        """Fingerprints executed more than once, most repeated first"""
+        return [(sql, n) for sql, n in self.fingerprints.most_common(TOP_FINGERPRINTS) if n > 1]
+
+    def server_timing(self):
+        """Format the profile as a Server-Timing header value"""
+        return ', '.join([
+            f'db;dur={self.db_ms:.1f};desc="{self.query_count} queries"',
+            f'serializer;dur={self.serializer_ms:.1f}',
+            f'view;dur={self.view_ms:.1f}',
+            f'total;dur={self.total_ms:.1f}',
+        ])
+
+
+def current_profile():
+    """Return the profile of the request being handled, if profiling is on"""
+    return _current.get()
+
+
+def activate(profile):
+    """Make `profile` the current request profile; returns a token for `deactivate`"""
+    return _current.set(profile)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+_serializer_data = BaseSerializer.data
+
+
+def _timed_serializer_data(self):
+    profile = _current.get()
+    if profile is None:
+        return _serializer_data.fget(self)
+    started = time.perf_counter()
+    try:
+        return _serializer_data.fget(self)
+    finally:
+        profile.serializer_ms += (time.perf_counter() - started) * 1000
+
+
+def instrument_serializers():
+    """
+    Time BaseSerializer.data for profiled requests.
+    Serializer.data and ListSerializer.data both go through it, so each
+    top-level serialization is counted once.
+    """
+    if BaseSerializer.data is _serializer_data:
+        BaseSerializer.data = property(_timed_serializer_data)
+
+
+class ProfileAggregate:
+    """
+    In-process, thread-safe aggregate of request profiles per DRF action.
+    Keeps the last `sample_size` samples per action for percentiles.
+    """
+
+    def __init__(self, sample_size=1000):
+        self.sample_size = sample_size
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.samples = defaultdict(lambda: deque(maxlen=self.sample_size))
+        self.requests = Counter()
+        self.fingerprints = defaultdict(Counter)
+
+    def record(self, profile):
+        with self.lock:
+            self.requests[profile.action] += 1
+            self.samples[profile.action].append(
+                (profile.total_ms, profile.view_ms, profile.db_ms, profile.serializer_ms, profile.query_count)
+            )
+            for sql, n in profile.repeated_queries():
+                self.fingerprints[profile.action][sql] += n
+
+    def summary(self):
+        """
+        Build the per-action report.
+        Returns:
+            Dict mapping action name to request count, p50/p95/p99 of each
+            timing, and the most repeated SQL fingerprints
+        """
+        with self.lock:
+            report = {}
+            for action, samples in self.samples.items():
+                columns = list(zip(*samples))
+                report[action] = {
+                    'requests': self.requests[action],
+                    'top_repeated_sql': [
+                        {'sql': sql, 'count': n}
+                        for sql, n in self.fingerprints[action].most_common(TOP_FINGERPRINTS)
+                    ],
+                }
+                for name, values in zip(['total_ms', 'view_ms', 'db_ms', 'serializer_ms', 'queries'], columns):
+                    report[action][name] = {
+                        f'p{pct}': round(percentile(values, pct), 2) for pct in (50, 95, 99)
+                    }
+            return report
+
+
+aggregate = ProfileAggregate()
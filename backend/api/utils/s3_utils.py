@@ -1,30 +1,123 @@
+from functools import lru_cache
+from urllib.parse import quote
+
+import boto3
+from botocore.exceptions import ClientError
 from django.conf import settings
 
+
+class S3UrlResolver:
+    """
+    Turns stored file keys into public URLs of one bucket domain.
+    The `https://<domain>/` prefix is built once and each key's URL is
+    memoized in a bounded LRU, so repeated keys cost one dict lookup.
+    """
+
+    def __init__(self, domain, cache_size):
+        self.domain = domain
+        self.prefix = f'https://{domain}/'
+        self.resolve_key = lru_cache(maxsize=cache_size)(self._resolve_key)
+
+    def _resolve_key(self, key):
+        # Remove any existing domain prefix to prevent double URLs; the rest is already URL-encoded
+        if self.domain in key:
+            return self.prefix + key.split(self.domain)[-1].lstrip('/')
+        # If it's already a full URL, return as-is
+        if key.startswith('http'):
+            return key
+        # Keys are raw object names: quote '+', '@', spaces and the like
+        return self.prefix + quote(key.lstrip('/'))
+
+    def __call__(self, path_or_url):
+        if not path_or_url:
+            return None
+        # FieldFiles resolve from their stored key instead of the storage backend's url()
+        key = getattr(path_or_url, 'name', path_or_url)
+        return self.resolve_key(key if isinstance(key, str) else str(key))
+
+
+_resolver = None
+
+
+def get_resolver():
+    """Return the shared resolver, rebuilt if AWS_S3_CUSTOM_DOMAIN has changed"""
+    global _resolver
+    domain = settings.AWS_S3_CUSTOM_DOMAIN
+    if _resolver is None or _resolver.domain != domain:
+        _resolver = S3UrlResolver(domain, settings.S3_URL_CACHE_SIZE)
+    return _resolver
+
+
 def get_full_s3_url(path_or_url):
     """
     Convert S3 path to full URL if needed
     Args:
-        path_or_url: Either a full URL or S3 path (profile_pictures/xxx.jpg)
+        path_or_url: A full URL, an S3 path (profile_pictures/xxx.jpg) or a FieldFile
     Returns:
         Full public URL (https://bucket.s3.amazonaws.com/profile_pictures/xxx.jpg)
     """
-    if not path_or_url:
-        return None
+    return get_resolver()(path_or_url)
 
-    # Handle FileField/ImageField objects
-    if hasattr(path_or_url, 'url'):
-        path_or_url = path_or_url.url
 
-    # Convert to string if not already
-    path_or_url = str(path_or_url)
+@lru_cache(maxsize=None)
+def _client(region_name, endpoint_url, access_key, secret_key):
+    return boto3.client(
+        's3',
+        region_name=region_name,
+        endpoint_url=endpoint_url,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+    )
 
-    # Remove any existing domain prefix to prevent double URLs
-    if settings.AWS_S3_CUSTOM_DOMAIN in path_or_url:
-        path_or_url = path_or_url.split(settings.AWS_S3_CUSTOM_DOMAIN)[-1].lstrip('/')
 
-    # If it's already a full URL, return as-is
-    if path_or_url.startswith('http'):
-        return path_or_url
+def get_s3_client():
+    """
+    Return a boto3 S3 client for the configured bucket.
+    Clients are thread-safe and reused across requests.
+    """
+    return _client(
+        settings.AWS_S3_REGION_NAME,
+        settings.AWS_S3_ENDPOINT_URL,
+        settings.AWS_ACCESS_KEY_ID,
+        settings.AWS_SECRET_ACCESS_KEY,
+    )
+
+
+def presigned_upload(key, content_type, max_bytes, expires_in):
+    """
+    Presign a POST that uploads one object straight to the bucket
+    Args:
+        key: Object key the upload must be stored under
+        content_type: The only Content-Type the upload may have
+        max_bytes: Largest accepted upload
+        expires_in: Seconds the signature stays valid
+    Returns:
+        Dict with the POST `url` and the form `fields` to send with the file
+    """
+    return get_s3_client().generate_presigned_post(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=key,
+        Fields={'Content-Type': content_type},
+        Conditions=[
+            {'Content-Type': content_type},
+            ['content-length-range', 1, max_bytes],
+        ],
+        ExpiresIn=expires_in,
+    )
+
+
+def head_object(key):
+    """
+    Look up an object's metadata without downloading it
+    Args:
+        key: Object key in the bucket
+    Returns:
+        The HEAD response (ContentLength, ContentType, ...), or None if there is no such object
+    """
+    try:
+        return get_s3_client().head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
 
-    # Otherwise construct the full URL
-    return f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{path_or_url.lstrip('/')}"
\ No newline at end of file
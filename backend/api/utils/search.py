@@ -0,0 +1,297 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, Count, FloatField, IntegerField, Max
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+TOKEN = re.compile(r'[^\W_]+')
+MAX_INDEX_RESULTS = 200
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return TOKEN.findall(str(text).lower()) if text else []
+
+
+def search_columns(model, fields):
+    """Return the database columns behind the given search field names"""
+    return [model._meta.get_field(name).column for name in fields]
+
+
+def search_document(columns, table=None):
+    """
+    SQL for the text a row is searched by: its columns, space separated.
+    Index DDL passes no table; queries qualify the columns with it.
+    """
+    qn = connection.ops.quote_name
+    prefix = f'{qn(table)}.' if table else ''
+    return " || ' ' || ".join(f"coalesce({prefix}{qn(column)}, '')" for column in columns)
+
+
+class PostgresSearchBackend:
+    """
+    Ranked search on Postgres.
+    Prefix-matches each term against a `simple` tsvector of the search
+    fields, falls back to a trigram-indexed substring match of the whole
+    phrase, and ranks by ts_rank plus trigram similarity. The matching GIN
+    indexes are created by the setup_search_indexes command.
+    The rank is cast to double precision: ts_rank and similarity are
+    real, which would not compare equal to the rank a page cursor holds.
+    """
+
+    def search(self, queryset, fields, terms):
+        tokens = [token for term in terms for token in tokenize(term)]
+        if not tokens:
+            return queryset.none()
+
+        model = queryset.model
+        document = search_document(search_columns(model, fields), model._meta.db_table)
+        vector = f"to_tsvector('simple', {document})"
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        phrase = ' '.join(terms).lower()
+        like = '%' + phrase.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+        matches = RawSQL(
+            f"({vector} @@ to_tsquery('simple', %s) OR lower({document}) LIKE %s)",
+            [tsquery, like],
+            output_field=BooleanField()
+        )
+        rank = RawSQL(
+            f"(ts_rank({vector}, to_tsquery('simple', %s)) + similarity(lower({document}), %s))::float8",
+            [tsquery, phrase],
+            output_field=FloatField()
+        )
+        return queryset.filter(matches).annotate(search_rank=rank).order_by('-search_rank', 'pk')
+
+
+class InvertedIndex:
+    """
+    In-process inverted index over some fields of one model.
+    Maps each token to the ids of the rows containing it, with a sorted
+    token list for prefix lookups.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.lock = threading.Lock()
+        self.postings = defaultdict(set)
+        self.documents = {}
+        self.sorted_tokens = []
+        self.signature = None
+
+    def current_signature(self):
+        """Row count and max id, to notice bulk writes that skipped the signals"""
+        return tuple(self.model.objects.aggregate(count=Count('pk'), last=Max('pk')).values())
+
+    def rebuild(self, signature=None):
+        self.postings = defaultdict(set)
+        self.documents = {}
+        for row in self.model.objects.values('pk', *self.fields).iterator():
+            self._add(row['pk'], [row[field] for field in self.fields])
+        self.sorted_tokens = sorted(self.postings)
+        self.signature = signature or self.current_signature()
+
+    def _add(self, pk, values):
+        tokens = {token for value in values for token in tokenize(value)}
+        self.documents[pk] = tokens
+        for token in tokens:
+            self.postings[token].add(pk)
+        return tokens
+
+    def _remove(self, pk):
+        emptied = []
+        for token in self.documents.pop(pk, ()):
+            self.postings[token].discard(pk)
+            if not self.postings[token]:
+                del self.postings[token]
+                emptied.append(token)
+        return emptied
+
+    def _sort_tokens(self, added, removed):
+        """Keep sorted_tokens in step with the postings after one row changed"""
+        for token in removed:
+            if token not in self.postings:
+                position = bisect_left(self.sorted_tokens, token)
+                if position < len(self.sorted_tokens) and self.sorted_tokens[position] == token:
+                    del self.sorted_tokens[position]
+        for token in added:
+            position = bisect_left(self.sorted_tokens, token)
+            if position == len(self.sorted_tokens) or self.sorted_tokens[position] != token:
+                self.sorted_tokens.insert(position, token)
+
+    def update(self, instance):
+        """
+        Reindex one saved row. The signature is shifted rather than re-read;
+        search() compares it with the table and rebuilds if they disagree.
+        """
+        with self.lock:
+            if self.signature is None:
+                return
+            new = instance.pk not in self.documents
+            removed = self._remove(instance.pk)
+            added = self._add(instance.pk, [getattr(instance, field) for field in self.fields])
+            self._sort_tokens(added, removed)
+            if new:
+                count, last = self.signature
+                self.signature = (count + 1, max(last or 0, instance.pk))
+
+    def remove(self, pk):
+        """Drop one deleted row"""
+        with self.lock:
+            if self.signature is None or pk not in self.documents:
+                return
+            self._sort_tokens((), self._remove(pk))
+            count, last = self.signature
+            if pk == last:
+                last = max(self.documents, default=None)
+            self.signature = (count - 1, last)
+
+    def prefix_matches(self, prefix):
+        """Return (ids with a token starting with `prefix`, ids with exactly that token)"""
+        start = bisect_left(self.sorted_tokens, prefix)
+        stop = bisect_left(self.sorted_tokens, prefix + '\U0010ffff', start)
+        matched = set().union(*(self.postings[token] for token in self.sorted_tokens[start:stop]))
+        return matched, self.postings.get(prefix, set())
+
+    def search(self, tokens, limit):
+        """
+        Return up to `limit` ids matching every token by prefix, best first.
+        Rows rank by how many tokens they match exactly, then by id.
+        """
+        with self.lock:
+            signature = self.current_signature()
+            if signature != self.signature:
+                self.rebuild(signature)
+
+            candidates = None
+            exact_sets = []
+            for token in tokens:
+                matched, exact = self.prefix_matches(token)
+                candidates = matched if candidates is None else candidates & matched
+                exact_sets.append(exact)
+                if not candidates:
+                    return []
+
+        exact_hits = Counter(pk for exact in exact_sets for pk in exact & candidates)
+        ranked = sorted(exact_hits, key=lambda pk: (-exact_hits[pk], pk))[:limit]
+        if len(ranked) < limit:
+            ranked += heapq.nsmallest(limit - len(ranked), candidates - exact_hits.keys())
+        return ranked
+
+
+class InvertedIndexSearchBackend:
+    """
+    Fallback for databases without full-text search (SQLite in tests).
+    Keeps one InvertedIndex per model and returns at most
+    MAX_INDEX_RESULTS rows, best first.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def get_index(self, model, fields):
+        with self.lock:
+            key = (model, tuple(fields))
+            if key not in self.indexes:
+                self.indexes[key] = InvertedIndex(model, list(fields))
+            return self.indexes[key]
+
+    def indexes_for(self, model):
+        return [index for (indexed, _), index in self.indexes.items() if indexed is model]
+
+    def search(self, queryset, fields, terms):
+        tokens = [token for term in terms for token in tokenize(term)]
+        if not tokens:
+            return queryset.none()
+
+        ids = self.get_index(queryset.model, fields).search(tokens, MAX_INDEX_RESULTS)
+        if not ids:
+            return queryset.none()
+        # A raw CASE over integer ids compiles far faster than hundreds of When() objects
+        qn = connection.ops.quote_name
+        pk_column = f'{qn(queryset.model._meta.db_table)}.{qn(queryset.model._meta.pk.column)}'
+        whens = ' '.join(f'WHEN {int(pk)} THEN {len(ids) - position}' for position, pk in enumerate(ids))
+        rank = RawSQL(f'CASE {pk_column} {whens} ELSE 0 END', [], output_field=IntegerField())
+        return queryset.filter(pk__in=ids).annotate(search_rank=rank).order_by('-search_rank', 'pk')
+
+
+class SubstringSearchBackend:
+    """DRF's own icontains SearchFilter behaviour"""
+
+    def search(self, queryset, fields, terms):
+        return None
+
+
+BACKENDS = {
+    'postgres': PostgresSearchBackend(),
+    'inverted_index': InvertedIndexSearchBackend(),
+    'icontains': SubstringSearchBackend(),
+}
+
+
+# Database alias -> whether pg_trgm is installed, looked up once per process
+_trigram_installed = {}
+
+
+def trigram_installed():
+    """Whether the pg_trgm extension PostgresSearchBackend needs is installed"""
+    if connection.alias not in _trigram_installed:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_installed[connection.alias] = cursor.fetchone() is not None
+    return _trigram_installed[connection.alias]
+
+
+def get_backend():
+    """
+    Pick the search backend from the API_SEARCH_BACKEND setting.
+    'auto' uses Postgres full-text search on Postgres once
+    setup_search_indexes has installed pg_trgm, substring matching on
+    Postgres until then, and the in-process inverted index elsewhere.
+    """
+    name = getattr(settings, 'API_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        if connection.vendor != 'postgresql':
+            name = 'inverted_index'
+        elif trigram_installed():
+            name = 'postgres'
+        else:
+            name = 'icontains'
+    return BACKENDS[name]
+
+
+def row_changed(instance):
+    """Keep in-process indexes of the instance's model up to date"""
+    for index in BACKENDS['inverted_index'].indexes_for(type(instance)):
+        index.update(instance)
+
+
+def row_deleted(instance):
+    for index in BACKENDS['inverted_index'].indexes_for(type(instance)):
+        index.remove(instance.pk)
+
+
+class RankedSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter that delegates to the configured search backend and
+    orders results by relevance.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        fields = getattr(view, 'search_fields', None)
+        if not terms or not fields:
+            return queryset
+
+        results = get_backend().search(queryset, fields, terms)
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        return results
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+from itertools import count
+
+from django.db.models import F, Value
+from django.db.models.functions import Mod
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def minute_of_week(moment):
+    """Return the minute of the week (Monday 00:00 = 0) of a datetime"""
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def order_by_next_session(courses, start):
+    """
+    Order courses by how soon their weekly session comes after `start`.
+    Args:
+        courses: Course queryset
+        start: Local datetime the calendar starts at
+    Returns:
+        Queryset annotated with `minutes_until` (0 to one week) and ordered by it
+    """
+    now_slot = minute_of_week(start)
+    return courses.annotate(
+        minutes_until=Mod(F('weekly_slot') - Value(now_slot) + Value(MINUTES_PER_WEEK), Value(MINUTES_PER_WEEK))
+    ).order_by('minutes_until', 'course_id')
+
+
+def upcoming_sessions(courses, start, end, limit):
+    """
+    List the next study sessions between `start` and `end`, soonest first.
+    Courses ordered by `order_by_next_session` meet once a week, so week n's
+    sessions come in the same order as week 0's, shifted by n weeks: the
+    calendar is generated by cycling through that order, without sorting.
+    Args:
+        courses: Queryset returned by `order_by_next_session`
+        start: Aware local datetime the calendar starts at
+        end: Aware local datetime the calendar ends at (exclusive)
+        limit: Maximum number of sessions to return
+    Returns:
+        List of (course, starts_at) tuples with local, aware datetimes
+    """
+    ordered = list(courses)
+    if not ordered or limit <= 0:
+        return []
+
+    now_slot = minute_of_week(start)
+    sessions = []
+    for week in count():
+        for course in ordered:
+            days_ahead = (now_slot + course.minutes_until) // MINUTES_PER_DAY - start.weekday() + 7 * week
+            # Combine with the wall-clock time so DST changes don't shift sessions
+            starts_at = datetime.combine(
+                start.date() + timedelta(days=days_ahead),
+                course.study_schedules_time,
+                tzinfo=start.tzinfo
+            )
+            if starts_at < start:
+                continue
+            if starts_at >= end:
+                return sessions
+            sessions.append((course, starts_at))
+            if len(sessions) >= limit:
+                return sessions
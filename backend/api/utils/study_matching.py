@@ -0,0 +1,193 @@
+import heapq
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from ..models import StudyMatch, UserCourse
+
+# A shared course counts for this many shared study hours
+COURSE_WEIGHT = 3
+MATCHES_PER_USER = 20
+# Weekly study slots are hours of the week
+SLOT_MINUTES = 60
+MATCH_FIELDS = ['score', 'shared_courses', 'shared_slots', 'computed_at']
+
+# User id -> course ids of refreshes waiting for the worker
+_pending = {}
+_pending_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class Profiles:
+    """
+    Study profiles of a set of users, as bitsets.
+    Each user has a bitset of courses and a bitset of the hours of the
+    week their courses meet in, so overlaps are an AND and a popcount.
+    Courses get bits in the order they are loaded rather than by id, so
+    the bitsets stay as wide as the number of courses seen.
+    Course rosters (`members`) give the candidates for a user.
+    """
+
+    def __init__(self, rows):
+        self.course_bits = {}
+        self.courses = defaultdict(int)
+        self.slots = defaultdict(int)
+        self.enrolled = defaultdict(list)
+        self.members = defaultdict(list)
+        for user_id, course_id, weekly_slot in rows:
+            self.courses[user_id] |= 1 << self.course_bits.setdefault(course_id, len(self.course_bits))
+            self.slots[user_id] |= 1 << weekly_slot // SLOT_MINUTES
+            self.enrolled[user_id].append(course_id)
+            self.members[course_id].append(user_id)
+
+    def score(self, a, b):
+        """Return (score, shared_courses, shared_slots) of a pair of users"""
+        shared_courses = (self.courses[a] & self.courses[b]).bit_count()
+        shared_slots = (self.slots[a] & self.slots[b]).bit_count()
+        return COURSE_WEIGHT * shared_courses + shared_slots, shared_courses, shared_slots
+
+    def top_matches(self, user_id, limit=MATCHES_PER_USER):
+        """
+        Rank everyone sharing a course with a user.
+        Returns:
+            Up to `limit` unsaved StudyMatch rows, best first
+        """
+        shared = Counter()
+        for course_id in self.enrolled.get(user_id, ()):
+            shared.update(self.members[course_id])
+        shared.pop(user_id, None)
+
+        my_slots, slots = self.slots[user_id], self.slots
+        # Negated scores so nsmallest compares plain tuples, ties broken by partner id
+        ranked = heapq.nsmallest(limit, (
+            (-COURSE_WEIGHT * courses - (my_slots & slots[partner]).bit_count(), partner, courses)
+            for partner, courses in shared.items()
+        ))
+        return [
+            StudyMatch(
+                user_id=user_id, partner_id=partner, score=-negated,
+                shared_courses=courses, shared_slots=-negated - COURSE_WEIGHT * courses
+            )
+            for negated, partner, courses in ranked
+        ]
+
+
+def load_profiles(enrollments=None):
+    """Build Profiles from UserCourse rows, all of them unless a queryset is given"""
+    enrollments = UserCourse.objects.all() if enrollments is None else enrollments
+    return Profiles(enrollments.values_list('user_id', 'course_id', 'course__weekly_slot').iterator())
+
+
+def rebuild_study_matches(batch_size=1000):
+    """
+    Recompute every user's top matches from scratch. Meant to run periodically.
+    Args:
+        batch_size: Rows per bulk insert
+    Returns:
+        Number of StudyMatch rows written
+    """
+    profiles = load_profiles()
+    written = 0
+    with transaction.atomic():
+        StudyMatch.objects.all().delete()
+        batch = []
+        for user_id in list(profiles.enrolled):
+            batch.extend(profiles.top_matches(user_id))
+            if len(batch) >= batch_size:
+                StudyMatch.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        StudyMatch.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def refresh_study_matches(user_id, course_ids):
+    """
+    Update matches after a user enrolled in or left `course_ids`.
+    The user's own matches are recomputed; everyone sharing a course with
+    them, or who shared one of `course_ids`, has their row for the user
+    updated or dropped. Other users' lists are trimmed and re-ranked by
+    the next rebuild_study_matches.
+    """
+    my_courses = UserCourse.objects.filter(user_id=user_id).values('course_id')
+    affected = set(
+        UserCourse.objects
+        .filter(Q(course_id__in=course_ids) | Q(course_id__in=my_courses))
+        .values_list('user_id', flat=True)
+    )
+    affected.discard(user_id)
+    profiles = load_profiles(UserCourse.objects.filter(user_id__in=[user_id, *affected]))
+
+    reverse_rows, dropped = [], []
+    for partner in affected:
+        score, shared_courses, shared_slots = profiles.score(partner, user_id)
+        if shared_courses:
+            reverse_rows.append(StudyMatch(
+                user_id=partner, partner_id=user_id, score=score,
+                shared_courses=shared_courses, shared_slots=shared_slots
+            ))
+        else:
+            dropped.append(partner)
+
+    with transaction.atomic():
+        StudyMatch.objects.filter(user_id=user_id).delete()
+        StudyMatch.objects.bulk_create(profiles.top_matches(user_id))
+        StudyMatch.objects.filter(user_id__in=dropped, partner_id=user_id).delete()
+        StudyMatch.objects.bulk_create(
+            reverse_rows,
+            update_conflicts=True,
+            unique_fields=['user', 'partner'],
+            update_fields=MATCH_FIELDS
+        )
+
+
+def get_executor():
+    """Return the process-wide refresh worker pool, sized by STUDY_MATCH_WORKERS"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.STUDY_MATCH_WORKERS,
+                thread_name_prefix='study-matches'
+            )
+        return _executor
+
+
+def queue_refresh(user_id, course_ids):
+    """
+    Queue a refresh for the worker pool, or run it inline if
+    STUDY_MATCH_WORKERS is 0. Refreshes of a user queued before the
+    worker gets to them are merged into one.
+    """
+    if settings.STUDY_MATCH_WORKERS <= 0:
+        refresh_study_matches(user_id, course_ids)
+        return
+    with _pending_lock:
+        idle = not _pending
+        _pending.setdefault(user_id, set()).update(course_ids)
+    if idle:
+        get_executor().submit(run_in_worker)
+
+
+def run_in_worker():
+    """Refresh every user queued so far"""
+    with _pending_lock:
+        batch = dict(_pending)
+        _pending.clear()
+    try:
+        for user_id, course_ids in batch.items():
+            refresh_study_matches(user_id, course_ids)
+    finally:
+        close_old_connections()
+
+
+def enrollment_changed(user_id, course_ids):
+    """Queue a refresh of the matches of a user whose enrollments changed, once the transaction commits"""
+    course_ids = list(course_ids)
+    transaction.on_commit(lambda: queue_refresh(user_id, course_ids))
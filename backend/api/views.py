@@ -1,22 +1,38 @@
 from rest_framework import viewsets, filters, status, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.shortcuts import get_object_or_404
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.conf import settings
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 import pytz
 from django.utils.timezone import now
-from django.db.models import Q
-from .utils.s3_utils import get_full_s3_url
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Prefetch, Q
+from .utils.s3_utils import get_full_s3_url, head_object, presigned_upload
+from .utils.friend_candidates import (
+    addable_users_queryset,
+    serialize_candidate,
+    suggested_users,
+)
+from .utils.friend_graph import link_friends, unlink_friends
+from .utils import profile_cache, profile_pictures, profiling
+from .utils import change_feed, course_counts, events, friend_suggestions, session_calendar, study_matching
+from .utils.search import RankedSearchFilter
+from .signals import enrollment_signals_muted, invalidate_on_commit, touch_user
 import boto3
 import uuid
 from botocore.exceptions import ClientError
 
 from .models import *
 from .serializers import *
+from .row_mappers import RowMapperListMixin, serialize_rows
+from .conditional import ConditionalGetMixin
 
 MONDAY = 0
 TUESDAY = 1
@@ -28,6 +44,7 @@ SUNDAY = 6
 
 HTTP_BAD_REQUEST = status.HTTP_400_BAD_REQUEST
 HTTP_CREATED = status.HTTP_201_CREATED
+HTTP_ACCEPTED = status.HTTP_202_ACCEPTED
 HTTP_NO_CONTENT = status.HTTP_204_NO_CONTENT
 HTTP_FORBIDDEN = status.HTTP_403_FORBIDDEN
 
@@ -35,9 +52,21 @@ FRIENDSHIP_PENDING = 'pending'
 FRIENDSHIP_ACCEPTED = 'accepted'
 FRIENDSHIP_REJECTED = 'rejected'
 
+MAX_BULK_COURSE_CODES = 50
 MAX_UPCOMING_SESSIONS = 3
+MAX_SESSION_LIMIT = 50
+MAX_SESSION_RANGE_DAYS = 366
 DAYS_IN_WEEK = 7
 
+# Content types accepted for direct profile picture uploads -> key extension
+PROFILE_PICTURE_CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+}
+
+PROFILE_BUNDLE_FIELDS = ('user', 'courses', 'social_links', 'friendship_count', 'friendship_status')
+
 DAYS_MAP = {
     'Mon': MONDAY,
     'Tue': TUESDAY,
@@ -48,6 +77,232 @@ DAYS_MAP = {
     'Sun': SUNDAY
 }
 
+
+def latest_friendship(user_id, other_id):
+    """Queryset of the requester/status of friendships between two users, latest first"""
+    return Friendship.objects.filter(
+        Q(requester_id=user_id, addressee_id=other_id) |
+        Q(requester_id=other_id, addressee_id=user_id)
+    ).order_by('-updated_at').values('requester_id', 'status')
+
+
+def describe_friendship(friendship, user_id):
+    """Describe a `latest_friendship` row (or None) from the side of `user_id`"""
+    if friendship is None:
+        return None
+    if friendship['status'] == FRIENDSHIP_PENDING:
+        return 'pending_sent' if friendship['requester_id'] == user_id else 'pending_received'
+    return friendship['status']
+
+
+def friendship_status(user_id, other_id):
+    """
+    Describe the friendship between two users from the first user's side.
+    Returns 'self', 'accepted', 'rejected', 'pending_sent', 'pending_received' or None.
+    """
+    if user_id == other_id:
+        return 'self'
+    return describe_friendship(latest_friendship(user_id, other_id).first(), user_id)
+
+
+def parse_bundle_fields(requested):
+    """
+    Parse the `fields` parameter of profile_bundle.
+    Returns the requested field names, all of PROFILE_BUNDLE_FIELDS if empty.
+    Raises ValueError naming unknown fields.
+    """
+    if not requested:
+        return PROFILE_BUNDLE_FIELDS
+    fields = [f.strip() for f in requested.split(',') if f.strip()]
+    unknown = sorted(set(fields) - set(PROFILE_BUNDLE_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}.")
+    return fields
+
+
+def parse_course_codes(data):
+    """
+    Read the `course_codes` list of a bulk enrollment request.
+    Returns the codes with duplicates removed, in request order.
+    Raises ValueError with a client-facing message.
+    """
+    codes = data.get('course_codes')
+    if not isinstance(codes, list) or not codes or not all(isinstance(c, str) and c for c in codes):
+        raise ValueError('course_codes must be a non-empty list of course codes.')
+    codes = list(dict.fromkeys(codes))
+    if len(codes) > MAX_BULK_COURSE_CODES:
+        raise ValueError(f'At most {MAX_BULK_COURSE_CODES} course codes per request.')
+    return codes
+
+
+def insert_enrollments(user, course_ids):
+    """
+    Enroll a user in courses without signals, skipping any enrollment a
+    concurrent request has just made.
+    Returns:
+        The UserCourse rows this call inserted, with their pks
+    """
+    enrollments = [UserCourse(user=user, course_id=course_id) for course_id in course_ids]
+    try:
+        with transaction.atomic():
+            created = UserCourse.objects.bulk_create(enrollments)
+    except IntegrityError:
+        # Lost a race on some course; find out which rows are ours one by one
+        created = []
+        for enrollment in enrollments:
+            try:
+                with transaction.atomic():
+                    created += UserCourse.objects.bulk_create([enrollment])
+            except IntegrityError:
+                pass
+    if created and created[0].pk is None:
+        # Backends that cannot return ids from bulk inserts
+        pks = dict(
+            UserCourse.objects
+            .filter(user=user, course_id__in=[e.course_id for e in created])
+            .values_list('course_id', 'pk')
+        )
+        for enrollment in created:
+            enrollment.pk = pks[enrollment.course_id]
+    return created
+
+
+def pending_requests_queryset(user):
+    """Pending friend requests sent to `user`, with what pending_request_payload reads"""
+    return (
+        Friendship.objects
+        .filter(addressee=user, status=FRIENDSHIP_PENDING)
+        .select_related('requester')
+        .prefetch_related(Prefetch(
+            'requester__usercourse_set',
+            queryset=UserCourse.objects.select_related('course').only('user_id', 'course__title')
+        ))
+    )
+
+
+def pending_request_payload(friendships):
+    """Build the friend request rows consumed by the friend requests screen"""
+    sender_data = UserBasicSerializer([f.requester for f in friendships], many=True).data
+    return [
+        {
+            'id': f.friendship_id,
+            'name': f.requester.get_full_name(),
+            'bio': f.requester.bio or '',
+            'profile_picture_url': sender['profile_picture_url'],
+            'tags': [uc.course.title for uc in f.requester.usercourse_set.all()],
+        }
+        for f, sender in zip(friendships, sender_data)
+    ]
+
+
+def session_window(query_params):
+    """
+    Read the upcoming_sessions parameters.
+    Returns:
+        Tuple (start, end, limit) with aware local datetimes
+    Raises:
+        ValueError: With a client-facing message for invalid parameters
+    """
+    tz_name = query_params.get('tz') or settings.TIME_ZONE
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'Unknown time zone: {tz_name}.')
+
+    try:
+        limit = int(query_params.get('limit', MAX_UPCOMING_SESSIONS))
+        start_param = query_params.get('start')
+        end_param = query_params.get('end')
+        start_date = date.fromisoformat(start_param) if start_param else None
+        end_date = date.fromisoformat(end_param) if end_param else None
+    except ValueError:
+        raise ValueError('limit must be an integer and start/end dates in YYYY-MM-DD format.')
+
+    local_now = now().astimezone(tz)
+    start = local_now
+    if start_date and start_date > local_now.date():
+        start = datetime.combine(start_date, time.min, tzinfo=tz)
+    end = start + timedelta(days=DAYS_IN_WEEK)
+    if end_date:
+        end = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=tz)
+    end = min(end, start + timedelta(days=MAX_SESSION_RANGE_DAYS))
+    limit = max(0, min(limit, MAX_SESSION_LIMIT))
+    return start, end, limit
+
+
+def session_payload(sessions):
+    """Build the upcoming session rows consumed by the home screen"""
+    return [
+        {
+            'id': course.course_id,
+            'title': course.title,
+            'date': starts_at.strftime('%b %d, %Y'),
+            'time': starts_at.strftime('%I:%M %p'),
+            'starts_at': starts_at.isoformat(),
+        }
+        for course, starts_at in sessions
+    ]
+
+
+def profile_version(request):
+    """
+    Version of the authenticated user's profile for conditional GETs.
+    updated_at also moves when their social links or friend count change.
+    Returns:
+        Tuple (parts, last_modified), or None if the user is gone
+    """
+    row = (
+        User.objects
+        .filter(pk=request.user.pk)
+        .values_list('updated_at', 'friend_count')
+        .first()
+    )
+    if row is None:
+        return None
+    return row, row[0]
+
+
+def enrollments_version(request):
+    """Version of the authenticated user's enrollments: their row and the newest course edit"""
+    row = (
+        User.objects
+        .filter(pk=request.user.pk)
+        .annotate(courses_updated_at=Max('usercourse__course__updated_at'))
+        .values_list('updated_at', 'courses_updated_at')
+        .first()
+    )
+    if row is None:
+        return None
+    return row, max(filter(None, row))
+
+
+def sessions_version(request):
+    """
+    Version of the upcoming sessions: the enrollments and the session window.
+    The window starts now, so it is floored to the minute; sessions start
+    on whole minutes, so at worst a session that just started is served
+    for the rest of that minute. No Last-Modified, as time alone changes
+    the payload.
+    """
+    try:
+        start, end, limit = session_window(request.query_params)
+    except ValueError:
+        return None
+    version = enrollments_version(request)
+    if version is None:
+        return None
+    window = [moment.replace(second=0, microsecond=0) for moment in (start, end)]
+    return (version[0], *window, limit), None
+
+
+def social_links_version(request):
+    """Version of the authenticated user's social links, which touch their updated_at"""
+    updated_at = User.objects.filter(pk=request.user.pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return updated_at, updated_at
+
+
 class CreateUserView(generics.CreateAPIView):
   """View to create a new user"""
   queryset = User.objects.all()
@@ -55,110 +310,225 @@ class CreateUserView(generics.CreateAPIView):
   permission_classes = [AllowAny]
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for User model"""
-    queryset = User.objects.all()
+    queryset = User.objects.prefetch_related('social_links')
     serializer_class = UserSerializer
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [RankedSearchFilter]
     search_fields = ['username', 'email', 'first_name', 'last_name']
+    cursor_orderings = {'pending_friend_requests': '-created_at'}
+    conditional_versions = {'me': profile_version}
 
     def get_permissions(self):
         """Implement custom permission logic"""
         if self.action == 'create':
             return [AllowAny()]
         return [IsAuthenticated()]
+
+    def get_profile_user(self):
+        """Return the user in the URL, loading it at most once per request"""
+        if not hasattr(self, '_profile_user'):
+            self._profile_user = self.get_object()
+        return self._profile_user
+
+    def profile_payload(self, kind, build):
+        """Build a profile payload for the user in the URL through the profile cache"""
+        pk = self.kwargs.get('pk', '')
+        if not pk.isdigit() or str(int(pk)) != pk:
+            return build(self.get_profile_user())
+        return profile_cache.get_or_build(kind, int(pk), lambda: build(self.get_profile_user()))
+
+    def get_me(self):
+        """Load the authenticated user's full row"""
+        return User.objects.get(pk=self.request.user.pk)
+
+    def cached_profile(self, kind, build):
+        """Serve a profile payload for the user in the URL through the profile cache"""
+        return Response(self.profile_payload(kind, build))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Get a user's profile"""
+        return self.cached_profile(
+            profile_cache.USER,
+            lambda user: dict(self.get_serializer(user).data)
+        )
     
     @action(detail=True, methods=['get', 'patch'])
     def courses(self, request, pk=None):
         """Get or update courses for a specific user"""
-        user = self.get_object()
-        user_courses = UserCourse.objects.filter(user=user)
-        serializer = UserCourseSerializer(user_courses, many=True)
-        return Response(serializer.data)
+        return self.cached_profile(
+            profile_cache.COURSES,
+            lambda user: serialize_rows(UserCourse.objects.filter(user=user), UserCourseSerializer)
+        )
     
+    @action(detail=True, methods=['get'])
+    def profile_bundle(self, request, pk=None):
+        """Get a user's profile, courses, social links, friend count and friendship status in one response"""
+        try:
+            fields = parse_bundle_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response(
+                {'detail': str(e)},
+                status=HTTP_BAD_REQUEST
+            )
+
+        if pk == 'me':
+            self.kwargs['pk'] = str(request.user.id)
+
+        data = {}
+        if 'user' in fields or 'friendship_count' in fields:
+            user_data = self.profile_payload(
+                profile_cache.USER,
+                lambda user: dict(UserSerializer(user).data)
+            )
+            if 'user' in fields:
+                data['user'] = user_data
+            if 'friendship_count' in fields:
+                data['friendship_count'] = user_data['friendship_count']
+        if 'courses' in fields:
+            data['courses'] = self.profile_payload(
+                profile_cache.COURSES,
+                lambda user: serialize_rows(UserCourse.objects.filter(user=user), UserCourseSerializer)
+            )
+        if 'social_links' in fields:
+            data['social_links'] = self.profile_payload(
+                profile_cache.SOCIAL_LINKS,
+                lambda user: list(SocialMediaLinkSerializer(
+                    SocialMediaLink.objects.filter(user=user), many=True
+                ).data)
+            )
+        if 'friendship_status' in fields:
+            if not data:
+                self.get_profile_user()
+            data['friendship_status'] = friendship_status(request.user.id, int(self.kwargs['pk']))
+
+        return Response(data)
+
     @action(detail=True, methods=['get'])
     def friendships(self, request, pk=None):
         """Get all friendships for a specific user"""
         user = self.get_object()
-        sent_requests = Friendship.objects.filter(requester=user, status=FRIENDSHIP_ACCEPTED)
-        received_requests = Friendship.objects.filter(addressee=user, status=FRIENDSHIP_ACCEPTED)
-
-        sent_serializer = FriendshipSerializer(sent_requests, many=True)
-        received_serializer = FriendshipSerializer(received_requests, many=True)
+        accepted = serialize_rows(
+            Friendship.objects.filter(edges__user=user).select_related('requester', 'addressee'),
+            FriendshipSerializer
+        )
 
         return Response({
-            'sent_requests': sent_serializer.data,
-            'received_requests': received_serializer.data
+            'sent_requests': [f for f in accepted if f['requester']['id'] == user.id],
+            'received_requests': [f for f in accepted if f['requester']['id'] != user.id]
         })
     
     @action(detail=True, methods=['get', 'patch', 'post'])
     def social_links(self, request, pk=None):
         """Get, update or create social media links for a specific user"""
-        user = self.get_object()
-        links = SocialMediaLink.objects.filter(user=user)
-        serializer = SocialMediaLinkSerializer(links, many=True)
-        return Response(serializer.data)
+        return self.cached_profile(
+            profile_cache.SOCIAL_LINKS,
+            lambda user: list(SocialMediaLinkSerializer(
+                SocialMediaLink.objects.filter(user=user), many=True
+            ).data)
+        )
     
     @action(detail=False, methods=['get', 'patch'])
     def me(self, request):
         """Get or update the authenticated user's profile"""
-        serializer = self.get_serializer(request.user)
+        # request.user only carries the columns authentication caches, so load the row
         if request.method == 'PATCH':
-            serializer = self.get_serializer(request.user, data=request.data, partial=True)
+            serializer = self.get_serializer(self.get_me(), data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(serializer.data)
-        return Response(serializer.data)
+        return Response(profile_cache.get_or_build(
+            profile_cache.USER,
+            request.user.id,
+            lambda: dict(self.get_serializer(self.get_me()).data)
+        ))
 
     @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser])
     def upload_profile_picture(self, request):
-        """Upload a new profile picture for the authenticated user"""
+        """Queue a new profile picture for resizing; poll the returned status_url for the result"""
         if 'profile_picture' not in request.FILES:
             return Response(
                 {'error': 'No image provided'},
                 status=HTTP_BAD_REQUEST
             )
 
+        try:
+            job = profile_pictures.start_job(request.user, request.FILES['profile_picture'])
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=HTTP_BAD_REQUEST
+            )
+
+        serializer = ProfilePictureJobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=HTTP_ACCEPTED)
+
+    @action(detail=False, methods=['post'])
+    def presign_profile_picture(self, request):
+        """Get a presigned POST for uploading a profile picture straight to storage"""
+        content_type = request.data.get('content_type')
+        extension = PROFILE_PICTURE_CONTENT_TYPES.get(content_type)
+        if not extension:
+            return Response(
+                {'detail': f"content_type must be one of: {', '.join(PROFILE_PICTURE_CONTENT_TYPES)}."},
+                status=HTTP_BAD_REQUEST
+            )
+
+        key = f'profile_pictures/{request.user.id}/{uuid.uuid4().hex}.{extension}'
+        upload = presigned_upload(
+            key,
+            content_type,
+            settings.PROFILE_PICTURE_MAX_BYTES,
+            settings.PROFILE_PICTURE_UPLOAD_EXPIRY
+        )
+        return Response({
+            'url': upload['url'],
+            'fields': upload['fields'],
+            'key': key,
+            'max_bytes': settings.PROFILE_PICTURE_MAX_BYTES,
+            'expires_in': settings.PROFILE_PICTURE_UPLOAD_EXPIRY,
+        })
+
+    @action(detail=False, methods=['post'])
+    def confirm_profile_picture(self, request):
+        """Make a picture uploaded with presign_profile_picture the authenticated user's profile picture"""
         user = request.user
-        image = request.FILES['profile_picture']
+        key = request.data.get('key') or ''
+        prefix = f'profile_pictures/{user.id}/'
+        if not key.startswith(prefix) or '/' in key[len(prefix):]:
+            return Response(
+                {'detail': 'Invalid key.'},
+                status=HTTP_BAD_REQUEST
+            )
 
-        file_extension = image.name.split('.')[-1]
-        filename = f"profile_pictures/{user.username}.{file_extension}"
-        user.profile_picture_url.save(filename, image, save=True)
+        head = head_object(key)
+        if head is None:
+            return Response(
+                {'detail': 'Upload not found.'},
+                status=HTTP_BAD_REQUEST
+            )
+        if (head['ContentLength'] > settings.PROFILE_PICTURE_MAX_BYTES or
+                head.get('ContentType') not in PROFILE_PICTURE_CONTENT_TYPES):
+            return Response(
+                {'detail': 'Upload is too large or not a supported image type.'},
+                status=HTTP_BAD_REQUEST
+            )
 
-        serializer = self.get_serializer(user)
-        return Response(serializer.data)
+        user.profile_picture_url = key
+        user.save(update_fields=['profile_picture_url', 'updated_at'])
+        return Response(UserProfilePictureSerializer(user).data)
 
     @action(detail=True, methods=['get'])
     def friendship_count(self, request, pk=None):
         """Get the count of friendships for a specific user"""
         user = self.get_object()
-        sent = Friendship.objects.filter(requester=user, status=FRIENDSHIP_ACCEPTED).count()
-        received = Friendship.objects.filter(addressee=user, status=FRIENDSHIP_ACCEPTED).count()
-        return Response({'friendship_count': sent + received})
+        return Response({'friendship_count': user.friend_count})
 
     @action(detail=False, methods=['get'], url_path='pending_friend_requests')
     def pending_friend_requests(self, request):
         """Get all pending friend requests for the authenticated user"""
-        user = request.user
-        pending = Friendship.objects.filter(addressee=user, status=FRIENDSHIP_PENDING)
-        
-        data = []
-        for f in pending:
-            sender = f.requester
-            enrolled = UserCourse.objects.filter(user=sender).select_related('course')
-            tags = [uc.course.title for uc in enrolled]
-            sender_data = UserBasicSerializer(sender).data
-
-            data.append({
-                'id': f.friendship_id,
-                'name': sender.get_full_name(),
-                'bio': sender.bio or '',
-                'profile_picture_url': sender_data['profile_picture_url'],
-                'tags': tags
-            })
-
-        return Response(data)
+        pending = self.paginate_queryset(pending_requests_queryset(request.user))
+        return self.get_paginated_response(pending_request_payload(pending))
 
     @action(detail=False, methods=['post'], url_path='request_friendship')
     def request_friendship(self, request):
@@ -185,17 +555,29 @@ class UserViewSet(viewsets.ModelViewSet):
             addressee_id=addressee_id,
             status=FRIENDSHIP_PENDING
         )
+        events.publish_friendship(events.FRIENDSHIP_REQUESTED, friendship, requester)
         
         serializer = self.get_serializer(friendship)
         return Response(serializer.data, status=HTTP_CREATED)
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(RowMapperListMixin, viewsets.ModelViewSet):
     """ViewSet for Course model"""
     queryset = Course.objects.all()
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [RankedSearchFilter]
     search_fields = ['course_code', 'title', 'subject']
     permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """Return courses, with live enrollment counts if COURSE_ENROLLED_COUNTS is 'live'"""
+        return course_counts.with_enrolled_counts(Course.objects.all())
+
+    @property
+    def cursor_ordering(self):
+        """Page by id, or most enrolled first with ?ordering=popular"""
+        if self.request.query_params.get('ordering') == 'popular':
+            return course_counts.popular_ordering()
+        return 'pk'
     
     def get_serializer_class(self):
         """Return different serializer classes based on action"""
@@ -207,19 +589,25 @@ class CourseViewSet(viewsets.ModelViewSet):
     def enrolled_users(self, request, pk=None):
         """Get all users enrolled in a specific course"""
         course = self.get_object()
-        user_courses = UserCourse.objects.filter(course=course)
-        serializer = UserCourseSerializer(user_courses, many=True)
-        return Response(serializer.data)
+        return self.mapped_list_response(
+            UserCourse.objects.filter(course=course).select_related('course'),
+            UserCourseSerializer
+        )
 
 
-class UserCourseViewSet(viewsets.ModelViewSet):
+class UserCourseViewSet(ConditionalGetMixin, RowMapperListMixin, viewsets.ModelViewSet):
     queryset = UserCourse.objects.all()
     serializer_class = UserCourseSerializer
     permission_classes = [IsAuthenticated]
+    conditional_versions = {
+        'list': enrollments_version,
+        'user_courses': enrollments_version,
+        'upcoming_sessions': sessions_version,
+    }
 
     def get_queryset(self):
         """Return the queryset of UserCourse for the authenticated user"""
-        return UserCourse.objects.filter(user=self.request.user)
+        return UserCourse.objects.filter(user=self.request.user).select_related('course')
     
     @action(detail=False, methods=['post'])
     def enroll(self, request):
@@ -253,8 +641,7 @@ class UserCourseViewSet(viewsets.ModelViewSet):
     def user_courses(self, request):
         """Get all courses the authenticated user is enrolled in"""
         enrollments = UserCourse.objects.filter(user=request.user).select_related('course')
-        serializer = UserCourseSerializer(enrollments, many=True)
-        return Response(serializer.data)
+        return Response(serialize_rows(enrollments, UserCourseSerializer))
     
     @action(detail=False, methods=['post'])
     def unenroll(self, request):
@@ -279,42 +666,134 @@ class UserCourseViewSet(viewsets.ModelViewSet):
         
         return Response(status=HTTP_NO_CONTENT)
 
-    @action(detail=False, methods=['get'], url_path='upcoming_sessions')
-    def upcoming_sessions(self, request):
-        """Get upcoming sessions for the authenticated user's courses"""
+    @action(detail=False, methods=['post'])
+    def bulk_enroll(self, request):
+        """Enroll the authenticated user in several courses at once"""
+        try:
+            codes = parse_course_codes(request.data)
+        except ValueError as e:
+            return Response(
+                {'detail': str(e)},
+                status=HTTP_BAD_REQUEST
+            )
+
         user = request.user
-        today = now().date()
-        weekday_today = today.weekday()
+        with transaction.atomic():
+            course_ids = dict(
+                Course.objects.filter(course_code__in=codes).values_list('course_code', 'course_id')
+            )
+            enrolled = set(
+                UserCourse.objects
+                .filter(user=user, course_id__in=course_ids.values())
+                .values_list('course_id', flat=True)
+            )
+            new_ids = [course_ids[code] for code in codes if code in course_ids and course_ids[code] not in enrolled]
+            # bulk_create skips post_save, so the counts, cached course list, suggestion snapshot
+            # and change feed are updated here
+            created = insert_enrollments(user, new_ids)
+            inserted = [enrollment.course_id for enrollment in created]
+            course_counts.adjust_enrolled_counts(inserted, 1)
+            friend_suggestions.enrollments_created(created)
+            if inserted:
+                study_matching.enrollment_changed(user.id, inserted)
+                touch_user(user.id)
+                change_feed.record(change_feed.ENROLLMENT, [enrollment.pk for enrollment in created], [user.id])
+            invalidate_on_commit([user.id], profile_cache.COURSES)
 
-        enrollments = UserCourse.objects.filter(user=user).select_related('course')
+        results = []
+        for code in codes:
+            if code not in course_ids:
+                result = 'not_found'
+            elif course_ids[code] in inserted:
+                result = 'enrolled'
+            else:
+                result = 'already_enrolled'
+            results.append({'course_code': code, 'status': result})
+        return Response({'results': results})
 
-        sessions = []
-        for enrollment in enrollments:
-            course = enrollment.course
-            day_code = course.study_schedules_day
-            target_weekday = DAYS_MAP.get(day_code)
+    @action(detail=False, methods=['post'])
+    def bulk_unenroll(self, request):
+        """Unenroll the authenticated user from several courses at once"""
+        try:
+            codes = parse_course_codes(request.data)
+        except ValueError as e:
+            return Response(
+                {'detail': str(e)},
+                status=HTTP_BAD_REQUEST
+            )
 
-            if target_weekday is None:
-                continue
+        user = request.user
+        with transaction.atomic():
+            found = set(Course.objects.filter(course_code__in=codes).values_list('course_code', flat=True))
+            rows = list(
+                UserCourse.objects
+                .select_for_update(of=('self',))
+                .filter(user=user, course__course_code__in=codes)
+                .values_list('pk', 'course_id', 'course__course_code')
+            )
+            enrolled = {code for _, _, code in rows}
+            if rows:
+                # The post_delete receivers are muted, so the counts, cached course list, suggestion
+                # snapshot and change feed are updated here, once for all rows
+                pks = [pk for pk, _, _ in rows]
+                course_ids = [course_id for _, course_id, _ in rows]
+                with enrollment_signals_muted():
+                    UserCourse.objects.filter(pk__in=pks).delete()
+                course_counts.adjust_enrolled_counts(course_ids, -1)
+                friend_suggestions.enrollments_deleted([
+                    UserCourse(pk=pk, user_id=user.id, course_id=course_id) for pk, course_id, _ in rows
+                ])
+                study_matching.enrollment_changed(user.id, course_ids)
+                touch_user(user.id)
+                change_feed.record(change_feed.ENROLLMENT, pks, [user.id], deleted=True)
+                invalidate_on_commit([user.id], profile_cache.COURSES)
 
-            delta_days = (target_weekday - weekday_today + DAYS_IN_WEEK) % DAYS_IN_WEEK
-            class_date = today + timedelta(days=delta_days)
+        results = []
+        for code in codes:
+            if code in enrolled:
+                result = 'unenrolled'
+            elif code in found:
+                result = 'not_enrolled'
+            else:
+                result = 'not_found'
+            results.append({'course_code': code, 'status': result})
+        return Response({'results': results})
 
-            sessions.append({
-                'id': course.course_id,
-                'title': course.title,
-                'date': class_date.strftime('%b %d, %Y'),
-                'time': course.study_schedules_time.strftime('%I:%M %p'),
-            })
+    @action(detail=False, methods=['get'], url_path='upcoming_sessions')
+    def upcoming_sessions(self, request):
+        """Get upcoming sessions for the authenticated user's courses, soonest first"""
+        try:
+            start, end, limit = session_window(request.query_params)
+        except ValueError as e:
+            return Response(
+                {'detail': str(e)},
+                status=HTTP_BAD_REQUEST
+            )
 
-        sessions = sorted(sessions, key=lambda x: datetime.strptime(x['date'], '%b %d, %Y'))[:MAX_UPCOMING_SESSIONS]
-        
-        return Response(sessions)
+        courses = session_calendar.order_by_next_session(
+            Course.objects.filter(usercourse__user=request.user),
+            start
+        )
+        sessions = session_calendar.upcoming_sessions(courses, start, end, limit)
+        return Response(session_payload(sessions))
+
+    @action(detail=False, methods=['get'])
+    def study_matches(self, request):
+        """Get the students taking the same courses at the same times as the authenticated user, best first"""
+        matches = (
+            StudyMatch.objects
+            .filter(user=request.user)
+            .select_related('partner')
+            .order_by('-score', 'partner_id')[:study_matching.MATCHES_PER_USER]
+        )
+        return Response({'results': StudyMatchSerializer(matches, many=True).data})
 
 
-class FriendshipViewSet(viewsets.ModelViewSet):
+class FriendshipViewSet(RowMapperListMixin, viewsets.ModelViewSet):
     """ViewSet for Friendship model"""
-    queryset = Friendship.objects.all()
+    queryset = Friendship.objects.select_related('requester', 'addressee')
+    cursor_ordering = '-pk'
+    cursor_orderings = {'addable_users': ('-shared_courses', 'pk')}
     serializer_class = FriendshipSerializer
     permission_classes = [IsAuthenticated]
     
@@ -323,6 +802,21 @@ class FriendshipViewSet(viewsets.ModelViewSet):
         if self.action in ['update', 'partial_update']:
             return FriendshipUpdateSerializer
         return FriendshipSerializer
+
+    def perform_update(self, serializer):
+        """Keep the friend graph in sync when the status is edited directly"""
+        with transaction.atomic():
+            friendship = serializer.save()
+            if friendship.status == FRIENDSHIP_ACCEPTED:
+                link_friends(friendship)
+            else:
+                unlink_friends(friendship)
+
+    def perform_destroy(self, instance):
+        """Drop the friend graph edges along with the friendship"""
+        with transaction.atomic():
+            unlink_friends(instance)
+            instance.delete()
     
     @action(detail=False, methods=['post'])
     def request_friendship(self, request):
@@ -344,6 +838,7 @@ class FriendshipViewSet(viewsets.ModelViewSet):
             addressee_id=addressee_id,
             status=FRIENDSHIP_PENDING
         )
+        events.publish_friendship(events.FRIENDSHIP_REQUESTED, friendship, requester)
         
         serializer = self.get_serializer(friendship)
         return Response(serializer.data, status=HTTP_CREATED)
@@ -359,8 +854,11 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                 status=HTTP_FORBIDDEN
             )
         
-        friendship.status = FRIENDSHIP_ACCEPTED
-        friendship.save()
+        with transaction.atomic():
+            friendship.status = FRIENDSHIP_ACCEPTED
+            friendship.save()
+            link_friends(friendship)
+            events.publish_friendship(events.FRIENDSHIP_ACCEPTED, friendship, request.user)
         
         serializer = self.get_serializer(friendship)
         return Response(serializer.data)
@@ -376,39 +874,40 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                 status=HTTP_FORBIDDEN
             )
         
-        friendship.status = FRIENDSHIP_REJECTED
-        friendship.save()
+        with transaction.atomic():
+            friendship.status = FRIENDSHIP_REJECTED
+            friendship.save()
+            unlink_friends(friendship)
+            events.publish_friendship(events.FRIENDSHIP_REJECTED, friendship, request.user)
         
         serializer = self.get_serializer(friendship)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'], url_path='addable-users')
     def addable_users(self, request):
-        """Get a list of users that can be added as friends"""
-        user = request.user
-
-        related_ids = Friendship.objects.filter(
-            Q(requester=user) | Q(addressee=user)
-        ).exclude(status=FRIENDSHIP_REJECTED).values_list('requester', 'addressee')
-
-        excluded_ids = set()
-        for pair in related_ids:
-            excluded_ids.update(pair)
-
-        candidates = User.objects.exclude(id__in=excluded_ids).exclude(id=user.id)
-
-        data = [
-            {
-                'id': u.id,
-                'name': u.get_full_name(),
-                'bio': u.bio,
-                'profile_picture_url': UserBasicSerializer(u).data['profile_picture_url'],
-                'tags': [uc.course.title for uc in u.usercourse_set.all()],
-            }
-            for u in candidates
-        ]
+        """Get a cursor-paginated list of users that can be added as friends, most shared courses first"""
+        candidates = self.paginate_queryset(addable_users_queryset(request.user))
+        return self.get_paginated_response([serialize_candidate(u) for u in candidates])
+    
+    @action(detail=False, methods=['get'])
+    def suggestions(self, request):
+        """Get suggested friends, ranked by mutual friends and shared courses"""
+        try:
+            limit = int(request.query_params.get('limit', friend_suggestions.DEFAULT_LIMIT))
+        except ValueError:
+            return Response(
+                {'detail': 'limit must be an integer.'},
+                status=HTTP_BAD_REQUEST
+            )
+        limit = max(1, min(limit, friend_suggestions.MAX_LIMIT))
 
-        return Response(data)
+        users = suggested_users(friend_suggestions.suggest_friends(request.user, limit))
+        return Response({
+            'results': [
+                {**serialize_candidate(u), 'mutual_friends': u.mutual_friends}
+                for u in users
+            ],
+        })
     
     @action(detail=False, methods=['post'], url_path='unfriend')
     def unfriend(self, request):
@@ -433,7 +932,10 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                     status=HTTP_BAD_REQUEST
                 )
 
-            friendship.delete()
+            with transaction.atomic():
+                unlink_friends(friendship)
+                events.publish_friendship(events.FRIENDSHIP_REMOVED, friendship, request.user)
+                friendship.delete()
             return Response(
                 {'detail': 'Successfully unfriended'},
                 status=HTTP_NO_CONTENT
@@ -446,10 +948,11 @@ class FriendshipViewSet(viewsets.ModelViewSet):
             )
 
 
-class SocialMediaLinkViewSet(viewsets.ModelViewSet):
+class SocialMediaLinkViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for SocialMediaLink model"""
     serializer_class = SocialMediaLinkSerializer
     permission_classes = [IsAuthenticated]
+    conditional_versions = {'list': social_links_version}
     
     def get_queryset(self):
         return SocialMediaLink.objects.filter(user=self.request.user)
@@ -461,4 +964,113 @@ class SocialMediaLinkViewSet(viewsets.ModelViewSet):
             serializer.save(user=self.request.user, platform=platform)
         else:
             serializer.save(user=self.request.user)
-            
\ No newline at end of file
+
+    @action(detail=False, methods=['put'])
+    def sync(self, request):
+        """Replace the authenticated user's social links with the given set"""
+        links = request.data.get('links')
+        if not isinstance(links, list):
+            return Response(
+                {'detail': 'links must be a list of {platform, name} objects.'},
+                status=HTTP_BAD_REQUEST
+            )
+        links = [
+            {**link, 'platform': str(link.get('platform', '')).capitalize()} if isinstance(link, dict) else link
+            for link in links
+        ]
+        serializer = SocialMediaLinkSerializer(data=links, many=True)
+        serializer.is_valid(raise_exception=True)
+        platforms = [link['platform'] for link in serializer.validated_data]
+        if len(set(platforms)) != len(platforms):
+            return Response(
+                {'detail': 'Each platform can only be listed once.'},
+                status=HTTP_BAD_REQUEST
+            )
+
+        user = request.user
+        with transaction.atomic():
+            SocialMediaLink.objects.filter(user=user).exclude(platform__in=platforms).delete()
+            SocialMediaLink.objects.bulk_create(
+                [SocialMediaLink(user=user, **link) for link in serializer.validated_data],
+                update_conflicts=True,
+                unique_fields=['user', 'platform'],
+                update_fields=['name', 'updated_at']
+            )
+            # bulk_create skips post_save, so the cached payloads and change feed are updated here
+            invalidate_on_commit([user.id], profile_cache.SOCIAL_LINKS, profile_cache.USER)
+            touch_user(user.id)
+            links = list(SocialMediaLink.objects.filter(user=user).order_by('platform'))
+            change_feed.record(change_feed.SOCIAL_LINK, [link.pk for link in links], [user.id])
+
+        return Response(SocialMediaLinkSerializer(links, many=True).data)
+
+
+class ProfilePictureJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status of the authenticated user's profile picture uploads"""
+    serializer_class = ProfilePictureJobSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = '-created_at'
+
+    def get_queryset(self):
+        return ProfilePictureJob.objects.filter(user=self.request.user)
+
+
+def parse_sync_params(query_params):
+    """
+    Read the sync parameters.
+    Returns:
+        Tuple (since, limit); since is None for a full sync
+    Raises:
+        ValueError: With a client-facing message for invalid parameters
+    """
+    try:
+        since = query_params.get('since')
+        since = int(since) if since not in (None, '') else None
+        limit = int(query_params.get('limit', change_feed.DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('since and limit must be integers.')
+    if since is not None and since < 0:
+        raise ValueError('since must not be negative.')
+    return since, max(1, min(limit, change_feed.MAX_LIMIT))
+
+
+class SyncView(APIView):
+    """Change feed of the authenticated user's profile, friendships, enrollments and social links"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Get upserts and tombstones since the `next` of the previous sync, or everything without `since`"""
+        try:
+            since, limit = parse_sync_params(request.query_params)
+        except ValueError as e:
+            return Response(
+                {'detail': str(e)},
+                status=HTTP_BAD_REQUEST
+            )
+
+        if since is None:
+            return Response(change_feed.full_sync(request.user))
+        return Response(change_feed.changes_since(request.user, since, limit))
+
+
+class ProfilingView(APIView):
+    """Per-action timing aggregate collected by RequestProfilingMiddleware"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Get p50/p95/p99 timings and repeated SQL per action"""
+        return Response(profiling.aggregate.summary())
+
+    def delete(self, request):
+        """Reset the aggregate"""
+        profiling.aggregate.reset()
+        return Response(status=HTTP_NO_CONTENT)
+
+
+class ProfileCacheStatsView(APIView):
+    """Hit/miss counters of the profile cache in this process"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Get the profile cache hit/miss counters"""
+        return Response(profile_cache.stats())
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up; serves /api/events/ and hands the rest to Django
+from api.event_stream import EventStreamApp  # noqa: E402
+
+application = EventStreamApp(django_application)
@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -62,6 +63,14 @@ MIDDLEWARE = [
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Per-request SQL and timing instrumentation (Server-Timing headers and /api/profiling/)
+API_PROFILING = os.getenv('API_PROFILING', 'False') == 'True'
+API_PROFILING_SAMPLE_SIZE = int(os.getenv('API_PROFILING_SAMPLE_SIZE', '1000'))
+
+# Serve the read-heavy GET endpoints with the async views in api/async_views.py.
+# Meant for ASGI deployments; under WSGI each async view gets its own event loop.
+API_ASYNC_VIEWS = os.getenv('API_ASYNC_VIEWS', 'False') == 'True'
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -106,11 +115,72 @@ DATABASES = {
     )
 }
 
+# Cache
+# Redis when REDIS_URL is set, otherwise a per-process in-memory cache (also used by tests)
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Search backend for users and courses: 'auto' (Postgres full-text search on Postgres once
+# setup_search_indexes has run, an in-process inverted index elsewhere), 'postgres',
+# 'inverted_index' or 'icontains'
+API_SEARCH_BACKEND = os.getenv('API_SEARCH_BACKEND', 'auto')
+
+# Seconds a cached profile payload (user, courses, social links) may live
+PROFILE_CACHE_TIMEOUT = int(os.getenv('PROFILE_CACHE_TIMEOUT', '300'))
+
+# Where course enrollment counts come from: 'stored' (Course.enrolled_count) or 'live'
+# (counted per query, e.g. until reconcile_enrollment_counts has run after a deploy)
+COURSE_ENROLLED_COUNTS = os.getenv('COURSE_ENROLLED_COUNTS', 'stored')
+
+# Seconds the columns request.user is built from stay cached after a token is checked
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', '60'))
+
+# Seconds between checks of the friend suggestion snapshot against the database;
+# changes made by this process are applied to it immediately
+FRIEND_SNAPSHOT_CHECK_SECONDS = float(os.getenv('FRIEND_SNAPSHOT_CHECK_SECONDS', '1'))
+
+# Days of change feed history kept by compact_changes; older sync cursors get a full sync
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv('CHANGE_FEED_RETENTION_DAYS', '30'))
+# Sync cursors stay behind change records younger than this, which a longer-running
+# transaction could still precede; keep it above the longest write transaction
+CHANGE_FEED_GRACE_SECONDS = float(os.getenv('CHANGE_FEED_GRACE_SECONDS', '10'))
+
+# Friendship event streams (GET /api/events/, ASGI only). The in-process broker only reaches
+# streams of the same worker; name a shared broker class for several workers
+API_EVENT_BROKER = os.getenv('API_EVENT_BROKER', 'api.utils.events.InProcessBroker')
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', '15'))
+# Events a stream may fall behind before it is closed with an overflow event
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', '100'))
+# Open streams per worker; more are refused with 503
+EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', '10000'))
+
+# Threads resizing and storing uploaded profile pictures; 0 processes uploads inline at commit
+PROFILE_PICTURE_WORKERS = int(os.getenv('PROFILE_PICTURE_WORKERS', '4'))
+# Limits of direct-to-S3 profile picture uploads
+PROFILE_PICTURE_MAX_BYTES = int(os.getenv('PROFILE_PICTURE_MAX_BYTES', str(5 * 1024 * 1024)))
+PROFILE_PICTURE_UPLOAD_EXPIRY = int(os.getenv('PROFILE_PICTURE_UPLOAD_EXPIRY', '300'))
+
+# Threads refreshing study matches after enrollment changes; 0 refreshes inline at commit
+STUDY_MATCH_WORKERS = int(os.getenv('STUDY_MATCH_WORKERS', '1'))
+
 # AWS Configuration
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID', 'your_aws_access_key_id')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY', 'your_aws_secret_access_key')
 AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME', 'your_bucket_name')
 AWS_S3_REGION_NAME = os.getenv('AWS_S3_REGION_NAME', 'your_region_name')
+# Point at a local S3 stand-in (MinIO, moto server) in development; unset for AWS
+AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL') or None
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
 
 AWS_QUERYSTRING_AUTH = False
@@ -121,6 +191,9 @@ AWS_S3_FILE_OVERWRITE = False
 AWS_LOCATION = ''
 MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/'
 
+# Stored file keys whose public URL is memoized per process (about 300 bytes each)
+S3_URL_CACHE_SIZE = int(os.getenv('S3_URL_CACHE_SIZE', '100000'))
+
 STORAGES = {
     'default': {
         'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage',
@@ -175,10 +248,22 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'api.User'
 
+# Encode JSON responses with orjson (same bytes as DRF's JSONRenderer, faster; NaN and
+# infinite floats become null instead of an error, see api/renderers.py)
+API_ORJSON = os.getenv('API_ORJSON', 'False') == 'True'
+# Serialize large lists from values() rows with row mappers (api/row_mappers.py)
+API_ROW_MAPPERS = os.getenv('API_ROW_MAPPERS', 'True') == 'True'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer' if API_ORJSON else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetCursorPagination',
+    'PAGE_SIZE': 50,
 }
 
 SIMPLE_JWT = {
@@ -20,7 +20,9 @@ const HomeScreen = () => {
     if (showLoading) setLoading(true)
     try {
       await new Promise((resolve) => setTimeout(resolve, 500))
-      const res = await api.get("enrollments/upcoming_sessions/")
+      const res = await api.get("enrollments/upcoming_sessions/", {
+        params: { tz: Intl.DateTimeFormat().resolvedOptions().timeZone },
+      })
       setSessions(res.data)
       setError(null)
     } catch (err) {
@@ -26,20 +26,24 @@ const AddFriendsPage = () => {
   const [loading, setLoading] = useState(true)
   const [refreshing, setRefreshing] = useState(false)
   const [error, setError] = useState("")
+  const [nextUrl, setNextUrl] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const scrollY = useRef(new Animated.Value(0)).current
 
+  const toAddableUser = (user: any): AddableUser => ({
+    id: user.id || "",
+    name: user.name || "Unknown User",
+    bio: user.bio || "No major info",
+    avatarUrl: user.profile_picture_url || "https://placehold.co/100x100/EEF6FF/3A63ED?text=👤",
+    tags: Array.isArray(user.tags) ? user.tags : [],
+  })
+
   const fetchAddableUsers = async (showLoading = true) => {
     if (showLoading) setLoading(true)
     try {
       const response = await api.get("friendships/addable-users/")
-      const safeUsers = response.data.map((user: any) => ({
-        id: user.id || "",
-        name: user.name || "Unknown User",
-        bio: user.bio || "No major info",
-        avatarUrl: user.profile_picture_url || "https://placehold.co/100x100/EEF6FF/3A63ED?text=👤",
-        tags: Array.isArray(user.tags) ? user.tags : [],
-      }))
-      setUsers(safeUsers)
+      setUsers(response.data.results.map(toAddableUser))
+      setNextUrl(response.data.next)
       setError("")
     } catch (err) {
       console.error("Failed to fetch addable users", err)
@@ -50,6 +54,27 @@ const AddFriendsPage = () => {
     }
   }
 
+  const fetchMoreUsers = async () => {
+    if (!nextUrl || loadingMore) return
+    setLoadingMore(true)
+    try {
+      const response = await api.get(nextUrl)
+      setUsers((prev) => [...prev, ...response.data.results.map(toAddableUser)])
+      setNextUrl(response.data.next)
+    } catch (err) {
+      console.error("Failed to fetch more addable users", err)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
+  const handleScrollEnd = ({ nativeEvent }: any) => {
+    const { layoutMeasurement, contentOffset, contentSize } = nativeEvent
+    if (layoutMeasurement.height + contentOffset.y >= contentSize.height - 200) {
+      fetchMoreUsers()
+    }
+  }
+
   const onRefresh = React.useCallback(() => {
     setRefreshing(true)
     fetchAddableUsers(false)
@@ -123,6 +148,7 @@ const AddFriendsPage = () => {
             onScroll={Animated.event([{ nativeEvent: { contentOffset: { y: scrollY } } }], {
               useNativeDriver: false,
             })}
+            onMomentumScrollEnd={handleScrollEnd}
             scrollEventThrottle={16}
           >
             {loading && !refreshing ? (
@@ -66,19 +66,18 @@ export default function ProfileEditScreen() {
   const fetchUserData = async () => {
     try {
       setIsLoading(true)
-      const userResponse = await api.get("users/me/")
-      const user = userResponse.data
-      const enrollmentsResponse = await api.get("enrollments/")
-      const socialResponse = await api.get("social-links/")
-      const friendshipResponse = await api.get(`users/${user.id}/friendship_count/`)
-      const friendshipCount = friendshipResponse.data.friendship_count
+      const bundleResponse = await api.get("users/me/profile_bundle/", {
+        params: { fields: "user,courses,social_links,friendship_count" },
+      })
+      const user = bundleResponse.data.user
+      const friendshipCount = bundleResponse.data.friendship_count
 
-      const courses = enrollmentsResponse.data.map((enrollment: any) => ({
+      const courses = bundleResponse.data.courses.map((enrollment: any) => ({
         code: enrollment.course?.course_code || "",
         title: enrollment.course?.title || "",
       }))
 
-      const socialLinks = Array.isArray(socialResponse.data) ? socialResponse.data : []
+      const socialLinks = Array.isArray(bundleResponse.data.social_links) ? bundleResponse.data.social_links : []
       const instagramLink = socialLinks.find((link) => link?.platform?.toLowerCase() === "instagram")
       const facebookLink = socialLinks.find((link) => link?.platform?.toLowerCase() === "facebook")
 
@@ -130,37 +129,14 @@ export default function ProfileEditScreen() {
 
   const updateSocialLinks = async () => {
     try {
-      const currentLinks = await api.get("social-links/")
-      const instagramLink = currentLinks.data.find((link: any) => link.platform.toLowerCase() === "instagram")
-      if (instagramLink) {
-        if (editData.social.instagram) {
-          await api.patch(`social-links/${instagramLink.link_id}/`, {
-            name: `@${editData.social.instagram}`,
-          })
-        } else {
-          await api.delete(`social-links/${instagramLink.link_id}/`)
-        }
-      } else if (editData.social.instagram) {
-        await api.post("social-links/", {
-          platform: "Instagram",
-          name: `@${editData.social.instagram}`,
-        })
+      const links = []
+      if (editData.social.instagram) {
+        links.push({ platform: "Instagram", name: `@${editData.social.instagram}` })
       }
-      const facebookLink = currentLinks.data.find((link: any) => link.platform.toLowerCase() === "facebook")
-      if (facebookLink) {
-        if (editData.social.facebook) {
-          await api.patch(`social-links/${facebookLink.link_id}/`, {
-            name: editData.social.facebook,
-          })
-        } else {
-          await api.delete(`social-links/${facebookLink.link_id}/`)
-        }
-      } else if (editData.social.facebook) {
-        await api.post("social-links/", {
-          platform: "Facebook",
-          name: editData.social.facebook,
-        })
+      if (editData.social.facebook) {
+        links.push({ platform: "Facebook", name: editData.social.facebook })
       }
+      await api.put("social-links/sync/", { links })
     } catch (error) {
       console.error("Error updating social links:", error)
       throw error
@@ -11,21 +11,25 @@ const FriendRequestsPage = () => {
   const [refreshing, setRefreshing] = useState(false)
   const [error, setError] = useState<string | null>(null)
 
+  const [nextUrl, setNextUrl] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
+
+  const formatRequests = (results: any[]): FriendRequest[] =>
+    results.map((item: any) => ({
+      id: item.id,
+      name: item.name,
+      bio: item.bio || "",
+      avatarUrl: item.profile_picture_url || "https://placehold.co/100x100/EEF6FF/3A63ED?text=👤",
+      tags: item.tags || [],
+    }))
+
+  // Only the first page; the rest load as the list is scrolled
   const fetchFriendRequests = async (showLoading = true) => {
     try {
       if (showLoading) setLoading(true)
-      const res = await api.get("users/pending_friend_requests/")
-      const data = res.data
-
-      const formatted = data.map((item: any) => ({
-        id: item.id,
-        name: item.name,
-        bio: item.bio || "",
-        avatarUrl: item.profile_picture_url || "https://placehold.co/100x100/EEF6FF/3A63ED?text=👤",
-        tags: item.tags || [],
-      }))
-
-      setFriendRequests(formatted)
+      const res: any = await api.get("users/pending_friend_requests/")
+      setFriendRequests(formatRequests(res.data.results))
+      setNextUrl(res.data.next)
       setError(null)
     } catch (err) {
       console.error("Failed to fetch friend requests", err)
@@ -36,6 +40,22 @@ const FriendRequestsPage = () => {
     }
   }
 
+  const loadMore = async () => {
+    if (!nextUrl || loadingMore) return
+    try {
+      setLoadingMore(true)
+      const res: any = await api.get(nextUrl)
+      const page = formatRequests(res.data.results)
+      setFriendRequests((prev) => [...prev, ...page.filter((req) => !prev.some((p) => p.id === req.id))])
+      setNextUrl(res.data.next)
+    } catch (err) {
+      console.error("Failed to fetch more friend requests", err)
+      setError("Failed to load friend requests")
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const onRefresh = useCallback(() => {
     setRefreshing(true)
     fetchFriendRequests(false)
@@ -73,6 +93,8 @@ const FriendRequestsPage = () => {
       loading={loading}
       refreshing={refreshing}
       onRefresh={onRefresh}
+      onEndReached={loadMore}
+      loadingMore={loadingMore}
       error={error}
     />
   )
@@ -49,14 +49,12 @@ export default function Profile() {
       setError(null)
       await new Promise((resolve) => setTimeout(resolve, 1000))
 
-      const userRes = await api.get(`/users/${userId}/`)
-      const userData = userRes.data
-
-      const coursesRes = await api.get(`/users/${userId}/courses/`)
-      const tags = coursesRes.data.map((c: any) => c.course.subject)
-
-      const socialRes = await api.get(`/users/${userId}/social_links/`)
-      const socialLinks = socialRes.data
+      const bundleRes = await api.get(`/users/${userId}/profile_bundle/`, {
+        params: { fields: "user,courses,social_links" },
+      })
+      const userData = bundleRes.data.user
+      const tags = bundleRes.data.courses.map((c: any) => c.course.subject)
+      const socialLinks = bundleRes.data.social_links
 
       const instagramLink = socialLinks.find((link: any) => link.platform.toLowerCase() === "instagram")
       const facebookLink = socialLinks.find((link: any) => link.platform.toLowerCase() === "facebook")
@@ -1,7 +1,8 @@
 "use client"
 
 import type React from "react"
-import { ScrollView, StyleSheet, RefreshControl } from "react-native"
+import { ActivityIndicator, ScrollView, StyleSheet, RefreshControl } from "react-native"
+import type { NativeScrollEvent, NativeSyntheticEvent } from "react-native"
 import FriendRequestBox from "./FriendRequestBox"
 import EmptyRequestsState from "./EmptyRequestsState"
 import type { FriendRequestListProps } from "./types"
@@ -13,12 +14,25 @@ const FriendRequestList: React.FC<FriendRequestListProps> = ({
   onDecline,
   refreshing = false,
   onRefresh,
+  onEndReached,
+  loadingMore = false,
 }) => {
   const router = useRouter()
+
+  // Ask for the next page when the bottom is within about a screen away
+  const handleScroll = ({ nativeEvent }: NativeSyntheticEvent<NativeScrollEvent>) => {
+    const { layoutMeasurement, contentOffset, contentSize } = nativeEvent
+    if (layoutMeasurement.height + contentOffset.y >= contentSize.height - layoutMeasurement.height) {
+      onEndReached?.()
+    }
+  }
+
   return (
     <ScrollView
       style={styles.scrollContainer}
       contentContainerStyle={[styles.requestsContainer, requests.length === 0 && styles.emptyContainer]}
+      onScroll={handleScroll}
+      scrollEventThrottle={200}
       refreshControl={
         <RefreshControl refreshing={refreshing} onRefresh={onRefresh} tintColor="#3A63ED" colors={["#3A63ED"]} />
       }
@@ -44,6 +58,7 @@ const FriendRequestList: React.FC<FriendRequestListProps> = ({
           }}
         />
       )}
+      {loadingMore && <ActivityIndicator style={styles.loadingMore} color="#3A63ED" />}
     </ScrollView>
   )
 }
@@ -60,6 +75,9 @@ const styles = StyleSheet.create({
     flex: 1,
     justifyContent: "center",
   },
+  loadingMore: {
+    marginVertical: 16,
+  },
 })
 
 export default FriendRequestList
\ No newline at end of file
@@ -17,6 +17,8 @@ const FriendRequestsScreen: React.FC<FriendRequestsScreenProps> = ({
   loading,
   refreshing,
   onRefresh,
+  onEndReached,
+  loadingMore,
 }) => {
   const scrollY = useRef(new Animated.Value(0)).current
 
@@ -40,6 +42,8 @@ const FriendRequestsScreen: React.FC<FriendRequestsScreenProps> = ({
               onDecline={onDecline}
               refreshing={refreshing}
               onRefresh={onRefresh}
+              onEndReached={onEndReached}
+              loadingMore={loadingMore}
             />
           )}
         </ThemedView>
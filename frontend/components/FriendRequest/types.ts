@@ -19,6 +19,8 @@ export interface FriendRequestListProps {
   onDecline: (id: string) => void
   refreshing?: boolean
   onRefresh?: () => void
+  onEndReached?: () => void
+  loadingMore?: boolean
 }
 
 export interface FriendRequestsScreenProps {
@@ -28,5 +30,7 @@ export interface FriendRequestsScreenProps {
   loading?: boolean
   refreshing?: boolean
   onRefresh?: () => void
+  onEndReached?: () => void
+  loadingMore?: boolean
   error?: string | null
 }
\ No newline at end of file
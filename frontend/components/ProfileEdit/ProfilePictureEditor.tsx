@@ -15,6 +15,9 @@ import * as ImagePicker from "expo-image-picker"
 import { MaterialIcons } from "@expo/vector-icons"
 import api from "@/core/api"
 
+const STATUS_POLL_INTERVAL_MS = 1000
+const MAX_STATUS_POLLS = 30
+
 interface ProfilePictureEditorProps {
   currentImageUrl: string | null
   onImageUpdated: (url: string) => void
@@ -95,12 +98,21 @@ const ProfilePictureEditor: React.FC<ProfilePictureEditorProps> = ({
         },
       })
 
-      // Check if the response has the profile picture URL
-      if (response.data && response.data.profile_picture_url) {
-        onImageUpdated(response.data.profile_picture_url)
+      // The server resizes the picture in the background; poll until it is done
+      let job = response.data
+      for (let attempt = 0; job.status === "pending" || job.status === "processing"; attempt++) {
+        if (attempt >= MAX_STATUS_POLLS) {
+          throw new Error("Timed out waiting for the profile picture")
+        }
+        await new Promise((resolve) => setTimeout(resolve, STATUS_POLL_INTERVAL_MS))
+        job = (await api.get(`profile-picture-jobs/${job.job_id}/`)).data
+      }
+
+      if (job.status === "done" && job.profile_picture_url) {
+        onImageUpdated(job.profile_picture_url)
         Alert.alert("Success", "Profile picture updated successfully!")
       } else {
-        throw new Error("Invalid response from server")
+        throw new Error(job.error || "Invalid response from server")
       }
     } catch (error) {
       console.error("Error uploading image:", error)